@@ -1,237 +1,1125 @@
-import os
-from flask import Flask, render_template, request, redirect, url_for, session
-from processing import load_data, calculate_percentiles, calculate_synthetic_xwoba, TARGET_METRICS
-import pandas as pd
-
-app = Flask(__name__)
-app.secret_key = 'recruit_savant_secret_key'
-app.config['UPLOAD_FOLDER'] = 'uploads'
-
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-@app.route('/')
-def index():
-    return render_template('index.html')
-
-@app.route('/upload', methods=['POST'])
-def upload_file():
-    if 'file' not in request.files:
-        return redirect(request.url)
-    file = request.files['file']
-    if file.filename == '':
-        return redirect(request.url)
-    
-    if file:
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(filepath)
-        session['filename'] = file.filename
-        
-        # Load just to get columns
-        # We re-open it to ensure it's readable
-        with open(filepath, 'rb') as f:
-            # We need to wrap it in a way load_data expects if it expects a FileStorage, 
-            # but load_data currently expects FileStorage. 
-            # Let's refactor load_data slightly or just use pd.read_... directly here for columns.
-            # Actually, let's make load_data accept a path or file-like object.
-            # For now, I'll just read it here quickly.
-            if filepath.endswith('.csv'):
-                df = pd.read_csv(filepath, nrows=0) # Just read header
-            else:
-                df = pd.read_excel(filepath, nrows=0)
-                
-        columns = df.columns.tolist()
-        
-        # Auto-Mapping Logic
-        suggested_mapping = {}
-        
-        # Helper to normalize strings for comparison
-        def normalize(s):
-            return str(s).lower().replace(' ', '').replace('_', '').replace('.', '').replace('%', '')
-
-        # 1. Map Player Name
-        # Priority list for Player Name
-        player_name_candidates = ['playerfullname', 'battername', 'playername', 'batter', 'player']
-        
-        for candidate in player_name_candidates:
-            found = False
-            for col in columns:
-                norm_col = normalize(col)
-                if candidate == norm_col:
-                    suggested_mapping['Player Name'] = col
-                    found = True
-                    break
-            if found:
-                break
-        
-        # Fallback if no exact match found, look for partials
-        if 'Player Name' not in suggested_mapping:
-            for col in columns:
-                norm_col = normalize(col)
-                if 'player' in norm_col or 'name' in norm_col or 'batter' in norm_col:
-                    suggested_mapping['Player Name'] = col
-                    break
-        
-        # 2. Map Target Metrics
-        for target in TARGET_METRICS:
-            norm_target = normalize(target)
-            best_match = None
-            
-            # Special handling for Max EV
-            if target == 'Max EV':
-                max_ev_candidates = ['maxexitvelocity', 'maxexitvel', 'maxev', 'exitvelocity', 'exitvel', 'ev']
-                for candidate in max_ev_candidates:
-                    for col in columns:
-                        norm_col = normalize(col)
-                        if candidate == norm_col:
-                            best_match = col
-                            break
-                    if best_match:
-                        break
-            
-            if not best_match:
-                for col in columns:
-                    norm_col = normalize(col)
-                    # Exact normalized match
-                    if norm_target == norm_col:
-                        best_match = col
-                        break
-                    # Partial match
-                    if norm_target in norm_col or norm_col in norm_target:
-                        if target == 'K%' and 'strikeout' in norm_col:
-                            best_match = col
-                            break
-                        if target == 'BB%' and 'walk' in norm_col:
-                            best_match = col
-                            break
-                        best_match = col
-            
-            if best_match:
-                suggested_mapping[target] = best_match
-
-        return render_template('mapping.html', columns=columns, targets=TARGET_METRICS, suggested_mapping=suggested_mapping)
-
-@app.route('/calculate', methods=['POST'])
-def calculate():
-    filename = session.get('filename')
-    if not filename:
-        return redirect(url_for('index'))
-    
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    
-    # Re-load full data
-    if filepath.endswith('.csv'):
-        df = pd.read_csv(filepath)
-    else:
-        df = pd.read_excel(filepath)
-        
-    # Get mapping from form
-    mapping = {}
-    # We expect inputs like name="map_Max EV"
-    for metric in TARGET_METRICS:
-        val = request.form.get(f'map_{metric}')
-        if val and val != 'None':
-            mapping[metric] = val
-            
-    # Also get Player Name mapping
-    player_col = request.form.get('map_Player Name')
-    if player_col:
-        mapping['Player Name'] = player_col
-        
-    # Save mapping to session for advanced analysis
-    session['mapping'] = mapping
-    
-    results = calculate_percentiles(df, mapping)
-    
-    # Convert to list of dicts for template
-    # Replace NaN with "N/A" for display
-    results_data = results.fillna('N/A').to_dict(orient='records')
-    
-    return render_template('results.html', players=results_data, metrics=TARGET_METRICS)
-
-@app.route('/advanced_analysis', methods=['GET', 'POST'])
-def advanced_analysis():
-    filename = session.get('filename')
-    mapping = session.get('mapping')
-    
-    if not filename or not mapping:
-        return redirect(url_for('index'))
-        
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    
-    if filepath.endswith('.csv'):
-        df = pd.read_csv(filepath)
-    else:
-        df = pd.read_excel(filepath)
-        
-    # Default weights
-    default_weights = {
-        'w_bb': 0.7,
-        'w_k': 0.7,
-        'w_power': 0.25,
-        'w_contact': 0.2,
-        'base_woba': 0.280
-    }
-    
-    # Get weights from session or defaults
-    weights = session.get('weights', default_weights)
-    
-    # If POST, update weights from form
-    if request.method == 'POST':
-        try:
-            weights['w_bb'] = float(request.form.get('w_bb', weights['w_bb']))
-            weights['w_k'] = float(request.form.get('w_k', weights['w_k']))
-            weights['w_power'] = float(request.form.get('w_power', weights['w_power']))
-            weights['w_contact'] = float(request.form.get('w_contact', weights['w_contact']))
-            weights['base_woba'] = float(request.form.get('base_woba', weights['base_woba']))
-            session['weights'] = weights
-        except ValueError:
-            # Handle invalid input gracefully (keep old weights)
-            pass
-        
-    # Calculate Synthetic xwOBA
-    syn_xwoba = calculate_synthetic_xwoba(df, mapping, weights)
-    
-    # Prepare data for display
-    # Create a result DF with Player Name and Syn xwOBA
-    player_col = mapping.get('Player Name')
-    if player_col and player_col in df.columns:
-        players = df[player_col]
-    else:
-        players = df.index.astype(str)
-        
-    results_df = pd.DataFrame({
-        'Player Name': players,
-        'Synthetic xwOBA': syn_xwoba.round(3)
-    })
-    
-    # Also add the components for transparency AND their percentiles for coloring
-    def get_col(metric):
-        return mapping.get(metric)
-        
-    # We need to calculate percentiles for these specific metrics to do the color coding
-    # Re-use calculate_percentiles logic or call it?
-    # Calling calculate_percentiles gives us everything. Let's do that and merge.
-    
-    full_percentiles = calculate_percentiles(df, mapping)
-    
-    for metric in ['BB%', 'K%', 'Max EV', 'Contact%']:
-        col = get_col(metric)
-        if col and col in df.columns:
-            # Raw Value
-            results_df[metric] = df[col]
-            # Percentile Value (for coloring)
-            if metric in full_percentiles.columns:
-                results_df[f'{metric}_pct'] = full_percentiles[metric]
-            else:
-                results_df[f'{metric}_pct'] = 0 # Default if missing
-        else:
-            results_df[metric] = 'N/A'
-            results_df[f'{metric}_pct'] = 'N/A'
-            
-    results_data = results_df.to_dict(orient='records')
-    
-    return render_template('advanced_results.html', players=results_data, weights=weights)
-
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080)
-
+import os
+import threading
+import time
+from functools import cache
+from importlib.util import find_spec
+from flask import (Flask, render_template, request, redirect, url_for, session, jsonify, make_response, g,
+                   before_render_template, template_rendered)
+from constants import TARGET_METRICS, SYNTHETIC_COMPONENTS, DEFAULT_WEIGHTS, DEFAULT_PER_PAGE
+from jobs import JobManager, QueueFull, DONE
+from result_cache import ResultCache
+from http_cache import etag_for, files_version, file_version, compress_response, IMMUTABLE_MAX_AGE
+from metrics import REGISTRY, add_timing, render_value, server_timing, start_recording, stop_recording, timed
+from profiling import PROFILE_MODES, save_profile, start_profiler
+from upload_store import store_upload, sweep_uploads, touch_upload
+
+# pandas, NumPy and openpyxl (processing, datastore, tables, tasks,
+# reference_store) are imported inside the functions that use them, so a cold
+# start can serve the index page and health checks without loading them.
+# warm_up() loads them in the background right after startup.
+
+app = Flask(__name__)
+app.secret_key = 'recruit_savant_secret_key'
+app.config['UPLOAD_FOLDER'] = 'uploads'
+# Parsed columnar copies of uploads, keyed by content hash
+app.config['CACHE_FOLDER'] = os.path.join('uploads', '.cache')
+# CSVs above this size are not parsed whole at upload; only the mapped
+# columns are streamed in, in chunks, when they are first needed
+app.config['STREAMING_THRESHOLD_BYTES'] = 32 * 1024 * 1024
+# Curated reference populations uploads can be ranked against
+app.config['REFERENCE_DB'] = 'reference.sqlite'
+# Parsing and ranking run as background jobs in a process pool. JOB_WORKERS=0
+# runs them inline in the request instead. At most JOB_QUEUE_LIMIT jobs may be
+# queued or running at once.
+app.config['JOB_FOLDER'] = os.path.join('uploads', '.jobs')
+app.config['JOB_WORKERS'] = 1
+app.config['JOB_QUEUE_LIMIT'] = 8
+# Memory budget of each process's cache of computed tables (LRU beyond it).
+# Sized so one web worker and its job process fit a 256 MB VM next to
+# pandas itself (see Memory Budget in the README).
+app.config['RESULT_CACHE_BYTES'] = 48 * 1024 * 1024
+# Time the pipeline stages of each request (parse, clean, rank, render, ...),
+# report them in a Server-Timing header and aggregate them at /metrics
+app.config['SERVER_TIMING'] = True
+# cProfile capture: 'off', 'flag' (only requests with ?profile=1 or an
+# X-Profile: 1 header) or 'all'. Dumps go to PROFILE_FOLDER, tagged with the
+# route, dataset hash and row count; beyond PROFILE_KEEP files or
+# PROFILE_MAX_BYTES in total the oldest are deleted.
+app.config['PROFILE_REQUESTS'] = 'off'
+app.config['PROFILE_FOLDER'] = os.path.join('uploads', '.profiles')
+app.config['PROFILE_KEEP'] = 50
+app.config['PROFILE_MAX_BYTES'] = 100 * 1024 * 1024
+# Uploads are stored once per content hash. A sweeper in each server process
+# deletes uploads (with their cached columns and results) not used for
+# UPLOAD_TTL_SECONDS, then the least recently used while uploads and cache
+# exceed UPLOAD_QUOTA_BYTES. It runs every UPLOAD_SWEEP_SECONDS.
+app.config['UPLOAD_TTL_SECONDS'] = 7 * 24 * 3600
+app.config['UPLOAD_QUOTA_BYTES'] = 1024 * 1024 * 1024
+app.config['UPLOAD_SWEEP_SECONDS'] = 600
+# Any setting can be overridden with a FLASK_-prefixed environment variable
+# (e.g. FLASK_JOB_WORKERS=2 on a larger VM)
+app.config.from_prefixed_env()
+
+os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+def check_profile_mode():
+    """
+    Turns profiling off, with an error in the log, if PROFILE_REQUESTS is not
+    one of PROFILE_MODES, so a typo in the setting does not fail every
+    request. Checked once here instead of per request.
+    """
+    mode = app.config['PROFILE_REQUESTS']
+    if mode not in PROFILE_MODES:
+        app.logger.error('PROFILE_REQUESTS must be one of %s, not %r; profiling is off', PROFILE_MODES, mode)
+        app.config['PROFILE_REQUESTS'] = 'off'
+
+check_profile_mode()
+
+# comps (SciPy, about 18 MB) is left out: it is only imported by the comps
+# pages, so a worker that never serves them never pays for it
+DATA_MODULES = ('processing', 'datastore', 'tables', 'tasks', 'reference_store', 'calibration')
+
+def warm_up():
+    """
+    Imports the data modules in a background thread, so the first upload does
+    not wait for them, and starts the upload sweeper. Call once per serving
+    process, after any fork.
+    """
+    def load():
+        for name in DATA_MODULES:
+            __import__(name)
+    thread = threading.Thread(target=load, name='warm-up', daemon=True)
+    thread.start()
+    threading.Thread(target=sweep_forever, name='upload-sweeper', daemon=True).start()
+    return thread
+
+def sweep_uploads_now():
+    """
+    Applies the upload TTL and disk quota once. Returns the sweep's counts.
+    """
+    return sweep_uploads(app.config['UPLOAD_FOLDER'], app.config['CACHE_FOLDER'],
+                         app.config['UPLOAD_TTL_SECONDS'], app.config['UPLOAD_QUOTA_BYTES'])
+
+def sweep_forever():
+    while True:
+        try:
+            sweep_uploads_now()
+        except Exception:
+            # Logged and retried next round: the thread must outlive a bad pass,
+            # or the TTL and quota would silently stop being enforced
+            app.logger.exception('Upload sweep failed')
+        time.sleep(app.config['UPLOAD_SWEEP_SECONDS'])
+
+def session_digest():
+    """
+    Returns the content digest of the current session's upload.
+    The file is only re-parsed if it changed since it was cached.
+    """
+    from datastore import ensure_cached
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], session['filename'])
+    digest = ensure_cached(filepath, app.config['CACHE_FOLDER'], session.get('dataset'),
+                           stream_threshold=app.config['STREAMING_THRESHOLD_BYTES'])
+    session['dataset'] = digest
+    return digest
+
+def load_session_dataset(mapping, group_by=(), numeric=True):
+    """
+    Loads the mapped (and peer group) columns of the current session's upload
+    from the columnar cache. Metric columns come back cleaned for ranking,
+    or with numeric=False as uploaded (e.g. '11.3%'), for display.
+    """
+    from datastore import read_cached
+    metric_columns = [col for metric, col in mapping.items() if metric != 'Player Name']
+    return read_cached(app.config['CACHE_FOLDER'], session_digest(), [*mapping.values(), *group_by],
+                       numeric=metric_columns if numeric else ())
+
+_result_caches = {}
+# Request threads of one worker must share its cache and job pool, not each
+# create their own
+_registry_lock = threading.Lock()
+
+def result_cache():
+    """
+    Returns this process's cache of results derived from a dataset, keyed by
+    the dataset's content digest and everything else they depend on.
+    """
+    budget = app.config['RESULT_CACHE_BYTES']
+    with _registry_lock:
+        if budget not in _result_caches:
+            _result_caches[budget] = ResultCache(budget)
+        return _result_caches[budget]
+
+def mapping_key(mapping):
+    return tuple(sorted(mapping.items()))
+
+def get_computed(name, mapping, build, group_by=()):
+    """
+    Returns a cached computation for the session's dataset, mapping and peer
+    grouping, calling build(df) on the needed columns the first time.
+    """
+    key = (name, session_digest(), mapping_key(mapping), tuple(group_by))
+    return result_cache().get_or_build(key, lambda: build(load_session_dataset(mapping, group_by)))
+
+_job_managers = {}
+
+def job_manager():
+    """
+    Returns this process's JobManager for the configured job folder.
+    """
+    key = (app.config['JOB_FOLDER'], app.config['JOB_WORKERS'], app.config['JOB_QUEUE_LIMIT'])
+    with _registry_lock:
+        if key not in _job_managers:
+            _job_managers[key] = JobManager(*key)
+        return _job_managers[key]
+
+def upload_path():
+    return os.path.join(app.config['UPLOAD_FOLDER'], session['filename'])
+
+_reference_stores = {}
+
+def reference_store():
+    """
+    Returns the ReferenceStore for the configured database (one per path, so
+    loaded populations stay cached across requests).
+    """
+    from reference_store import ReferenceStore
+    path = app.config['REFERENCE_DB']
+    if path not in _reference_stores:
+        _reference_stores[path] = ReferenceStore(path)
+    return _reference_stores[path]
+
+def selected_group_by(source):
+    """
+    Reads the peer group columns (up to two, e.g. level and position) chosen
+    in a form. Empty and 'None' choices are ignored.
+    """
+    group_by = []
+    for col in source.getlist('group_by'):
+        if col and col != 'None' and col not in group_by:
+            group_by.append(col)
+    return group_by[:2]
+
+_render_version = []
+
+def page_etag(*parts):
+    """
+    ETag for a rendered page fully determined by parts (dataset digest,
+    mapping, weights, table view, ...). Also covers the templates, so a
+    deploy that changes them invalidates old ETags.
+    """
+    if not _render_version:
+        _render_version.append(files_version(os.path.join(app.root_path, app.template_folder)))
+    return etag_for(_render_version[0], *parts)
+
+def etag_matches(etag):
+    return request.if_none_match.contains_weak(etag)
+
+def not_modified(etag):
+    """
+    304 for a client that already has this version of the page; nothing is
+    sliced or rendered.
+    """
+    return page_response(app.response_class(status=304), etag)
+
+def page_response(body, etag):
+    """
+    Marks a session-dependent page as revalidated on every use via its ETag.
+    """
+    response = make_response(body)
+    # Weak: the gzipped and plain bodies are the same page
+    response.set_etag(etag, weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+_static_versions = {}
+
+@app.url_defaults
+def static_version(endpoint, values):
+    """
+    Adds the file's content hash to static URLs (?v=...), so browsers can
+    keep them for a year and still fetch a changed file after a deploy.
+    """
+    if endpoint == 'static' and 'filename' in values:
+        filename = values['filename']
+        if filename not in _static_versions:
+            _static_versions[filename] = file_version(os.path.join(app.static_folder, filename))
+        values['v'] = _static_versions[filename]
+
+# Static files and the scrape itself are not timed
+UNTIMED_ENDPOINTS = ('static', 'metrics')
+
+@app.before_request
+def start_timing():
+    if app.config['SERVER_TIMING'] and request.endpoint not in UNTIMED_ENDPOINTS:
+        g.timing = (time.perf_counter(), start_recording())
+
+def profile_requested():
+    # Validated by check_profile_mode at startup
+    mode = app.config['PROFILE_REQUESTS']
+    if mode == 'flag':
+        return request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1'
+    return mode == 'all'
+
+@app.before_request
+def start_profile():
+    if request.endpoint not in UNTIMED_ENDPOINTS and profile_requested():
+        g.profiler = start_profiler()
+
+def profile_options(route):
+    """
+    save_profile arguments for a dump of this request's session dataset.
+    """
+    from datastore import cached_rows
+    digest = session.get('dataset')
+    return {
+        'folder': app.config['PROFILE_FOLDER'], 'route': route, 'digest': digest,
+        'rows': cached_rows(app.config['CACHE_FOLDER'], digest) if digest else None,
+        'keep': app.config['PROFILE_KEEP'], 'max_bytes': app.config['PROFILE_MAX_BYTES'],
+    }
+
+def job_profile(kind):
+    """
+    Profile settings for a background job submitted by a profiled request,
+    else None. Inline jobs are already inside the request's profile.
+    """
+    if g.get('profiler') is None or app.config['JOB_WORKERS'] == 0:
+        return None
+    return profile_options(f'job-{kind}')
+
+@app.before_request
+def check_upload():
+    """
+    Marks the session's upload as used (for the sweeper's TTL), and forgets
+    it if the sweeper already deleted it, so the pages send the user back to
+    the upload form instead of failing.
+    """
+    if request.endpoint not in UNTIMED_ENDPOINTS and session.get('filename'):
+        if not touch_upload(upload_path()):
+            for key in ('filename', 'dataset', 'mapping'):
+                session.pop(key, None)
+
+@before_render_template.connect_via(app)
+def start_render(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def finish_render(sender, template, context, **extra):
+    started = g.pop('render_started', None)
+    if started is not None:
+        add_timing('render', time.perf_counter() - started)
+
+@app.after_request
+def finish_response(response):
+    """
+    Stage timings (Server-Timing header and /metrics histograms), long-lived
+    caching for versioned static files, and gzip for large HTML, JSON and
+    CSS bodies.
+    """
+    timing = g.pop('timing', None)
+    if timing is not None:
+        started, token = timing
+        timings = stop_recording(token)
+        total = time.perf_counter() - started
+        route = request.endpoint or 'unknown'
+        REGISTRY.observe_timings(timings, route=route)
+        REGISTRY.observe('savant_request_seconds', total, 'Time to handle a request, by route.', route=route)
+        response.headers.add('Server-Timing', server_timing({**timings, 'total': total}))
+    if request.endpoint == 'static' and request.args.get('v'):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return compress_response(response, request)
+
+@app.after_request
+def finish_profile(response):
+    # Registered after finish_response, so it runs before it: the dump does
+    # not include compression
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        path = save_profile(profiler, **profile_options(request.endpoint))
+        response.headers['X-Profile-Dump'] = os.path.basename(path)
+    return response
+
+@app.teardown_request
+def stop_profile(exc):
+    # A request that failed before after_request still stops its profiler
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+@app.route('/api/cache_stats')
+def cache_stats():
+    """
+    Hit, miss and eviction counters and memory use of this process's result
+    cache (each server worker has its own).
+    """
+    return jsonify(result_cache().stats())
+
+@app.route('/metrics')
+def metrics():
+    """
+    Stage and request time histograms and result cache counters of this
+    process, in Prometheus text format.
+    """
+    stats = result_cache().stats()
+    body = REGISTRY.render() + ''.join([
+        render_value('savant_result_cache_bytes', 'gauge', 'Memory held by the result cache.', stats['bytes']),
+        render_value('savant_result_cache_entries', 'gauge', 'Entries in the result cache.', stats['entries']),
+        render_value('savant_result_cache_hits_total', 'counter', 'Result cache hits.', stats['hits']),
+        render_value('savant_result_cache_misses_total', 'counter', 'Result cache misses.', stats['misses']),
+        render_value('savant_result_cache_evictions_total', 'counter', 'Result cache evictions.',
+                     stats['evictions']),
+    ])
+    return app.response_class(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/healthz')
+def healthz():
+    """
+    Liveness check for the load balancer. Needs no data libraries, so it
+    answers at once on a cold start.
+    """
+    return {'status': 'ok'}
+
+@app.route('/upload', methods=['POST'])
+def upload_file():
+    if 'file' not in request.files:
+        return redirect(request.url)
+    file = request.files['file']
+    if file.filename == '':
+        return redirect(request.url)
+    
+    if file:
+        from datastore import read_header
+        from tasks import ingest_upload
+        # Stored under its content hash: same-named uploads never overwrite
+        # each other, and a file uploaded again reuses the earlier parse
+        try:
+            digest, filepath = store_upload(file.stream, app.config['UPLOAD_FOLDER'], file.filename)
+        except ValueError as e:
+            return render_template('index.html', error=str(e)), 400
+        session['filename'] = os.path.basename(filepath)
+        session['dataset'] = digest
+        
+        # Only the header is read here. The file is parsed into the columnar
+        # cache in the background while the columns are being mapped.
+        columns = [str(c) for c in read_header(filepath)]
+        try:
+            job_manager().submit('ingest', ingest_upload, filepath, app.config['CACHE_FOLDER'],
+                                 app.config['STREAMING_THRESHOLD_BYTES'], digest, profile=job_profile('ingest'))
+        except QueueFull:
+            # The percentile job parses the file itself
+            pass
+        
+        # Auto-Mapping Logic
+        suggested_mapping = {}
+        
+        # Helper to normalize strings for comparison
+        def normalize(s):
+            return str(s).lower().replace(' ', '').replace('_', '').replace('.', '').replace('%', '')
+
+        # 1. Map Player Name
+        # Priority list for Player Name
+        player_name_candidates = ['playerfullname', 'battername', 'playername', 'batter', 'player']
+        
+        for candidate in player_name_candidates:
+            found = False
+            for col in columns:
+                norm_col = normalize(col)
+                if candidate == norm_col:
+                    suggested_mapping['Player Name'] = col
+                    found = True
+                    break
+            if found:
+                break
+        
+        # Fallback if no exact match found, look for partials
+        if 'Player Name' not in suggested_mapping:
+            for col in columns:
+                norm_col = normalize(col)
+                if 'player' in norm_col or 'name' in norm_col or 'batter' in norm_col:
+                    suggested_mapping['Player Name'] = col
+                    break
+        
+        # 2. Map Target Metrics
+        for target in TARGET_METRICS:
+            norm_target = normalize(target)
+            best_match = None
+            
+            # Special handling for Max EV
+            if target == 'Max EV':
+                max_ev_candidates = ['maxexitvelocity', 'maxexitvel', 'maxev', 'exitvelocity', 'exitvel', 'ev']
+                for candidate in max_ev_candidates:
+                    for col in columns:
+                        norm_col = normalize(col)
+                        if candidate == norm_col:
+                            best_match = col
+                            break
+                    if best_match:
+                        break
+            
+            if not best_match:
+                for col in columns:
+                    norm_col = normalize(col)
+                    # Exact normalized match
+                    if norm_target == norm_col:
+                        best_match = col
+                        break
+                    # Partial match
+                    if norm_target in norm_col or norm_col in norm_target:
+                        if target == 'K%' and 'strikeout' in norm_col:
+                            best_match = col
+                            break
+                        if target == 'BB%' and 'walk' in norm_col:
+                            best_match = col
+                            break
+                        best_match = col
+            
+            if best_match:
+                suggested_mapping[target] = best_match
+
+        return render_template('mapping.html', columns=columns, targets=TARGET_METRICS, suggested_mapping=suggested_mapping)
+
+@app.route('/calculate', methods=['POST'])
+def calculate():
+    filename = session.get('filename')
+    if not filename:
+        return redirect(url_for('index'))
+    
+    # Get mapping from form
+    mapping = {}
+    # We expect inputs like name="map_Max EV"
+    for metric in TARGET_METRICS:
+        val = request.form.get(f'map_{metric}')
+        if val and val != 'None':
+            mapping[metric] = val
+            
+    # Also get Player Name mapping
+    player_col = request.form.get('map_Player Name')
+    if player_col:
+        mapping['Player Name'] = player_col
+        
+    # Save mapping to session for results and advanced analysis
+    session['mapping'] = mapping
+    session['group_by'] = selected_group_by(request.form)
+    
+    return start_percentiles_job()
+
+def percentiles_settings():
+    """
+    The session's ranking settings: (peer group columns, reference
+    population name or None, its version or None).
+    """
+    reference = session.get('reference')
+    version = reference_store().version(reference) if reference else None
+    if version is None:
+        return session.get('group_by', []), None, None
+    return [], reference, version
+
+def start_percentiles_job():
+    """
+    Submits the percentile computation for the session's upload and settings
+    and sends the browser to the job's progress page.
+    """
+    from tasks import compute_percentiles
+    group_by, reference, _ = percentiles_settings()
+    try:
+        job_id = job_manager().submit(
+            'percentiles', compute_percentiles, upload_path(), app.config['CACHE_FOLDER'],
+            app.config['STREAMING_THRESHOLD_BYTES'], session['mapping'], group_by,
+            app.config['REFERENCE_DB'], reference, session.get('dataset'), profile=job_profile('percentiles'))
+    except QueueFull:
+        return render_template('job.html', job=None, busy=True), 503, {'Retry-After': '30'}
+    return redirect(url_for('job_page', job_id=job_id))
+
+def report_job_timings(job):
+    """
+    Adds a finished job's stage timings to /metrics, once across all
+    processes (labelled route="job:<kind>").
+    """
+    if app.config['SERVER_TIMING']:
+        timings = job_manager().take_timings(job['id'])
+        if timings:
+            REGISTRY.observe_timings(timings, route=f"job:{job['kind']}")
+
+@app.route('/jobs/<job_id>')
+def job_page(job_id):
+    """
+    Progress page of a background job. Polls /api/jobs/<id> and, once the
+    job is done, continues to the results.
+    """
+    job = job_manager().status(job_id)
+    if job is None:
+        return redirect(url_for('index'))
+    report_job_timings(job)
+    if job['status'] == DONE:
+        if job['result'] and job['result'].get('digest'):
+            session['dataset'] = job['result']['digest']
+        return redirect(url_for('results'))
+    return render_template('job.html', job=job, busy=False)
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager().status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job.'}), 404
+    report_job_timings(job)
+    response = jsonify({key: job.get(key) for key in ('id', 'kind', 'status', 'progress', 'error')})
+    if job.get('timings'):
+        # The job's own stages, which ran in a pool process
+        response.headers.add('Server-Timing', server_timing({f'job-{name}': seconds
+                                                             for name, seconds in job['timings'].items()}))
+    return response
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """
+    Cancels a queued job, or stops a running one at its next step.
+    """
+    if job_manager().status(job_id) is None:
+        return jsonify({'error': 'Unknown job.'}), 404
+    return jsonify({'cancelled': job_manager().cancel(job_id)})
+
+def json_object():
+    """
+    The request's JSON body for the /api endpoints: {} when there is none
+    (or it is not JSON), None when it is JSON but not an object, e.g. [1, 2].
+    """
+    payload = request.get_json(silent=True)
+    if payload is None:
+        return {}
+    return payload if isinstance(payload, dict) else None
+
+
+NOT_AN_OBJECT = 'Expected a JSON object.'
+
+
+def table_view(source, default_sort=None, default_order='asc'):
+    """
+    Reads paging/sorting/filtering parameters (query string or JSON).
+    """
+    try:
+        page = int(source.get('page', 1))
+        per_page = int(source.get('per_page', DEFAULT_PER_PAGE))
+    except (TypeError, ValueError):
+        page, per_page = 1, DEFAULT_PER_PAGE
+    return {
+        'sort': source.get('sort') or default_sort,
+        'order': 'desc' if source.get('order', default_order) == 'desc' else 'asc',
+        'q': (source.get('q') or '').strip(),
+        'page': page,
+        'per_page': per_page,
+    }
+
+@timed('page')
+def select_page(table, view):
+    """
+    Selects the requested page and fills in the view with the clamped
+    page number, page count and total for the template.
+    """
+    selected = table.page(view['sort'], view['order'] == 'desc', view['q'], view['page'], view['per_page'])
+    view.update(page=selected['page'], pages=selected['pages'], per_page=selected['per_page'],
+                total=selected['total'])
+    return selected['rows']
+
+@app.template_global()
+def view_url(endpoint, view, **changes):
+    """
+    Builds a URL for the same table view with some parameters changed.
+    Empty values are left out of the query string.
+    """
+    params = {key: view[key] for key in ('sort', 'order', 'q', 'page', 'per_page')}
+    params.update(changes)
+    if params['per_page'] == DEFAULT_PER_PAGE:
+        del params['per_page']
+    return url_for(endpoint, **{key: value for key, value in params.items() if value not in (None, '')})
+
+# Export formats offered under the tables, in display order
+EXPORT_LABELS = [('csv', 'CSV'), ('ndjson', 'JSON Lines'), ('parquet', 'Parquet')]
+
+@cache
+def parquet_available():
+    # Looked up without importing pyarrow (or exports and NumPy)
+    return find_spec('pyarrow') is not None
+
+@app.template_global()
+def export_formats():
+    """
+    (format, label) pairs for the export links. Parquet is left out when
+    pyarrow is not installed, since its link would only answer 501.
+    """
+    return [(fmt, label) for fmt, label in EXPORT_LABELS if fmt != 'parquet' or parquet_available()]
+
+@app.route('/results')
+def results():
+    filename = session.get('filename')
+    mapping = session.get('mapping')
+    
+    if not filename or not mapping:
+        return redirect(url_for('index'))
+    
+    from datastore import cached_columns, is_current
+    from tables import tier_cells
+    from tasks import percentiles_result_key
+    
+    # Percentiles are computed by a background job (tasks.compute_percentiles)
+    # once per dataset + mapping + peer grouping or reference population, and
+    # stored next to the dataset. Each request only loads the stored table
+    # (once per process) and slices out one page. Switching the grouping
+    # re-ranks from the columnar cache; the upload is not parsed again.
+    group_by, reference, version = percentiles_settings()
+    digest = session.get('dataset')
+    if not digest or not is_current(upload_path(), app.config['CACHE_FOLDER'], digest):
+        return start_percentiles_job()
+    key = ('results', digest, percentiles_result_key(mapping, group_by, reference, version))
+    populations = reference_store().populations()
+    # The page is fully determined by the stored table, the view and the
+    # reference populations listed in the form
+    etag = page_etag('results', digest, key[2], table_view(request.args), populations)
+    if etag_matches(etag):
+        return not_modified(etag)
+    table = stored_percentiles(digest, key[2])
+    if table is None:
+        return start_percentiles_job()
+    view = table_view(request.args)
+    rows = select_page(table, view)
+    
+    # Tier colors for the whole page in one pass; missing percentiles show N/A
+    cells = tier_cells(rows[TARGET_METRICS].to_numpy(dtype=float, na_value=float('nan')))
+    # Text columns are categoricals; as objects they take any fill value
+    names = rows['Player Name'].astype(object).fillna('N/A').tolist()
+    peer_groups = (rows['Peer Group'].astype(object).fillna('N/A').tolist() if 'Peer Group' in rows
+                   else [None] * len(rows))
+    players = [{'Player Name': name, 'Peer Group': peer_group, 'cells': row_cells}
+               for name, peer_group, row_cells in zip(names, peer_groups, cells)]
+    columns = cached_columns(app.config['CACHE_FOLDER'], digest)
+    
+    return page_response(render_template('results.html', players=players, metrics=TARGET_METRICS,
+                                         view=view, ranked=len(table), group_by=group_by, columns=columns,
+                                         reference=reference, populations=populations), etag)
+
+def stored_percentiles(digest, result_key):
+    """
+    Returns the percentile table stored by the background job (loaded once
+    per process), or None if it has not been computed yet.
+    """
+    from datastore import read_result
+    from tables import ResultTable
+    key = ('results', digest, result_key)
+    table = result_cache().get(key)
+    if table is None:
+        frame = read_result(app.config['CACHE_FOLDER'], digest, result_key)
+        if frame is None:
+            return None
+        table = result_cache().put(key, ResultTable(frame, text_columns=['Peer Group']))
+    return table
+
+@app.route('/peer_groups', methods=['POST'])
+def set_peer_groups():
+    """
+    Switches the peer grouping from the results page, keeping the mapping.
+    """
+    if not session.get('filename') or not session.get('mapping'):
+        return redirect(url_for('index'))
+    session['group_by'] = selected_group_by(request.form)
+    return start_percentiles_job()
+
+@app.route('/reference', methods=['POST'])
+def set_reference():
+    """
+    Chooses what the results are ranked against: the upload itself (empty
+    value) or a stored reference population.
+    """
+    if not session.get('filename') or not session.get('mapping'):
+        return redirect(url_for('index'))
+    session['reference'] = request.form.get('reference') or None
+    return start_percentiles_job()
+
+@app.route('/reference/save', methods=['POST'])
+def save_reference():
+    """
+    Adds the current upload's mapped metrics to a stored reference population
+    (created if it does not exist yet; "approximate" creates it as sketches).
+    """
+    mapping = session.get('mapping')
+    name = (request.form.get('name') or '').strip()
+    if not session.get('filename') or not mapping:
+        return redirect(url_for('index'))
+    if name:
+        reference_store().add(name, load_session_dataset(mapping), mapping,
+                              approximate=bool(request.form.get('approximate')))
+    return redirect(url_for('results'))
+
+# Component columns of the advanced table, colored by percentile, in display order
+ADVANCED_COLORED = ['Max EV', 'Contact%', 'BB%', 'K%']
+
+def build_synthetic_base(df, mapping, raw=None):
+    """
+    Everything on the advanced page that does not depend on the weights:
+    the cleaned formula inputs and the display table with their percentiles.
+    The table shows the component values of raw (the mapped columns as
+    uploaded, default df).
+    """
+    import pandas as pd
+    from processing import calculate_percentiles, synthetic_xwoba_features
+    from tables import ResultTable
+    
+    # Create a result DF with Player Name
+    player_col = mapping.get('Player Name')
+    if player_col and player_col in df.columns:
+        players = df[player_col]
+    else:
+        players = df.index.astype(str)
+        
+    table = pd.DataFrame({'Player Name': players})
+    
+    # Add the components for transparency AND their percentiles for coloring.
+    # Only these four metrics are ranked, not all of TARGET_METRICS.
+    component_percentiles = calculate_percentiles(df, mapping, SYNTHETIC_COMPONENTS)
+    
+    for metric in SYNTHETIC_COMPONENTS:
+        col = mapping.get(metric)
+        if col and col in df.columns:
+            # Raw Value, as uploaded
+            table[metric] = (df if raw is None else raw)[col]
+            # Percentile Value (for coloring)
+            table[f'{metric}_pct'] = component_percentiles[metric]
+        else:
+            table[metric] = 'N/A'
+            table[f'{metric}_pct'] = 'N/A'
+    
+    return {'features': synthetic_xwoba_features(df, mapping), 'table': ResultTable(table)}
+
+def session_weights(source=None):
+    """
+    Returns the session's formula weights (or defaults), updated from
+    source (form or JSON values) if given.
+    """
+    weights = dict(session.get('weights', DEFAULT_WEIGHTS))
+    
+    if source is not None:
+        try:
+            updated = {key: float(source.get(key, weights[key])) for key in DEFAULT_WEIGHTS}
+        except (TypeError, ValueError):
+            # Handle invalid input gracefully (keep old weights)
+            return weights
+        weights = updated
+        session['weights'] = weights
+    
+    return weights
+
+@app.route('/advanced_analysis', methods=['GET', 'POST'])
+def advanced_analysis():
+    filename = session.get('filename')
+    mapping = session.get('mapping')
+    
+    if not filename or not mapping:
+        return redirect(url_for('index'))
+        
+    # If POST, update weights from form
+    weights = session_weights(request.form if request.method == 'POST' else None)
+    view = table_view(request.args, default_sort='Synthetic xwOBA', default_order='desc')
+    
+    etag = page_etag('advanced', session_digest(), mapping_key(mapping), weights, view)
+    if request.method == 'GET' and etag_matches(etag):
+        return not_modified(etag)
+    
+    from datastore import cached_columns
+    players = synthetic_xwoba_page(mapping, weights, view)
+    # Observed outcomes the weights can be calibrated against
+    columns = cached_columns(app.config['CACHE_FOLDER'], session_digest())
+    outcome = next((col for col in ('OPS', 'OBP', 'SLG', 'wOBA') if col in columns), None)
+    
+    return page_response(render_template('advanced_results.html', players=players, weights=weights, view=view,
+                                         columns=columns, outcome=outcome),
+                         etag)
+
+def synthetic_xwoba_page(mapping, weights, view):
+    """
+    Scores every player with the given weights and returns one page of rows.
+    """
+    import pandas as pd
+    from tables import tier_cells
+    rows = select_page(synthetic_xwoba_table(mapping, weights), view)
+    
+    # Component cells are colored by their percentile (uncolored if unknown)
+    percentiles = pd.DataFrame({metric: pd.to_numeric(rows[f'{metric}_pct'], errors='coerce')
+                                for metric in ADVANCED_COLORED})
+    # Values as text: float32 inputs print at their own precision (0.312, not 0.31200000643730164)
+    cells = tier_cells(percentiles.to_numpy(dtype=float, na_value=float('nan')),
+                       rows[ADVANCED_COLORED].astype(str).to_numpy(dtype=object), missing=(None, None))
+    return [{'Player Name': name, 'Synthetic xwOBA': score, 'cells': row_cells}
+            for name, score, row_cells in zip(rows['Player Name'].tolist(), rows['Synthetic xwOBA'].tolist(), cells)]
+
+def synthetic_xwoba_table(mapping, weights):
+    """
+    The advanced page's table, scored with the given weights.
+    """
+    # Cleaned inputs and component percentiles are computed once per dataset +
+    # mapping; a weight change is just a matrix-vector product. The scored
+    # table is kept per weights too, so paging through it reuses its sort order.
+    from processing import score_synthetic_xwoba
+    base = get_computed('synthetic_base', mapping,
+                        lambda df: build_synthetic_base(df, mapping, load_session_dataset(mapping, numeric=False)))
+    
+    def score():
+        syn_xwoba = score_synthetic_xwoba(base['features'], weights).round(3)
+        return base['table'].with_column('Synthetic xwOBA', syn_xwoba, position=1)
+    
+    key = ('synthetic_xwoba', session['dataset'], mapping_key(mapping), tuple(sorted(weights.items())))
+    return result_cache().get_or_build(key, score)
+
+@app.route('/api/synthetic_xwoba', methods=['POST'])
+def synthetic_xwoba_scores():
+    """
+    Recomputes Synthetic xwOBA for new weights without re-rendering the page.
+
+    Body: {"weights": {"w_bb": 0.7, ...}, "view": {"sort": ..., "order": ..., "q": ..., "page": ...}}.
+    Returns the requested page as rendered table rows plus its scores.
+    """
+    filename = session.get('filename')
+    mapping = session.get('mapping')
+    if not filename or not mapping:
+        return jsonify({'error': 'Upload a file and map its columns first.'}), 400
+
+    payload = json_object()
+    if payload is None:
+        return jsonify({'error': NOT_AN_OBJECT}), 400
+    weights = session_weights(payload.get('weights') or {})
+    view = table_view(payload.get('view') or {}, default_sort='Synthetic xwOBA', default_order='desc')
+
+    players = synthetic_xwoba_page(mapping, weights, view)
+
+    return jsonify({
+        'weights': weights,
+        'view': view,
+        'scores': [player['Synthetic xwOBA'] for player in players],
+        'rows_html': render_template('_advanced_rows.html', players=players),
+    })
+
+def player_comps(mapping, name, k):
+    """
+    Looks a player up in the session's comps index (built once per dataset
+    and mapping) and finds their k most similar players.
+
+    Returns (index, position, comp positions, distances); position is None
+    if no player has that name. With several matches the first row is used.
+    """
+    from comps import CompsIndex
+    index = get_computed('comps', mapping, lambda df: CompsIndex.from_frame(df, mapping))
+    matches = index.find(name)
+    if not matches:
+        return index, None, [], []
+    positions, distances = index.query(matches[0], k)
+    return index, matches[0], positions, distances
+
+def comps_k(source):
+    from comps import DEFAULT_COMPS, MAX_COMPS
+    try:
+        k = int(source.get('k', DEFAULT_COMPS))
+    except (TypeError, ValueError):
+        k = DEFAULT_COMPS
+    return max(1, min(k, MAX_COMPS))
+
+@app.route('/comps')
+def comps_page():
+    """
+    Lists the players whose percentile profile is closest to ?player=<name>.
+    """
+    from tables import tier_cells
+    mapping = session.get('mapping')
+    if not session.get('filename') or not mapping:
+        return redirect(url_for('index'))
+
+    name = request.args.get('player', '').strip()
+    k = comps_k(request.args)
+    etag = page_etag('comps', session_digest(), mapping_key(mapping), name, k)
+    if etag_matches(etag):
+        return not_modified(etag)
+
+    player, comps, metrics, error = None, [], [], None
+    if name:
+        try:
+            index, position, positions, distances = player_comps(mapping, name, k)
+        except ValueError as e:
+            index, position, error = None, None, str(e)
+        if position is None:
+            error = error or f'No player named "{name}" in this upload.'
+        else:
+            metrics = index.metrics
+            cells = tier_cells(index.percentiles[[position, *positions]])
+            player = {'Player Name': index.names[position], 'cells': cells[0]}
+            comps = [{'Player Name': index.names[i], 'distance': round(float(d), 1), 'cells': row_cells}
+                     for i, d, row_cells in zip(positions, distances, cells[1:])]
+    return page_response(render_template('comps.html', name=name, k=k, player=player, comps=comps,
+                                         metrics=metrics, error=error), etag)
+
+@app.route('/api/comps', methods=['POST'])
+def comps_api():
+    """
+    Finds the players most similar to one player, by distance between their
+    percentile vectors over the mapped metrics (see comps.CompsIndex).
+
+    Body: {"player": "Cardell Thibodeaux", "k": 10}
+    Returns {"player": ..., "metrics": [...], "comps": [{"Player Name", "distance", "percentiles"}, ...]}.
+    """
+    mapping = session.get('mapping')
+    if not session.get('filename') or not mapping:
+        return jsonify({'error': 'Upload a file and map its columns first.'}), 400
+
+    payload = json_object()
+    if payload is None:
+        return jsonify({'error': NOT_AN_OBJECT}), 400
+    name = str(payload.get('player') or '')
+    try:
+        index, position, positions, distances = player_comps(mapping, name, comps_k(payload))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if position is None:
+        return jsonify({'error': f'Unknown player: {name}'}), 404
+
+    def percentiles(i):
+        return {metric: None if value != value else value
+                for metric, value in zip(index.metrics, index.percentiles[i].tolist())}
+
+    return jsonify({
+        'player': {'Player Name': index.names[position], 'percentiles': percentiles(position)},
+        'metrics': index.metrics,
+        'comps': [{'Player Name': index.names[i], 'distance': float(d), 'percentiles': percentiles(i)}
+                  for i, d in zip(positions.tolist(), distances.tolist())],
+    })
+
+@app.route('/api/calibrate', methods=['POST'])
+def calibrate():
+    """
+    Fits the Synthetic xwOBA weights to an observed outcome column of the
+    upload (e.g. OBP, SLG or OPS) by ridge regression with k-fold
+    cross-validation. The session's weights are not changed.
+
+    Body: {"outcome": "OPS", "folds": 5}
+    Returns {"weights": {...}, "diagnostics": {...}} (see calibration.calibrate_weights),
+    with the session's current weights as the baseline.
+    """
+    from calibration import DEFAULT_FOLDS, calibrate_weights, calibration_inputs
+    from datastore import cached_columns
+    filename = session.get('filename')
+    mapping = session.get('mapping')
+    if not filename or not mapping:
+        return jsonify({'error': 'Upload a file and map its columns first.'}), 400
+
+    payload = json_object()
+    if payload is None:
+        return jsonify({'error': NOT_AN_OBJECT}), 400
+    outcome = payload.get('outcome')
+    if outcome not in cached_columns(app.config['CACHE_FOLDER'], session_digest()):
+        return jsonify({'error': f'Unknown outcome column: {outcome}'}), 400
+    try:
+        folds = int(payload.get('folds', DEFAULT_FOLDS))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'folds must be a whole number.'}), 400
+    if not 2 <= folds <= 20:
+        return jsonify({'error': 'folds must be between 2 and 20.'}), 400
+
+    baseline = session_weights()
+    # The outcome column is loaded along with the mapped ones
+    inputs = get_computed('calibration_inputs', mapping,
+                          lambda df: calibration_inputs(df, mapping, outcome), group_by=[outcome])
+    try:
+        result = calibrate_weights(*inputs, baseline=baseline, folds=folds)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+@app.route('/export/<table>.<fmt>')
+def export_table(table, fmt):
+    """
+    Streams every row of the percentile ('percentiles') or Synthetic xwOBA
+    ('synthetic_xwoba') results as csv, ndjson or parquet, in the order and
+    filter given by ?sort=&order=&q= like the pages.
+
+    Rows come from the same cached tables the pages use and are converted a
+    chunk at a time, so memory stays flat however many rows are exported.
+    Percentiles are never computed here: without a stored table the answer
+    is 409.
+    """
+    from exports import FORMATS, ParquetUnavailable, export_rows
+    if table not in ('percentiles', 'synthetic_xwoba') or fmt not in FORMATS:
+        return jsonify({'error': f'Unknown export: {table}.{fmt}'}), 404
+
+    filename = session.get('filename')
+    mapping = session.get('mapping')
+    if not filename or not mapping:
+        return jsonify({'error': 'Upload a file and map its columns first.'}), 400
+
+    if table == 'percentiles':
+        from datastore import is_current
+        from tasks import percentiles_result_key
+        group_by, reference, version = percentiles_settings()
+        digest = session.get('dataset')
+        result = None
+        if digest and is_current(upload_path(), app.config['CACHE_FOLDER'], digest):
+            result = stored_percentiles(digest, percentiles_result_key(mapping, group_by, reference, version))
+        if result is None:
+            return jsonify({'error': 'Percentiles have not been computed yet.'}), 409
+        view = table_view(request.args)
+    else:
+        result = synthetic_xwoba_table(mapping, session_weights())
+        view = table_view(request.args, default_sort='Synthetic xwOBA', default_order='desc')
+
+    positions = result.positions(view['sort'], view['order'] == 'desc', view['q'])
+    try:
+        rows = export_rows(result.frame, positions, fmt)
+    except ParquetUnavailable as e:
+        return jsonify({'error': str(e)}), 501
+    return app.response_class(rows, mimetype=FORMATS[fmt],
+                              headers={'Content-Disposition': f'attachment; filename={table}.{fmt}'})
+
+@app.route('/api/percentiles', methods=['POST'])
+def percentile_lookup():
+    """
+    Ranks raw metric values for a single prospect against the uploaded
+    population, or against a stored one if "reference" names it.
+
+    Body: {"values": {"K%": "18.2%", "Max EV": 104.5, ...}, "reference": "D1 2024"}
+    """
+    payload = json_object()
+    if payload is None:
+        return jsonify({'error': NOT_AN_OBJECT}), 400
+    reference = payload.get('reference')
+    filename = session.get('filename')
+    mapping = session.get('mapping')
+    if not reference and (not filename or not mapping):
+        return jsonify({'error': 'Upload a file and map its columns first.'}), 400
+
+    values = payload.get('values')
+    if not isinstance(values, dict):
+        return jsonify({'error': 'Expected a JSON object with a "values" mapping.'}), 400
+
+    unknown = [metric for metric in values if metric not in TARGET_METRICS]
+    if unknown:
+        return jsonify({'error': f'Unknown metrics: {", ".join(unknown)}'}), 400
+
+    if reference:
+        try:
+            index = reference_store().index(reference)
+        except KeyError:
+            return jsonify({'error': f'Unknown reference population: {reference}'}), 404
+    else:
+        from processing import PercentileIndex
+        index = get_computed('percentile_index', mapping, lambda df: PercentileIndex.from_frame(df, mapping))
+
+    return jsonify({
+        'percentiles': index.lookup(values),
+        'population': {metric: index.size(metric) for metric in values},
+    })
+
+if __name__ == "__main__":
+    warm_up()
+    app.run(host="0.0.0.0", port=8080)
+
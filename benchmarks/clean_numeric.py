@@ -0,0 +1,70 @@
+"""
+clean_numeric_series speed on 1M-row text columns, against the previous
+strip + three str.replace + to_numeric chain.
+
+    python -m benchmarks.clean_numeric --rows 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from processing import clean_numeric_series
+
+
+def legacy_clean_numeric_series(series):
+    # The implementation clean_numeric_series replaced, kept for comparison
+    if pd.api.types.is_numeric_dtype(series):
+        return pd.to_numeric(series, errors='coerce')
+    s = series.astype(str).str.strip()
+    s = s.str.replace('%', '', regex=False)
+    s = s.str.replace('mph', '', regex=False, case=False)
+    s = s.str.replace('ft', '', regex=False, case=False)
+    return pd.to_numeric(s, errors='coerce')
+
+
+def columns(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    values = rng.normal(50, 15, rows)
+    cols = {
+        "percent ('11.3%')": pd.Series(values.round(1)).map('{:.1f}%'.format),
+        "leading dot ('.544')": pd.Series(values / 100).map('{:.3f}'.format).str.replace(r'^0\.', '.', regex=True),
+        "speed ('98.5 mph')": pd.Series(values.round(1) + 50).map('{:.1f} mph'.format),
+        "plain text ('85.0')": pd.Series(values.round(1)).map('{:.1f}'.format),
+        "null tokens ('NA', '-')": pd.Series(values.round(1)).map('{:.1f}'.format),
+    }
+    for series in cols.values():
+        series[rng.random(rows) < 0.03] = np.nan
+        series[rng.random(rows) < 0.01] = 'N/A'
+    tokens = cols["null tokens ('NA', '-')"]
+    tokens[rng.random(rows) < 0.001] = 'NA'
+    tokens[rng.random(rows) < 0.001] = '-'
+    return cols
+
+
+def best_of(fn, series, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(series)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{"column":<24}{"legacy":>10}{"new":>10}{"speedup":>10}')
+    for name, series in columns(args.rows).items():
+        old_time, old = best_of(legacy_clean_numeric_series, series, args.repeat)
+        new_time, new = best_of(clean_numeric_series, series, args.repeat)
+        np.testing.assert_array_equal(old.to_numpy(dtype=np.float64), new.to_numpy())
+        print(f'{name:<24}{old_time:>9.3f}s{new_time:>9.3f}s{old_time / new_time:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
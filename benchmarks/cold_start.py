@@ -0,0 +1,78 @@
+"""
+Time to first byte of a freshly started server process (a cold start).
+
+    python -m benchmarks.cold_start --repeat 5
+
+Each run starts a new interpreter serving the app on a free local port and
+measures from process start until the first byte of the response arrives:
+
+    eager - pandas, NumPy and openpyxl (the data modules) imported before
+            serving, as app.py did before they were made lazy
+    lazy  - app.py as shipped: data modules warmed up in the background
+"""
+import argparse
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.ingest_memory import ROOT
+
+SERVER = '''
+import sys
+sys.path.insert(0, {root!r})
+if {eager!r}:
+    import app
+    for name in app.DATA_MODULES:
+        __import__(name)
+import app
+if not {eager!r}:
+    app.warm_up()
+app.app.run(host='127.0.0.1', port={port!r})
+'''
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def time_to_first_byte(path, eager, timeout=60):
+    """
+    Starts a server and returns the seconds until the first response byte for path.
+    """
+    port = free_port()
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', SERVER.format(root=ROOT, eager=eager, port=port)],
+                            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=timeout) as sock:
+                    sock.sendall(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+                    if sock.recv(1):
+                        return time.perf_counter() - start
+            except ConnectionRefusedError:
+                time.sleep(0.005)
+        raise TimeoutError(f'no response from {path} within {timeout}s')
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for path in ('/', '/healthz'):
+        for mode in ('eager', 'lazy'):
+            times = [time_to_first_byte(path, mode == 'eager') for _ in range(args.repeat)]
+            print(f'{path:>9} {mode:>6}: median TTFB {statistics.median(times) * 1000:6.0f} ms   '
+                  f'(min {min(times) * 1000:.0f}, max {max(times) * 1000:.0f})')
+
+
+if __name__ == '__main__':
+    main()
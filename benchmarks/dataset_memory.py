@@ -0,0 +1,83 @@
+"""
+Memory per 100k rows of the loaded dataset and its percentile table, in the
+compact dtypes against the float64 / Python-object layout they replaced.
+
+    python -m benchmarks.dataset_memory [--rows 300000]
+
+Writes a synthetic hitting.csv-style file and measures (pandas
+memory_usage(deep=True), so Python strings are counted in full):
+
+    dataset      - every column, as read_cached returns a parsed upload
+                   (before: as load_data parses it)
+    mapped       - the mapped columns of a streaming-mode upload, metrics
+                   cleaned (before: float64 metrics, object names)
+    percentiles  - the stored percentile table as read_result returns it
+                   (before: float64 percentiles, object names)
+
+Memory-mapped columns are counted too, although processes share those pages.
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import HITTING_MAPPING, write_hitting_csv
+
+
+def legacy(frame):
+    """
+    The frame in the dtypes used before: float64 numbers and percentiles,
+    int64 integers, Python objects for text.
+    """
+    dtypes = {}
+    for col in frame.columns:
+        dtype = frame[col].dtype
+        if dtype == 'Int8' or dtype.kind == 'f':
+            dtypes[col] = np.float64
+        elif dtype.kind in 'iu':
+            dtypes[col] = np.int64
+        elif isinstance(dtype, pd.CategoricalDtype):
+            dtypes[col] = object
+    return frame.astype(dtypes)
+
+
+def per_100k(frame):
+    return frame.memory_usage(index=False, deep=True).sum() / len(frame) * 100_000 / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=300_000)
+    args = parser.parse_args()
+
+    from datastore import ensure_cached, read_cached, read_result, write_result
+    from processing import calculate_percentiles, load_data
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_hitting_csv(os.path.join(tmp, 'hitting_large.csv'), args.rows)
+        numeric = [col for metric, col in HITTING_MAPPING.items() if metric != 'Player Name']
+
+        cache = os.path.join(tmp, 'cache')
+        digest = ensure_cached(path, cache)
+        dataset = read_cached(cache, digest)
+        streamed = os.path.join(tmp, 'streamed')
+        mapped = read_cached(streamed, ensure_cached(path, streamed, stream_threshold=0),
+                             list(HITTING_MAPPING.values()), numeric=numeric)
+        write_result(cache, digest, 'bench', calculate_percentiles(mapped, HITTING_MAPPING))
+        percentiles = read_result(cache, digest, 'bench')
+
+        frames = {
+            'dataset': (load_data(path), dataset),
+            'mapped': (legacy(mapped), mapped),
+            'percentiles': (legacy(percentiles), percentiles),
+        }
+        print(f'{args.rows:,} rows; MB per 100k rows')
+        for name, (before, after) in frames.items():
+            print(f'{name:>12}: before {per_100k(before):7.1f}   after {per_100k(after):7.1f}   '
+                  f'({per_100k(before) / per_100k(after):.1f}x smaller)')
+
+
+if __name__ == '__main__':
+    main()
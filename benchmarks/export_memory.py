@@ -0,0 +1,59 @@
+"""
+Peak memory of exporting a percentile table, by row count.
+
+    python -m benchmarks.export_memory --sizes 100000 300000
+
+For each size a synthetic hitting.csv-style table is ranked once, then
+exported with the streaming generators (exports.export_rows) and, for
+comparison, converted the way the HTML pages convert a page of rows
+(fillna + to_dict(orient='records')) and dumped as one JSON document.
+Peak is the tracemalloc high-water mark above the ranked table itself.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.synthetic import HITTING_MAPPING, hitting_frame
+from exports import export_rows
+from processing import calculate_percentiles
+
+
+def measure(func):
+    # Timed without tracing, which slows allocation-heavy code a lot
+    start = time.perf_counter()
+    size = func()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2**20, seconds, size
+
+
+def consume(rows):
+    return sum(len(chunk) for chunk in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 300_000])
+    args = parser.parse_args()
+
+    for rows in args.sizes:
+        table = calculate_percentiles(hitting_frame(rows), HITTING_MAPPING)
+        positions = np.arange(len(table))
+        paths = {
+            'csv stream': lambda: consume(export_rows(table, positions, 'csv')),
+            'ndjson stream': lambda: consume(export_rows(table, positions, 'ndjson')),
+            'to_dict + json': lambda: len(json.dumps(table.astype(object).fillna('N/A').to_dict(orient='records'))),
+        }
+        for name, func in paths.items():
+            peak, seconds, size = measure(func)
+            print(f'{rows:>9,} rows {name:>15}: peak {peak:7.1f} MB   {seconds:6.2f}s   {size / 2**20:7.1f} MB out')
+
+
+if __name__ == '__main__':
+    main()
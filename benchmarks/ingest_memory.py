@@ -0,0 +1,93 @@
+"""
+Peak-RSS comparison of full-file loading vs. chunked mapped-column ingestion.
+
+    python -m benchmarks.ingest_memory --rows 1500000
+
+Generates a synthetic hitting.csv-style file (about 240 bytes per row), then
+runs each path in a fresh subprocess and reports its peak resident set size.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import HITTING_MAPPING, write_hitting_csv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Each snippet runs in its own interpreter so peak RSS is not shared
+PATHS = {
+    'baseline': '''
+import pandas, numpy, processing
+''',
+    'full load': '''
+from processing import load_data
+df = load_data(PATH)
+''',
+    'streaming load': '''
+from processing import read_csv_columns
+numeric = [col for metric, col in MAPPING.items() if metric != 'Player Name']
+arrays, rows = read_csv_columns(PATH, list(MAPPING.values()), numeric=numeric)
+''',
+    'full + rank': '''
+from processing import load_data, calculate_percentiles
+df = load_data(PATH)
+result = calculate_percentiles(df, MAPPING)
+''',
+    'streaming + rank': '''
+import pandas as pd
+from processing import read_csv_columns, calculate_percentiles
+numeric = [col for metric, col in MAPPING.items() if metric != 'Player Name']
+arrays, rows = read_csv_columns(PATH, list(MAPPING.values()), numeric=numeric)
+result = calculate_percentiles(pd.DataFrame(arrays), MAPPING)
+''',
+}
+
+# VmHWM is per address space, so unlike ru_maxrss it does not inherit the
+# parent's high-water mark across fork + exec
+HARNESS = '''
+import json, sys, time
+sys.path.insert(0, {root!r})
+PATH = {path!r}
+MAPPING = {mapping!r}
+start = time.perf_counter()
+{body}
+print(json.dumps({{
+    'seconds': time.perf_counter() - start,
+    'peak_rss_mb': [int(line.split()[1]) for line in open('/proc/self/status')
+                    if line.startswith('VmHWM:')][0] / 1024,
+}}))
+'''
+
+
+def measure(name, path):
+    code = HARNESS.format(root=ROOT, path=path, mapping=HITTING_MAPPING, body=PATHS[name])
+    out = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_500_000)
+    parser.add_argument('--file', help='Use an existing CSV instead of generating one')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.file
+        if not path:
+            path = os.path.join(tmp, 'hitting_large.csv')
+            start = time.perf_counter()
+            write_hitting_csv(path, args.rows)
+            print(f'Generated {args.rows:,} rows in {time.perf_counter() - start:.1f}s')
+        print(f'File size: {os.path.getsize(path) / 2**20:.0f} MB')
+
+        results = {name: measure(name, path) for name in PATHS}
+        for name, r in results.items():
+            print(f"{name:>16}: peak RSS {r['peak_rss_mb']:7.0f} MB   {r['seconds']:6.2f}s")
+
+
+if __name__ == '__main__':
+    main()
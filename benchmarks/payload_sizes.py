@@ -0,0 +1,74 @@
+"""
+Response sizes of the main pages and assets: plain, gzipped, and on
+revalidation (If-None-Match with the page's ETag).
+
+    python -m benchmarks.payload_sizes [--file hitting.csv]
+
+Uploads the file through the Flask test client (jobs inline, temporary
+folders), maps it like the hitting.csv export and requests each URL three
+ways. Images are already compressed JPEGs; with versioned URLs and
+'immutable' caching a repeat visit does not request them at all.
+"""
+import argparse
+import os
+import re
+import tempfile
+
+from benchmarks.ingest_memory import ROOT
+from benchmarks.synthetic import HITTING_MAPPING
+
+PAGES = [
+    ('GET', '/results'),
+    ('GET', '/results?per_page=500'),
+    ('GET', '/advanced_analysis'),
+    ('GET', '/advanced_analysis?per_page=500'),
+    ('POST', '/api/synthetic_xwoba'),
+]
+
+
+def sizes(client, method, url):
+    """
+    Returns (plain bytes, gzipped bytes, revalidation bytes or None).
+    """
+    if method == 'POST':
+        send = lambda **headers: client.post(url, json={'view': {'per_page': 500}}, headers=headers)
+    else:
+        send = lambda **headers: client.get(url, headers=headers)
+    plain = send()
+    gzipped = send(**{'Accept-Encoding': 'gzip'})
+    etag = plain.headers.get('ETag')
+    revalidated = len(send(**{'If-None-Match': etag}).data) if etag else None
+    return len(plain.data), len(gzipped.data), revalidated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--file', default=os.path.join(ROOT, 'hitting.csv'))
+    args = parser.parse_args()
+
+    import app as app_module
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module.app.config.update(
+            TESTING=True, UPLOAD_FOLDER=tmp, CACHE_FOLDER=os.path.join(tmp, '.cache'),
+            JOB_FOLDER=os.path.join(tmp, '.jobs'), JOB_WORKERS=0,
+            REFERENCE_DB=os.path.join(tmp, 'reference.sqlite'))
+        client = app_module.app.test_client()
+        with open(args.file, 'rb') as f:
+            client.post('/upload', data={'file': (f, os.path.basename(args.file))},
+                        content_type='multipart/form-data')
+        client.post('/calculate', data={f'map_{metric}': col for metric, col in HITTING_MAPPING.items()},
+                    follow_redirects=True)
+
+        page = client.get('/advanced_analysis').get_data(as_text=True)
+        assets = [('GET', url) for url in re.findall(r'"(/static/[^"]+)"', page)]
+
+        print(f"{'request':<52}{'plain':>10}{'gzip':>10}{'304':>8}")
+        for method, url in PAGES + assets:
+            plain, gzipped, revalidated = sizes(client, method, url)
+            print(f'{method + " " + url:<52}{plain:>10,}{gzipped:>10,}'
+                  f'{"-" if revalidated is None else f"{revalidated:,}":>8}')
+
+
+if __name__ == '__main__':
+    main()
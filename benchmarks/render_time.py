@@ -0,0 +1,60 @@
+"""
+Time to build and render the colored results tables.
+
+    python -m benchmarks.render_time [--file hitting.csv] [--repeat 10]
+
+Uploads the file through the Flask test client (jobs inline, temporary
+folders), maps it like the hitting.csv export, then times GET requests of
+the results and advanced pages at 50 rows, 500 rows and every row on one
+page (the page size limit is lifted for the last). Tables are computed and
+cached before timing, so what is measured is slicing the page, preparing
+its cells and rendering the template.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.ingest_memory import ROOT
+from benchmarks.synthetic import HITTING_MAPPING
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--file', default=os.path.join(ROOT, 'hitting.csv'))
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    import app as app_module
+    import tables
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app_module.app.config.update(
+            TESTING=True, UPLOAD_FOLDER=tmp, CACHE_FOLDER=os.path.join(tmp, '.cache'),
+            JOB_FOLDER=os.path.join(tmp, '.jobs'), JOB_WORKERS=0,
+            REFERENCE_DB=os.path.join(tmp, 'reference.sqlite'))
+        tables.MAX_PER_PAGE = 10**7
+        client = app_module.app.test_client()
+        with open(args.file, 'rb') as f:
+            client.post('/upload', data={'file': (f, os.path.basename(args.file))},
+                        content_type='multipart/form-data')
+        client.post('/calculate', data={f'map_{metric}': col for metric, col in HITTING_MAPPING.items()},
+                    follow_redirects=True)
+
+        for page in ('/results', '/advanced_analysis'):
+            for per_page in (50, 500, 10**6):
+                url = f'{page}?per_page={per_page}'
+                client.get(url)
+                times = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    resp = client.get(url)
+                    times.append(time.perf_counter() - start)
+                assert resp.status_code == 200
+                rows = resp.get_data(as_text=True).count('<td class="player-name">')
+                print(f'{page:>18} {rows:>5} rows: median {statistics.median(times) * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
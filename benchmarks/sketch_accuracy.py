@@ -0,0 +1,88 @@
+"""
+Exact vs. approximate (KLL sketch) reference populations: memory, time, error.
+
+    python -m benchmarks.sketch_accuracy --files 3 --rows 500000
+
+Generates several synthetic hitting.csv-style files (think seasons or
+conferences) and a 3k-row probe file. The exact path loads every file,
+concatenates them and builds a PercentileIndex. The approximate path
+sketches each file in chunks and merges the sketches. Each path runs in a
+fresh subprocess; the probe's percentiles from both are then compared.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.ingest_memory import HARNESS, ROOT
+from benchmarks.synthetic import HITTING_MAPPING, hitting_frame, write_hitting_csv
+from sketches import DEFAULT_K, KLLSketch
+
+PATHS = {
+    'exact': '''
+import numpy as np, pandas as pd
+from processing import load_data, PercentileIndex, percentiles_against
+df = pd.concat([load_data(p) for p in PATH[:-1]], ignore_index=True)
+index = PercentileIndex.from_frame(df, MAPPING)
+del df
+np.save(OUT, percentiles_against(index, load_data(PATH[-1]), MAPPING).iloc[:, 1:].to_numpy(dtype=float, na_value=np.nan))
+''',
+    'sketch': '''
+import numpy as np
+from processing import load_data, percentiles_against
+from sketches import SketchIndex
+index = SketchIndex(k=K)
+for p in PATH[:-1]:
+    index.merge(SketchIndex.from_csv(p, MAPPING, k=K))
+np.save(OUT, percentiles_against(index, load_data(PATH[-1]), MAPPING).iloc[:, 1:].to_numpy(dtype=float, na_value=np.nan))
+''',
+}
+
+
+def measure(name, paths, out, k):
+    body = f'OUT = {out!r}\nK = {k}\n' + PATHS[name]
+    code = HARNESS.format(root=ROOT, path=paths, mapping=HITTING_MAPPING, body=body)
+    result = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=3)
+    parser.add_argument('--rows', type=int, default=500_000, help='Rows per reference file')
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        paths = [write_hitting_csv(os.path.join(tmp, f'season{i}.csv'), args.rows, seed=i * 7919)
+                 for i in range(args.files)]
+        probe = os.path.join(tmp, 'probe.csv')
+        hitting_frame(3_000, seed=12345).to_csv(probe, index=False)
+        paths.append(probe)
+        print(f'Generated {args.files} x {args.rows:,} rows in {time.perf_counter() - start:.1f}s')
+
+        results = {}
+        for name in PATHS:
+            out = os.path.join(tmp, f'{name}.npy')
+            results[name] = measure(name, paths, out, args.k)
+            results[name]['percentiles'] = np.load(out)
+
+    for name, r in results.items():
+        print(f"{name:>7}: peak RSS {r['peak_rss_mb']:7.0f} MB   {r['seconds']:6.2f}s")
+
+    exact, approx = results['exact']['percentiles'], results['sketch']['percentiles']
+    both = ~np.isnan(exact) & ~np.isnan(approx)
+    diff = np.abs(exact[both] - approx[both])
+    bound = 100 * KLLSketch.rank_error(args.k)
+    print(f'Probe percentiles: max |error| {diff.max():.0f} points, mean {diff.mean():.2f}; '
+          f'documented bound {bound:.1f} points + rounding (k={args.k})')
+
+
+if __name__ == '__main__':
+    main()
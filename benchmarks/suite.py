@@ -0,0 +1,196 @@
+"""
+Timing suite for processing.py and the Flask request pipeline.
+
+    python -m benchmarks.suite                        # 3k, 100k and 1M rows
+    python -m benchmarks.suite --sizes 3000 100000 --output new.json --baseline old.json
+
+Each size gets a synthetic hitting.csv-style file. Every step is run
+--repeat times and the fastest run is kept. Results are written as JSON;
+with --baseline, any step slower than baseline * --tolerance (plus a small
+absolute allowance for very short steps) is reported and the command exits
+with status 1. No baseline is kept in the repository (benchmark_results.json
+is ignored): timings are only comparable on the same machine, so produce
+old.json by running the suite on the commit to compare against first.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import HITTING_MAPPING, write_hitting_csv
+from processing import (load_data, clean_numeric_series, calculate_percentiles,
+                        calculate_synthetic_xwoba, TARGET_METRICS)
+
+DEFAULT_SIZES = [3_000, 100_000, 1_000_000]
+
+# Steps shorter than this are dominated by noise, so they get extra slack
+MIN_SECONDS = 0.005
+
+
+def _best_of(repeat, func, setup=None):
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def time_processing(path, repeat):
+    """
+    Times the processing.py steps on one CSV. Returns {step: seconds}.
+    """
+    df = load_data(path)
+    metric_columns = [col for metric, col in HITTING_MAPPING.items() if metric != 'Player Name']
+
+    return {
+        'load_data': _best_of(repeat, lambda: load_data(path)),
+        'clean_numeric_series': _best_of(
+            repeat, lambda: [clean_numeric_series(df[col]) for col in metric_columns]),
+        'calculate_percentiles': _best_of(repeat, lambda: calculate_percentiles(df, HITTING_MAPPING)),
+        'calculate_synthetic_xwoba': _best_of(
+            repeat, lambda: calculate_synthetic_xwoba(df, HITTING_MAPPING)),
+    }
+
+
+def time_flask_flow(path, repeat):
+    """
+    Times /upload -> /calculate -> /advanced_analysis through the Flask test
+    client, each repeat starting from an empty upload folder and cache. Every
+    path the app writes to is under a temporary directory. Returns
+    {step: seconds}.
+    """
+    import app as app_module
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    form = {f'map_{metric}': HITTING_MAPPING.get(metric, 'None') for metric in TARGET_METRICS}
+    form['map_Player Name'] = HITTING_MAPPING['Player Name']
+
+    config = app_module.app.config
+    saved = {key: config.get(key) for key in ('UPLOAD_FOLDER', 'CACHE_FOLDER', 'JOB_FOLDER', 'JOB_WORKERS',
+                                              'REFERENCE_DB', 'PROFILE_FOLDER', 'TESTING')}
+    best = {}
+    try:
+        config['TESTING'] = True
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as tmp:
+                config['UPLOAD_FOLDER'] = tmp
+                config['CACHE_FOLDER'] = os.path.join(tmp, '.cache')
+                # Inline jobs, so each timed request includes the work it starts
+                config['JOB_FOLDER'] = os.path.join(tmp, '.jobs')
+                config['JOB_WORKERS'] = 0
+                config['REFERENCE_DB'] = os.path.join(tmp, 'reference.sqlite')
+                config['PROFILE_FOLDER'] = os.path.join(tmp, '.profiles')
+                app_module.result_cache().clear()
+
+                timings = {}
+                with app_module.app.test_client() as client:
+                    steps = [
+                        ('flask_upload', lambda: client.post(
+                            '/upload', data={'file': (io.BytesIO(data), 'hitting.csv')},
+                            content_type='multipart/form-data')),
+                        ('flask_calculate', lambda: client.post('/calculate', data=form, follow_redirects=True)),
+                        ('flask_advanced_analysis', lambda: client.get('/advanced_analysis')),
+                    ]
+                    for name, request in steps:
+                        start = time.perf_counter()
+                        resp = request()
+                        timings[name] = time.perf_counter() - start
+                        if resp.status_code != 200:
+                            raise RuntimeError(f'{name} returned {resp.status_code}')
+                timings['flask_flow'] = sum(timings.values())
+
+                for name, seconds in timings.items():
+                    best[name] = min(best.get(name, seconds), seconds)
+                app_module._reference_stores.pop(config['REFERENCE_DB'], None)
+    finally:
+        config.update(saved)
+        app_module.result_cache().clear()
+    return best
+
+
+def run_suite(sizes=DEFAULT_SIZES, repeat=3, seed=0):
+    """
+    Runs every step on every size. Returns the results document that is
+    written to disk: machine info plus {rows: {step: seconds}}.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = write_hitting_csv(os.path.join(tmp, f'hitting_{rows}.csv'), rows, seed=seed)
+            timings = time_processing(path, repeat)
+            timings.update(time_flask_flow(path, repeat))
+            results[str(rows)] = timings
+            os.remove(path)
+
+    return {
+        'machine': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+        },
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def find_regressions(current, baseline, tolerance=1.25, min_seconds=MIN_SECONDS):
+    """
+    Compares two results documents. Returns a list of (rows, step, baseline
+    seconds, current seconds) for steps that got slower than allowed. Steps
+    missing from either side are skipped.
+    """
+    regressions = []
+    for rows, steps in current['results'].items():
+        for step, seconds in steps.items():
+            before = baseline['results'].get(rows, {}).get(step)
+            if before is not None and seconds > before * tolerance + min_seconds:
+                regressions.append((rows, step, before, seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='Results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help='Allowed slowdown factor before a step counts as a regression')
+    args = parser.parse_args()
+
+    document = run_suite(args.sizes, args.repeat)
+    with open(args.output, 'w') as f:
+        json.dump(document, f, indent=2)
+
+    steps = list(next(iter(document['results'].values())))
+    print(f"{'step':<28}" + ''.join(f'{rows:>12}' for rows in document['results']))
+    for step in steps:
+        print(f'{step:<28}' + ''.join(f"{timings[step]:>11.3f}s" for timings in document['results'].values()))
+    print(f'Wrote {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(document, baseline, args.tolerance)
+        for rows, step, before, after in regressions:
+            print(f'REGRESSION {step} @ {rows} rows: {before:.3f}s -> {after:.3f}s')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions against {args.baseline} (tolerance {args.tolerance}x)')
+
+
+if __name__ == '__main__':
+    main()
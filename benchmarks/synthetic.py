@@ -0,0 +1,101 @@
+"""
+Synthetic datasets in the hitting.csv schema, for benchmarks.
+"""
+import numpy as np
+import pandas as pd
+
+HITTING_COLUMNS = [
+    'Rank', 'playerId', 'abbrevName', 'playerFullName', 'player', 'playerFirstName', 'pos',
+    'newestTeamName', 'newestTeamAbbrevName', 'newestTeamId', 'newestTeamLocation',
+    'newestTeamLevel', 'batsHand', 'throwsHand', 'PA', 'HR', 'SB', 'OBP', 'SLG', 'OPS',
+    'K%', 'BB%', 'Chase%', 'Contact%', 'InZoneCon%', 'ExitVel', '90thExitVel', 'MxExitVel',
+]
+
+# The column mapping the hitting.csv export auto-maps to
+HITTING_MAPPING = {
+    'Player Name': 'playerFullName',
+    'K%': 'K%',
+    'BB%': 'BB%',
+    'Chase%': 'Chase%',
+    'Contact%': 'Contact%',
+    'EV': 'ExitVel',
+    'Max EV': 'MxExitVel',
+}
+
+POSITIONS = np.array(['C', '1B', '2B', '3B', 'SS', 'LF', 'CF', 'RF', 'DH', 'IF', 'OF'])
+LEVELS = np.array(['BBC', 'JUCO', 'D2', 'D3', 'NAIA'])
+HANDS = np.array(['L', 'R', 'S'])
+
+
+def _pct(values):
+    # Savant exports store rates as strings like '11.3%'
+    return pd.Series(values).round(1).map('{:.1f}%'.format)
+
+
+def _rate(values):
+    # ... and OBP/SLG without the leading zero, like '.544'
+    return pd.Series(values).map('{:.3f}'.format).str.replace(r'^0\.', '.', regex=True)
+
+
+def hitting_frame(rows, seed=0, start=0):
+    """
+    Returns a DataFrame of `rows` synthetic players with hitting.csv's columns and formats.
+    """
+    rng = np.random.default_rng(seed)
+    idx = np.arange(start, start + rows)
+    first = pd.Series(idx).map('First{}'.format)
+    last = pd.Series(idx).map('Last{}'.format)
+    team_id = rng.integers(0, 300, rows)
+    obp = rng.normal(0.380, 0.060, rows).clip(0.1, 0.7)
+    slg = rng.normal(0.450, 0.100, rows).clip(0.1, 1.2)
+    ev = rng.normal(85, 4, rows)
+
+    df = pd.DataFrame({
+        'Rank': idx + 1,
+        'playerId': rng.integers(10**8, 10**10, rows),
+        'abbrevName': first.str[0] + '. ' + last,
+        'playerFullName': first + ' ' + last,
+        'player': last,
+        'playerFirstName': first,
+        'pos': rng.choice(POSITIONS, rows),
+        'newestTeamName': pd.Series(team_id).map('Team {} University'.format),
+        'newestTeamAbbrevName': pd.Series(team_id).map('T{}'.format),
+        'newestTeamId': team_id,
+        'newestTeamLocation': pd.Series(team_id).map('City {}'.format),
+        'newestTeamLevel': rng.choice(LEVELS, rows),
+        'batsHand': rng.choice(HANDS, rows),
+        'throwsHand': rng.choice(HANDS[:2], rows),
+        'PA': rng.integers(20, 300, rows),
+        'HR': rng.integers(0, 25, rows),
+        'SB': rng.integers(0, 40, rows),
+        'OBP': _rate(obp),
+        'SLG': _rate(slg),
+        'OPS': _rate(obp + slg),
+        'K%': _pct(rng.normal(20, 6, rows).clip(0, 60)),
+        'BB%': _pct(rng.normal(11, 4, rows).clip(0, 40)),
+        'Chase%': _pct(rng.normal(24, 6, rows).clip(0, 70)),
+        'Contact%': _pct(rng.normal(76, 7, rows).clip(30, 100)),
+        'InZoneCon%': _pct(rng.normal(85, 5, rows).clip(40, 100)),
+        'ExitVel': ev.round(1),
+        '90thExitVel': (ev + rng.normal(14, 2, rows)).round(1),
+        'MxExitVel': (ev + rng.normal(19, 3, rows)).round(1),
+    }, columns=HITTING_COLUMNS)
+
+    # Real exports have gaps
+    for col in ('Chase%', 'ExitVel', '90thExitVel', 'MxExitVel'):
+        df.loc[rng.random(rows) < 0.03, col] = np.nan
+    return df
+
+
+def write_hitting_csv(path, rows, seed=0, chunk_rows=200_000):
+    """
+    Writes a synthetic hitting.csv-style file in chunks, so generating a
+    multi-hundred-MB file does not need it all in memory.
+    """
+    written = 0
+    with open(path, 'w', newline='') as f:
+        while written < rows:
+            n = min(chunk_rows, rows - written)
+            hitting_frame(n, seed=seed + written, start=written).to_csv(f, index=False, header=written == 0)
+            written += n
+    return path
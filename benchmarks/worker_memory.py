@@ -0,0 +1,113 @@
+"""
+Memory of several server worker processes holding the same dataset and
+percentile table.
+
+    python -m benchmarks.worker_memory --rows 500000 --workers 4
+
+Caches a synthetic upload and its stored percentile table once, then starts
+--workers processes that each load both and read every numeric value:
+
+    mapped  - as read_cached / read_result return them (memory-mapped .npy)
+    copied  - the same frames copied into private memory, as each worker
+              would hold them without the mapping
+
+Once all workers of a mode have loaded, each reports from
+/proc/self/smaps_rollup its private memory (pages no other process maps) and
+PSS (shared pages split evenly between the processes mapping them).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.ingest_memory import ROOT
+from benchmarks.synthetic import HITTING_MAPPING, write_hitting_csv
+
+# Same threshold as the app: large uploads keep mapped metrics cleaned
+STREAM_THRESHOLD = 32 * 1024 * 1024
+
+WORKER = '''
+import json, sys
+sys.path.insert(0, {root!r})
+import numpy as np
+from datastore import read_cached, read_result
+frames = []
+if {load!r}:
+    frames = [read_cached({cache!r}, {digest!r}, {columns!r}, numeric={columns!r}),
+              read_result({cache!r}, {digest!r}, 'bench')]
+if {copy!r}:
+    frames = [frame.copy() for frame in frames]
+for frame in frames:
+    for col in frame.select_dtypes('number'):
+        frame[col].to_numpy().sum()
+print('ready', flush=True)
+sys.stdin.readline()
+fields = dict(line.split(':', 1) for line in open('/proc/self/smaps_rollup') if ':' in line and 'kB' in line)
+kb = {{name: int(value.split()[0]) for name, value in fields.items()}}
+print(json.dumps({{
+    'private_mb': (kb['Private_Clean'] + kb['Private_Dirty']) / 1024,
+    'pss_mb': kb['Pss'] / 1024,
+}}))
+'''
+
+MODES = {
+    'baseline': {'load': False, 'copy': False},
+    'copied': {'load': True, 'copy': True},
+    'mapped': {'load': True, 'copy': False},
+}
+
+
+def measure(mode, workers, cache, digest):
+    """
+    Starts the workers, waits until all have loaded, then collects their reports.
+    """
+    columns = [col for metric, col in HITTING_MAPPING.items() if metric != 'Player Name']
+    code = WORKER.format(root=ROOT, cache=cache, digest=digest, columns=columns, **MODES[mode])
+    procs = [subprocess.Popen([sys.executable, '-c', code], stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE, text=True) for _ in range(workers)]
+    for proc in procs:
+        assert proc.stdout.readline().strip() == 'ready'
+    reports = []
+    for proc in procs:
+        out, _ = proc.communicate('report\n')
+        reports.append(json.loads(out.strip().splitlines()[-1]))
+    return reports
+
+
+def prepare(tmp, rows):
+    from datastore import ensure_cached, read_cached, write_result
+    from processing import calculate_percentiles
+
+    path = os.path.join(tmp, 'hitting_large.csv')
+    write_hitting_csv(path, rows)
+    cache = os.path.join(tmp, 'cache')
+    digest = ensure_cached(path, cache, stream_threshold=STREAM_THRESHOLD)
+    numeric = [col for metric, col in HITTING_MAPPING.items() if metric != 'Player Name']
+    df = read_cached(cache, digest, list(HITTING_MAPPING.values()), numeric=numeric)
+    write_result(cache, digest, 'bench', calculate_percentiles(df, HITTING_MAPPING))
+    return cache, digest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        cache, digest = prepare(tmp, args.rows)
+        print(f'Cached {args.rows:,} rows and their percentiles in {time.perf_counter() - start:.1f}s')
+
+        for mode in MODES:
+            reports = measure(mode, args.workers, cache, digest)
+            private = sum(r['private_mb'] for r in reports)
+            pss = sum(r['pss_mb'] for r in reports)
+            print(f'{mode:>9} x{args.workers}: private {private:7.0f} MB   total PSS {pss:7.0f} MB')
+
+
+if __name__ == '__main__':
+    main()
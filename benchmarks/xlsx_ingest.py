@@ -0,0 +1,84 @@
+"""
+Time and peak memory of XLSX ingestion: pd.read_excel vs. the streaming reader.
+
+    python -m benchmarks.xlsx_ingest --rows 50000
+
+Writes a synthetic hitting.csv-style workbook, then runs each path in a
+fresh subprocess (see benchmarks.ingest_memory for how peak RSS is read).
+'cached mapped load' is what /calculate does after upload: read the mapped
+columns back from the columnar cache without opening the workbook.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from openpyxl import Workbook
+
+from benchmarks.ingest_memory import HARNESS, ROOT
+from benchmarks.synthetic import HITTING_MAPPING, hitting_frame
+
+PATHS = {
+    'baseline': '''
+import pandas, numpy, processing
+''',
+    'pd.read_excel': '''
+import pandas as pd
+df = pd.read_excel(PATH)
+''',
+    'read_xlsx': '''
+from processing import read_xlsx
+df = read_xlsx(PATH)
+''',
+    'upload (cache build)': '''
+import os
+from datastore import ensure_cached
+ensure_cached(PATH, os.path.join(os.path.dirname(PATH), 'cache'))
+''',
+    'cached mapped load': '''
+import os
+from datastore import ensure_cached, read_cached
+cache = os.path.join(os.path.dirname(PATH), 'cache')
+df = read_cached(cache, ensure_cached(PATH, cache), list(MAPPING.values()))
+''',
+}
+
+
+def measure(name, path):
+    code = HARNESS.format(root=ROOT, path=path, mapping=HITTING_MAPPING, body=PATHS[name])
+    out = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def write_workbook(path, rows):
+    frame = hitting_frame(rows)
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(frame.columns))
+    for row in frame.itertuples(index=False):
+        sheet.append([None if value != value else value for value in row])
+    workbook.save(path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        path = write_workbook(os.path.join(tmp, 'hitting.xlsx'), args.rows)
+        print(f'Wrote {args.rows:,} rows ({os.path.getsize(path) / 2**20:.1f} MB) '
+              f'in {time.perf_counter() - start:.1f}s')
+
+        for name in PATHS:
+            r = measure(name, path)
+            print(f"{name:>22}: peak RSS {r['peak_rss_mb']:7.0f} MB   {r['seconds']:6.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import numpy as np
+
+from constants import DEFAULT_WEIGHTS, SYNTHETIC_COMPONENTS, SYNTHETIC_WEIGHT_KEYS
+from processing import clean_numeric_series, synthetic_xwoba_features, synthetic_xwoba_weights
+
+DEFAULT_FOLDS = 5
+
+# Ridge penalties tried, per training row, on standardized features. The
+# smallest is practically plain least squares.
+CALIBRATION_ALPHAS = np.logspace(-6, 1, 36)
+
+
+def calibration_inputs(df, mapping, outcome):
+    """
+    Returns (features, target, fitted) for calibrating the Synthetic xwOBA
+    weights against the outcome column (e.g. OBP or OPS).
+
+    Only rows with the outcome and every mapped formula input are kept, so
+    missing values are not treated as zeros. features are the scaled formula
+    inputs (see processing.synthetic_xwoba_features); fitted lists the
+    components that are mapped and can be fitted.
+    """
+    target = clean_numeric_series(df[outcome]).to_numpy(dtype=np.float64)
+    complete = ~np.isnan(target)
+    fitted = []
+    for metric in SYNTHETIC_COMPONENTS:
+        col = mapping.get(metric)
+        if col and col in df.columns:
+            fitted.append(metric)
+            complete &= clean_numeric_series(df[col]).notna().to_numpy()
+
+    rows = df[complete]
+    return synthetic_xwoba_features(rows, mapping), target[complete], fitted
+
+
+def kfold_indices(n, folds, seed=0):
+    """
+    Splits range(n) into `folds` shuffled test sets of (nearly) equal size.
+    """
+    order = np.random.default_rng(seed).permutation(n)
+    return np.array_split(order, folds)
+
+
+def ridge_path(features, target, alphas):
+    """
+    Fits ridge regression for every penalty at once.
+
+    Features are centered and scaled to unit variance, so the penalty treats
+    every component alike; the intercept is not penalized. One
+    eigendecomposition of the small (components x components) Gram matrix
+    serves all penalties: coefficients for all of them are a single matrix
+    product, and the rows are only passed over once.
+
+    Returns:
+        (weights, intercepts): (alphas, components) and (alphas,) arrays on
+        the original feature scale. Constant columns get a weight of 0.
+    """
+    mean = features.mean(axis=0)
+    scale = features.std(axis=0)
+    constant = scale == 0
+    scale[constant] = 1.0
+    standardized = (features - mean) / scale
+    offset = target.mean()
+
+    eigenvalues, vectors = np.linalg.eigh(standardized.T @ standardized)
+    projected = vectors.T @ (standardized.T @ (target - offset))
+    penalties = np.asarray(alphas, dtype=np.float64) * len(target)
+    coefs = vectors @ (projected[:, None] / (eigenvalues[:, None] + penalties[None, :]))
+
+    weights = (coefs / scale[:, None]).T
+    weights[:, constant] = 0.0
+    return weights, offset - weights @ mean
+
+
+def fit_stats(predictions, target):
+    """
+    Returns (RMSE, R²) of predictions against target. predictions may have
+    one column per candidate, giving one value of each per candidate.
+    """
+    residuals = predictions - (target[:, None] if predictions.ndim == 2 else target)
+    sse = (residuals ** 2).sum(axis=0)
+    sst = ((target - target.mean()) ** 2).sum()
+    return np.sqrt(sse / len(target)), 1 - sse / sst if sst > 0 else np.zeros_like(sse)
+
+
+def calibrate_weights(features, target, fitted=SYNTHETIC_COMPONENTS, baseline=None,
+                      folds=DEFAULT_FOLDS, alphas=CALIBRATION_ALPHAS, seed=0):
+    """
+    Fits the Synthetic xwOBA weights to an observed outcome.
+
+    The penalty is chosen by k-fold cross-validation: for each fold the whole
+    ridge path is fitted on the other folds and scored on this one, all
+    penalties in one batch. The chosen penalty is then refitted on every row.
+
+    Args:
+        features: (rows, 4) scaled formula inputs (calibration_inputs).
+        target: Observed outcome per row.
+        fitted: Components to fit. The others (unmapped inputs) keep their
+            baseline weight and only the base value absorbs them.
+        baseline: Weights to compare against (default DEFAULT_WEIGHTS).
+        folds: Number of cross-validation folds.
+        alphas: Ridge penalties to try (see CALIBRATION_ALPHAS).
+        seed: Seed of the fold assignment.
+
+    Returns:
+        dict: 'weights' (a full weights dict, like DEFAULT_WEIGHTS) and
+        'diagnostics': rows, folds, chosen alpha, cross-validated RMSE and R²
+        of the fit, the same for the baseline weights, and in-sample R².
+    """
+    baseline = {**DEFAULT_WEIGHTS, **(baseline or {})}
+    rows = len(target)
+    if rows < 2 * folds:
+        raise ValueError(f'Calibration needs at least {2 * folds} complete rows, found {rows}.')
+
+    base_vector, base_value = synthetic_xwoba_weights(baseline)
+    fit_columns = np.array([metric in fitted for metric in SYNTHETIC_COMPONENTS])
+    # Unmapped inputs are constant; their baseline contribution is taken out
+    # of the target and added back through the intercept
+    target_fit = target - features[:, ~fit_columns] @ base_vector[~fit_columns]
+    features_fit = features[:, fit_columns]
+
+    alphas = np.asarray(alphas, dtype=np.float64)
+    out_of_fold = np.empty((rows, len(alphas)))
+    for test in kfold_indices(rows, folds, seed):
+        train = np.ones(rows, dtype=bool)
+        train[test] = False
+        weights, intercepts = ridge_path(features_fit[train], target_fit[train], alphas)
+        out_of_fold[test] = features_fit[test] @ weights.T + intercepts
+
+    cv_rmse, cv_r2 = fit_stats(out_of_fold, target_fit)
+    best = int(np.argmin(cv_rmse))
+    weights, intercepts = ridge_path(features_fit, target_fit, alphas[best:best + 1])
+
+    vector = base_vector.copy()
+    vector[fit_columns] = weights[0]
+    calibrated = dict(zip(SYNTHETIC_WEIGHT_KEYS, vector.tolist()))
+    calibrated['base_woba'] = float(intercepts[0])
+
+    baseline_rmse, baseline_r2 = fit_stats(features @ base_vector + base_value, target)
+    _, train_r2 = fit_stats(features @ vector + intercepts[0], target)
+    return {
+        'weights': calibrated,
+        'diagnostics': {
+            'rows': rows,
+            'folds': folds,
+            'fitted': list(fitted),
+            'alpha': float(alphas[best]),
+            'cv_rmse': float(cv_rmse[best]),
+            'cv_r2': float(cv_r2[best]),
+            'train_r2': float(train_r2),
+            'baseline_rmse': float(baseline_rmse),
+            'baseline_r2': float(baseline_r2),
+        },
+    }
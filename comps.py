@@ -0,0 +1,83 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from constants import TARGET_METRICS
+from processing import calculate_percentiles
+
+DEFAULT_COMPS = 10
+MAX_COMPS = 50
+
+# Missing percentiles count as the middle of the pool: a metric a player was
+# not measured on neither pulls them towards nor away from anyone.
+NEUTRAL_PERCENTILE = 50.0
+
+# Players with fewer known metrics than this share of the indexed ones are
+# not offered as comps (mostly neutral vectors would match each other).
+MIN_KNOWN_SHARE = 0.5
+
+
+class CompsIndex:
+    """
+    KD-tree over each player's percentile vector, for "most similar players"
+    queries in O(log n) instead of comparing every pair.
+
+    Only metrics mapped for the upload are indexed. Missing percentiles are
+    filled with NEUTRAL_PERCENTILE; players knowing less than MIN_KNOWN_SHARE
+    of the metrics can still be looked up but are never returned as comps.
+    Distances are root mean square percentile differences, so 0 is an
+    identical profile and 10 means ten points apart per metric on average.
+    """
+
+    def __init__(self, names, percentiles, metrics):
+        self.names = np.asarray(names, dtype=object)
+        self.percentiles = np.asarray(percentiles, dtype=np.float64)
+        self.metrics = list(metrics)
+        self._folded = np.array([name.casefold() for name in self.names], dtype=object)
+        if not self.metrics:
+            raise ValueError('Map at least one metric to find comparable players.')
+
+        known = ~np.isnan(self.percentiles)
+        self.known = known.sum(axis=1)
+        self.points = np.where(known, self.percentiles, NEUTRAL_PERCENTILE)
+        self.indexed = np.flatnonzero(self.known >= MIN_KNOWN_SHARE * len(self.metrics))
+        self.tree = cKDTree(self.points[self.indexed]) if len(self.indexed) else None
+
+    @classmethod
+    def from_frame(cls, df, mapping):
+        """
+        Ranks the whole upload (no peer groups) and indexes the mapped metrics.
+        """
+        table = calculate_percentiles(df, mapping)
+        metrics = [metric for metric in TARGET_METRICS if metric in mapping and table[metric].notna().any()]
+        names = table['Player Name'].astype(object).fillna('N/A').astype(str)
+        return cls(names, table[metrics].to_numpy(dtype=np.float64, na_value=np.nan), metrics)
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def nbytes(self):
+        # The tree keeps its own copy of the points plus an index per point
+        return (self.percentiles.nbytes + 2 * self.points.nbytes + 2 * self.names.nbytes
+                + self.known.nbytes + 2 * self.indexed.nbytes)
+
+    def find(self, name):
+        """
+        Row positions of players with this name (case-insensitive).
+        """
+        name = name.strip().casefold()
+        return np.flatnonzero(self._folded == name).tolist()
+
+    def query(self, position, k=DEFAULT_COMPS):
+        """
+        Returns the k players most similar to the player at position, as
+        (positions, distances), nearest first. The player is not their own comp.
+        """
+        if self.tree is None or k < 1:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        wanted = min(k + 1, len(self.indexed))
+        distances, nearest = self.tree.query(self.points[position], k=wanted)
+        positions = self.indexed[np.atleast_1d(nearest)]
+        distances = np.atleast_1d(distances) / np.sqrt(len(self.metrics))
+        keep = positions != position
+        return positions[keep][:k], distances[keep][:k]
@@ -0,0 +1,53 @@
+# Plain definitions shared by the web app and the processing modules. Keep
+# this module free of numpy/pandas imports: app.py imports it at startup.
+
+# Standard Target Metrics
+TARGET_METRICS = [
+    "xwOBA",
+    "xBA",
+    "xSLG",
+    "xISO",
+    "xOBP",
+    "Brl",
+    "Brl%",
+    "EV",
+    "Max EV",
+    "HardHit%",
+    "K%",
+    "BB%",
+    "Whiff%",
+    "Chase%",
+    "Speed",
+    "OAA",
+    "Arm Strength",
+    "Bat Speed",
+    "Squared-up Rate",
+    "Swing Length",
+    "Contact%"
+]
+
+# Metrics where Lower is Better (so we invert the rank)
+LOWER_IS_BETTER = [
+    "K%",
+    "Chase%",
+    "Whiff%",
+    "Swing Length"
+]
+
+# Inputs of the Synthetic xwOBA formula, in feature-matrix column order
+SYNTHETIC_COMPONENTS = ['BB%', 'K%', 'Max EV', 'Contact%']
+
+# Formula weight of each of SYNTHETIC_COMPONENTS, same order
+SYNTHETIC_WEIGHT_KEYS = ['w_bb', 'w_k', 'w_power', 'w_contact']
+
+DEFAULT_WEIGHTS = {
+    'w_bb': 0.7,
+    'w_k': 0.7,
+    'w_power': 0.25,
+    'w_contact': 0.2,
+    'base_woba': 0.280
+}
+
+# Result table paging
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
@@ -0,0 +1,533 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from processing import (PERCENTILE_NA, load_data, read_csv_columns, excel_header, percentile_array,
+                        clean_numeric_series)
+from metrics import timed
+
+# Bump when the on-disk layout changes so stale caches are rebuilt
+CACHE_VERSION = 5
+
+META_FILE = 'meta.json'
+
+# While an entry is built, cache_root/.<digest>.lock holds the builder's pid.
+# Other processes wanting the same entry poll for it to go away.
+BUILD_LOCK_POLL_SECONDS = 0.1
+
+# Text columns with at most this many distinct values per row are kept as
+# categoricals. Mostly distinct text (e.g. one row per player) is smaller as
+# plain strings: codes and the categories' hash table would come on top.
+CATEGORY_MAX_SHARE = 0.5
+
+
+@timed('hash')
+def file_digest(filepath, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+    """
+    h = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _source_stat(filepath):
+    st = os.stat(filepath)
+    return {'path': os.path.abspath(filepath), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def _read_meta(cache_root, digest):
+    path = os.path.join(cache_root, digest, META_FILE)
+    try:
+        with open(path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    return meta
+
+
+def _write_meta(directory, meta):
+    fd, tmp = tempfile.mkstemp(prefix=META_FILE, dir=directory)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(directory, META_FILE))
+
+
+def _save_array(directory, filename, values):
+    # Write under a temporary name so readers never see a partial file
+    fd, tmp = tempfile.mkstemp(prefix=filename, suffix='.npy', dir=directory)
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, values)
+    os.replace(tmp, os.path.join(directory, filename))
+
+
+def compact_numbers(values):
+    """
+    Narrows a numeric column: float64 to float32 when every finite value
+    survives the round trip exactly (small integers, halves, ...), and
+    integers to the smallest signed type holding their range. Anything else
+    - decimals, IDs past 2**24 - keeps its dtype, so the cache never changes
+    a value. Mapped metric columns are narrowed separately, once cleaned
+    (see read_cached).
+    """
+    values = np.asarray(values)
+    if values.dtype == np.float64:
+        finite = values[np.isfinite(values)]
+        with np.errstate(over='ignore'):
+            narrowed = finite.astype(np.float32)
+        if np.array_equal(narrowed.astype(np.float64), finite):
+            return values.astype(np.float32)
+    elif values.dtype.kind in 'iu' and values.size:
+        lo, hi = values.min(), values.max()
+        for dtype in (np.int8, np.int16, np.int32):
+            if np.iinfo(dtype).min <= lo and hi <= np.iinfo(dtype).max:
+                return values.astype(dtype)
+    return values
+
+
+def _write_column(directory, name, values):
+    """
+    Writes one column as .npy and returns its kind ('native', 'percentile',
+    'category' or 'text').
+
+    Numbers are narrowed by compact_numbers; booleans and datetimes are saved
+    as-is. Percentile columns (Int8) are saved as int8 with PERCENTILE_NA
+    for missing values. Everything else is text. Text that repeats (teams,
+    positions, levels, ...) is saved as a categorical: integer codes (-1 for
+    missing) plus the distinct values. Other text is saved as a fixed-width
+    unicode array plus a null mask. Loading never needs pickle.
+    """
+    series = pd.Series(values)
+    if series.dtype == 'Int8':
+        _save_array(directory, f'{name}.npy', series.to_numpy(dtype=np.int8, na_value=PERCENTILE_NA))
+        return 'percentile'
+    if series.dtype.kind in 'biufcmM':
+        _save_array(directory, f'{name}.npy', compact_numbers(series.to_numpy()))
+        return 'native'
+
+    mask = series.isna().to_numpy()
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        text = series.astype(str)
+        text[mask] = None
+        series = text.astype('category')
+    if len(series.cat.categories) <= CATEGORY_MAX_SHARE * len(series):
+        _save_array(directory, f'{name}.npy', series.cat.codes.to_numpy())
+        _save_array(directory, f'{name}.categories.npy', series.cat.categories.to_numpy(dtype=str))
+        return 'category'
+
+    text = series.astype(str).to_numpy(dtype=str)
+    if mask.any():
+        text[mask] = ''
+        _save_array(directory, f'{name}.mask.npy', mask)
+    _save_array(directory, f'{name}.npy', text)
+    return 'text'
+
+
+def _read_column(directory, name, kind):
+    # Memory-mapped read-only: every process reading a numeric column shares
+    # the same page-cache pages instead of holding its own copy
+    values = np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+    if kind in ('native', 'clean'):
+        return values
+    if kind == 'percentile':
+        return percentile_array(values)
+    if kind == 'category':
+        # Only the distinct values become Python strings; the codes stay mapped
+        categories = np.load(os.path.join(directory, f'{name}.categories.npy'))
+        return pd.Categorical.from_codes(values, pd.Index(categories, dtype=object))
+
+    # Text becomes Python strings (private to each process) straight from the mapping
+    values = np.array(values, dtype=object)
+    mask_path = os.path.join(directory, f'{name}.mask.npy')
+    if os.path.exists(mask_path):
+        values[np.load(mask_path)] = np.nan
+    return values
+
+
+def build_cache(filepath, cache_root, digest, streaming=False):
+    """
+    Creates the cache entry for cache_root/digest.
+
+    Normally the whole file is parsed once and every column is written. With
+    streaming=True only the header is read; columns are ingested in chunks
+    the first time they are requested (see read_cached), so a large file is
+    never held in memory as a whole.
+    """
+    if streaming:
+        df = None
+        header = [str(c) for c in read_header(filepath)]
+        rows = None
+    else:
+        df = load_data(filepath)
+        header = [str(c) for c in df.columns]
+        rows = len(df)
+
+    os.makedirs(cache_root, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.build-', dir=cache_root)
+    try:
+        stored = {}
+        if df is not None:
+            for i, col in enumerate(header):
+                stored[col] = {'file': f'c{i}', 'kind': _write_column(tmp_dir, f'c{i}', df.iloc[:, i])}
+
+        _write_meta(tmp_dir, {
+            'version': CACHE_VERSION,
+            'source': _source_stat(filepath),
+            'columns': header,
+            'stored': stored,
+            'streaming': streaming,
+            'rows': rows,
+        })
+
+        final_dir = os.path.join(cache_root, digest)
+        if os.path.exists(final_dir):
+            # Stale layout from an older CACHE_VERSION
+            shutil.rmtree(final_dir, ignore_errors=True)
+        try:
+            os.replace(tmp_dir, final_dir)
+        except OSError:
+            # Another request built the same digest first; theirs is identical
+            pass
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def read_header(filepath):
+    """
+    Reads only the column names of a CSV/XLSX file.
+    """
+    if filepath.endswith('.csv'):
+        try:
+            return pd.read_csv(filepath, nrows=0).columns.tolist()
+        except UnicodeDecodeError:
+            return pd.read_csv(filepath, nrows=0, encoding='latin1').columns.tolist()
+    if filepath.endswith('.xlsx'):
+        # Only the first row is parsed in read-only mode
+        workbook = load_workbook(filepath, read_only=True, data_only=True)
+        try:
+            return excel_header(next(workbook.worksheets[0].iter_rows(values_only=True), ()))
+        finally:
+            workbook.close()
+    return pd.read_excel(filepath, nrows=0).columns.tolist()
+
+
+def _build_lock_path(cache_root, digest):
+    return os.path.join(cache_root, f'.{digest}.lock')
+
+
+def _take_build_lock(cache_root, digest):
+    """
+    Creates the entry's lock file. Returns its path, or None if another
+    process holds it.
+    """
+    os.makedirs(cache_root, exist_ok=True)
+    path = _build_lock_path(cache_root, digest)
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    with os.fdopen(fd, 'w') as f:
+        f.write(str(os.getpid()))
+    return path
+
+
+def _lock_owner_alive(path):
+    try:
+        with open(path) as f:
+            pid = int(f.read())
+    except FileNotFoundError:
+        return False
+    except ValueError:
+        # Created but the pid not written yet
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _wait_for_build(cache_root, digest):
+    """
+    Waits until the process building the entry releases its lock. A lock
+    left behind by a process that died is removed.
+    """
+    path = _build_lock_path(cache_root, digest)
+    while os.path.exists(path):
+        if not _lock_owner_alive(path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return
+        time.sleep(BUILD_LOCK_POLL_SECONDS)
+
+
+def _update_meta(cache_root, digest, update):
+    """
+    Applies update(meta) to an entry's meta.json under the entry's lock,
+    re-reading it first, so concurrent writers adding columns do not drop
+    each other's. Returns the merged meta.
+    """
+    lock = _take_build_lock(cache_root, digest)
+    while lock is None:
+        _wait_for_build(cache_root, digest)
+        lock = _take_build_lock(cache_root, digest)
+    try:
+        meta = _read_meta(cache_root, digest)
+        if meta is None:
+            raise KeyError(digest)
+        update(meta)
+        _write_meta(os.path.join(cache_root, digest), meta)
+    finally:
+        os.remove(lock)
+    return meta
+
+
+def ensure_cached(filepath, cache_root, digest=None, stream_threshold=None, content_digest=None):
+    """
+    Returns the digest of the file's current contents, creating its cache
+    entry if no valid one exists yet.
+
+    If a previous digest is passed and the file's size and mtime still match
+    what the cache recorded, the file is not re-hashed. A changed file gets a
+    new digest, so its old cache entry is never read again. A caller that
+    already knows the digest of the contents (store_upload computes it while
+    saving) passes it as content_digest, and the file is not hashed at all.
+
+    CSV files larger than stream_threshold bytes are cached in streaming mode
+    (header only, columns ingested in chunks on demand).
+
+    Only one process builds an entry: others asking for the same digest
+    meanwhile (e.g. the percentile job while the upload's ingest job is
+    still parsing) wait for it and use its entry instead of parsing the
+    file a second time.
+    """
+    stat = _source_stat(filepath)
+
+    if digest:
+        meta = _read_meta(cache_root, digest)
+        if meta and meta.get('source') == stat:
+            return digest
+
+    digest = content_digest or file_digest(filepath)
+    meta = _read_meta(cache_root, digest)
+    while meta is None:
+        lock = _take_build_lock(cache_root, digest)
+        if lock is None:
+            _wait_for_build(cache_root, digest)
+            meta = _read_meta(cache_root, digest)
+            continue
+        try:
+            # Built by the previous holder between our read and the lock
+            if _read_meta(cache_root, digest) is None:
+                streaming = (stream_threshold is not None and filepath.endswith('.csv')
+                             and stat['size'] > stream_threshold)
+                build_cache(filepath, cache_root, digest, streaming=streaming)
+        finally:
+            os.remove(lock)
+        return digest
+    if meta.get('source') != stat:
+        # Same contents saved again (or under another name): just refresh the stat
+        _update_meta(cache_root, digest, lambda meta: meta.update(source=stat))
+    return digest
+
+
+def is_current(filepath, cache_root, digest):
+    """
+    True if digest has a cache entry recorded for the file as it is now.
+    Never hashes or parses the file.
+    """
+    meta = _read_meta(cache_root, digest)
+    return meta is not None and meta.get('source') == _source_stat(filepath)
+
+
+def cached_columns(cache_root, digest):
+    """
+    Returns the column names of a cached dataset.
+    """
+    meta = _read_meta(cache_root, digest)
+    if meta is None:
+        raise KeyError(digest)
+    return meta['columns']
+
+
+def cached_rows(cache_root, digest):
+    """
+    Returns the row count of a cached dataset, or None if it is unknown
+    (not cached, or a streaming entry not read yet).
+    """
+    meta = _read_meta(cache_root, digest)
+    return meta and meta['rows']
+
+
+def _ingest_columns(cache_root, digest, meta, raw, numeric):
+    """
+    Streams missing columns of a streaming-mode entry into the cache: raw
+    columns as uploaded, numeric ones already cleaned (kind 'clean', kept in
+    meta['cleaned'] like the cleaned columns of parsed entries).
+    """
+    directory = os.path.join(cache_root, digest)
+    if not raw and not numeric and meta['rows'] is None:
+        # Nothing requested, but the row count is still unknown
+        raw = meta['columns'][:1]
+
+    arrays, rows = read_csv_columns(meta['source']['path'], [*raw, *numeric], numeric=numeric)
+
+    stored, cleaned = {}, {}
+    for col, values in arrays.items():
+        name = f"c{meta['columns'].index(col)}"
+        if col in numeric:
+            _save_array(directory, f'{name}.clean.npy', values)
+            cleaned[col] = f'{name}.clean'
+        else:
+            kind = _write_column(directory, name, values)
+            # Returned as later reads will return it
+            arrays[col] = _read_column(directory, name, kind)
+            stored[col] = {'file': name, 'kind': kind}
+
+    def update(meta):
+        meta['stored'].update(stored)
+        meta.setdefault('cleaned', {}).update(cleaned)
+        meta['rows'] = rows
+    meta.update(_update_meta(cache_root, digest, update))
+    return arrays
+
+
+def _clean_columns(cache_root, digest, meta, columns):
+    """
+    Stores cleaned float32 copies of text columns of a parsed entry (e.g.
+    K% as '11.3%') next to the originals, so every process maps the cleaned
+    values instead of parsing the text again. The originals stay as they
+    are for callers that want the raw column.
+    """
+    directory = os.path.join(cache_root, digest)
+    cleaned = {}
+    arrays = {}
+    for col in columns:
+        entry = meta['stored'][col]
+        raw = pd.Series(_read_column(directory, entry['file'], entry['kind']))
+        name = f"{entry['file']}.clean"
+        _save_array(directory, f'{name}.npy',
+                    clean_numeric_series(raw).to_numpy(dtype=np.float32, na_value=np.nan))
+        cleaned[col] = name
+        arrays[col] = _read_column(directory, name, 'clean')
+    meta.update(_update_meta(cache_root, digest, lambda meta: meta.setdefault('cleaned', {}).update(cleaned)))
+    return arrays
+
+
+@timed('load')
+def read_cached(cache_root, digest, columns=None, numeric=()):
+    """
+    Loads a cached dataset as a DataFrame.
+
+    Args:
+        cache_root (str): Cache directory.
+        digest (str): Content digest returned by ensure_cached.
+        columns (list, optional): Only load these columns. Unknown names are ignored.
+        numeric (iterable): Columns the caller only uses as numbers. These
+            come back cleaned by clean_numeric_series, as compact float32
+            arrays stored in the cache the first time they are asked for
+            (numeric columns already stored as numbers are returned as they
+            are). Other columns come back as uploaded, e.g. '11.3%', for
+            display.
+
+    Returns:
+        pd.DataFrame: The dataset, with the same columns as the parsed upload.
+    """
+    meta = _read_meta(cache_root, digest)
+    if meta is None:
+        raise KeyError(digest)
+
+    directory = os.path.join(cache_root, digest)
+    wanted = meta['columns'] if columns is None else [c for c in meta['columns'] if c in set(columns)]
+    numeric = set(numeric)
+
+    fresh = {}
+    if meta.get('streaming'):
+        cleaned = meta.get('cleaned', {})
+        raw = [col for col in wanted if col not in numeric and col not in meta['stored']]
+        clean = [col for col in wanted if col in numeric and col not in cleaned and col not in meta['stored']]
+        if raw or clean or meta['rows'] is None:
+            fresh = _ingest_columns(cache_root, digest, meta, raw, clean)
+
+    cleaned = meta.get('cleaned', {})
+    unclean = [col for col in wanted if col in numeric and col not in cleaned
+               and meta['stored'].get(col, {}).get('kind') in ('category', 'text')]
+    if unclean:
+        fresh.update(_clean_columns(cache_root, digest, meta, unclean))
+        cleaned = meta['cleaned']
+
+    data = {}
+    for col in wanted:
+        if col in fresh:
+            data[col] = fresh[col]
+        elif col in numeric and col in cleaned:
+            data[col] = _read_column(directory, cleaned[col], 'clean')
+        elif col in meta['stored']:
+            entry = meta['stored'][col]
+            data[col] = _read_column(directory, entry['file'], entry['kind'])
+
+    # copy=False keeps the memory-mapped columns as they are instead of
+    # consolidating them into new (private) blocks
+    return pd.DataFrame(data, index=pd.RangeIndex(meta['rows']), copy=False)
+
+
+def result_key(*parts):
+    """
+    Short stable key for a computed result, from JSON-serializable parts
+    (e.g. the mapping and peer grouping it was computed with).
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()[:24]
+
+
+@timed('store')
+def write_result(cache_root, digest, key, frame):
+    """
+    Stores a computed table (e.g. percentiles) next to the dataset it was
+    computed from, in the same one-.npy-per-column layout, so any process
+    can load it without recomputing.
+    """
+    results_dir = os.path.join(cache_root, digest, 'results')
+    os.makedirs(results_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix='.build-', dir=results_dir)
+    try:
+        columns = [str(c) for c in frame.columns]
+        stored = {col: {'file': f'c{i}', 'kind': _write_column(tmp_dir, f'c{i}', frame.iloc[:, i])}
+                  for i, col in enumerate(columns)}
+        _write_meta(tmp_dir, {'version': CACHE_VERSION, 'columns': columns, 'stored': stored,
+                              'rows': len(frame)})
+        try:
+            os.replace(tmp_dir, os.path.join(results_dir, key))
+        except OSError:
+            # Computed concurrently by another job; the results are identical
+            pass
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@timed('load')
+def read_result(cache_root, digest, key):
+    """
+    Loads a table stored by write_result, or returns None if there is none.
+    """
+    directory = os.path.join(cache_root, digest, 'results', key)
+    meta = _read_meta(os.path.join(cache_root, digest, 'results'), key)
+    if meta is None:
+        return None
+    data = {col: _read_column(directory, meta['stored'][col]['file'], meta['stored'][col]['kind'])
+            for col in meta['columns']}
+    return pd.DataFrame(data, columns=meta['columns'], index=pd.RangeIndex(meta['rows']), copy=False)
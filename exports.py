@@ -0,0 +1,142 @@
+import io
+
+import numpy as np
+
+# Rows converted per chunk. Memory use is bounded by one chunk, whatever
+# the size of the table.
+EXPORT_CHUNK_ROWS = 5_000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ParquetUnavailable(Exception):
+    """
+    Raised when a Parquet export is requested but pyarrow is not installed.
+    """
+
+
+def _chunks(frame, positions, chunk_rows):
+    for start in range(0, len(positions), chunk_rows):
+        yield frame.iloc[positions[start:start + chunk_rows]]
+
+
+def iter_csv(frame, positions, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Yields the rows of frame at positions as CSV text, header first.
+    Missing values are empty fields.
+    """
+    yield frame.iloc[:0].to_csv(index=False)
+    for chunk in _chunks(frame, positions, chunk_rows):
+        yield chunk.to_csv(index=False, header=False)
+
+
+def _widen_floats(chunk):
+    # float32 values (cached metrics) as the float64 of their shortest text,
+    # so 0.312 is written as 0.312 rather than 0.312000006437302
+    narrow = [col for col in chunk.columns if chunk[col].dtype == np.float32]
+    if not narrow:
+        return chunk
+    return chunk.astype({col: str for col in narrow}).astype({col: np.float64 for col in narrow})
+
+
+def iter_ndjson(frame, positions, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Yields the rows of frame at positions as JSON Lines, one object per
+    row. Missing values are null.
+    """
+    for chunk in _chunks(frame, positions, chunk_rows):
+        text = _widen_floats(chunk).to_json(orient='records', lines=True, double_precision=15)
+        yield text if text.endswith('\n') else text + '\n'
+
+
+class _ByteSink(io.RawIOBase):
+    """
+    Write-only file that keeps what was written until it is drained.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _parquet_schema(pa, frame):
+    # Fixed up front, so a chunk whose text column is all missing still matches
+    # Object and categorical columns are text; nullable integer columns
+    # (percentiles) keep their small integer type
+    fields = []
+    for col in frame.columns:
+        dtype = frame[col].dtype
+        arrow_type = pa.string() if dtype.kind == 'O' else pa.from_numpy_dtype(getattr(dtype, 'numpy_dtype', dtype))
+        fields.append(pa.field(str(col), arrow_type))
+    return pa.schema(fields)
+
+
+def _as_text(values):
+    # Object columns can mix strings with numbers (raw upload values)
+    return [None if value is None or value != value else str(value) for value in values]
+
+
+def _column_values(series, arrow_type, pa):
+    if arrow_type == pa.string():
+        return _as_text(series)
+    # Nullable integer arrays convert themselves, with their NAs as nulls
+    return series.array if hasattr(series.dtype, 'numpy_dtype') else series.to_numpy()
+
+
+def iter_parquet(frame, positions, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Yields the rows of frame at positions as a Parquet file, one row group
+    per chunk. Requires pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(pa, frame)
+    sink = _ByteSink()
+    with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema) as writer:
+        for chunk in _chunks(frame, positions, chunk_rows):
+            arrays = [pa.array(_column_values(chunk[col], field.type, pa), type=field.type)
+                      for col, field in zip(chunk.columns, schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def export_rows(frame, positions, fmt, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Returns a generator of the export in the given format ('csv', 'ndjson'
+    or 'parquet'). Raises ParquetUnavailable up front, before any row is sent.
+    """
+    positions = np.asarray(positions)
+    if fmt == 'csv':
+        return iter_csv(frame, positions, chunk_rows)
+    if fmt == 'ndjson':
+        return iter_ndjson(frame, positions, chunk_rows)
+    if fmt == 'parquet':
+        # pyarrow is optional; checked here so the error is not raised mid-response
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ParquetUnavailable('Parquet export needs pyarrow (pip install pyarrow).')
+        return iter_parquet(frame, positions, chunk_rows)
+    raise ValueError(f'Unknown export format: {fmt}')
@@ -0,0 +1,36 @@
+# Production server settings:  gunicorn -c gunicorn.conf.py app:app
+#
+# Memory budget on the 256 MB VM (see Memory Budget in the README): the
+# master with the preloaded app is about 30 MB, a warmed-up worker about
+# 60 MB more plus up to RESULT_CACHE_BYTES (48 MB) of cached tables, and its
+# job process about 75 MB. So one worker with one job process
+# (FLASK_JOB_WORKERS=1) fits, two do not. Requests are served concurrently by
+# threads of that worker; pages mostly wait on files and NumPy, which release
+# the GIL.
+#
+# On a larger VM add workers with WEB_CONCURRENCY. Cached columns and stored
+# percentile tables are memory-mapped (see datastore.py), so workers share one
+# copy of them through the page cache instead of each loading its own.
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+# Import the app once before forking. app.py itself is light; pandas, NumPy
+# and openpyxl are loaded by each worker in the background once it is up
+# (see post_fork), so a cold start serves its first request without waiting
+# for them. Job pools are only started on first use, in each worker.
+preload_app = True
+
+# Large uploads can take a while to arrive
+timeout = 120
+
+# Worker heartbeats on tmpfs; a disk-backed /tmp can stall them in containers
+worker_tmp_dir = '/dev/shm'
+
+
+def post_fork(server, worker):
+    # A thread started in the master would not survive the fork
+    from app import warm_up
+    warm_up()
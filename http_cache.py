@@ -0,0 +1,94 @@
+import gzip
+import hashlib
+import json
+import os
+
+# Responses of these types are gzipped when the client accepts it. Images
+# (JPEG, PNG) are already compressed and are left alone.
+COMPRESSIBLE_TYPES = {'text/html', 'text/css', 'text/plain', 'text/csv', 'application/json',
+                      'application/javascript', 'application/x-ndjson'}
+
+# Below this size the gzip header and CPU time are not worth it
+MIN_COMPRESS_BYTES = 1024
+
+# Static assets requested with a version (see static_version) never change
+# under that URL
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Gzipped static files, keyed by (filename, etag): compressed once per process
+_static_gzip = {}
+
+
+def etag_for(*parts):
+    """
+    ETag value for a response fully determined by JSON-serializable parts
+    (e.g. the dataset digest, mapping, weights and table view).
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+
+def files_version(*directories):
+    """
+    Short version string that changes whenever a file in the directories is
+    added, removed or modified (e.g. templates, so a deploy invalidates ETags).
+    """
+    stats = []
+    for directory in directories:
+        for name in sorted(os.listdir(directory)):
+            st = os.stat(os.path.join(directory, name))
+            stats.append((directory, name, st.st_size, st.st_mtime_ns))
+    return etag_for(stats)[:12]
+
+
+def file_version(path):
+    """
+    Short content hash of one file, for cache-busting static URLs.
+    """
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+def accepts_gzip(request):
+    return 'gzip' in request.accept_encodings and request.accept_encodings['gzip'] > 0
+
+
+def compress_response(response, request, level=6):
+    """
+    Gzips a response in place if the client accepts gzip and the body is a
+    compressible type of at least MIN_COMPRESS_BYTES. Streamed responses,
+    partial content and already encoded bodies are left as they are.
+
+    Static files are compressed once and reused (they are keyed by their ETag).
+    """
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    # send_file responses count as streamed too, but their file can be read
+    streamed = response.is_streamed and not response.direct_passthrough
+    if (not accepts_gzip(request) or response.status_code != 200 or streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_BYTES:
+        return response
+
+    etag, _ = response.get_etag()
+    static_key = (request.path, etag) if request.endpoint == 'static' and etag else None
+    body = _static_gzip.get(static_key) if static_key else None
+    if body is None:
+        body = gzip.compress(data, compresslevel=level, mtime=0)
+        if static_key:
+            _static_gzip[static_key] = body
+
+    response.set_data(body)
+    response.headers['Content-Encoding'] = 'gzip'
+    if etag:
+        # Same content, different bytes: the ETag stays valid for revalidation
+        # but can no longer be a strong one
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,263 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import start_recording, stop_recording
+from profiling import save_profile, start_profiler
+
+# Job states; the last three are final
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+
+# Unfinished jobs not updated for this long are assumed lost (e.g. the
+# server restarted) and no longer count against the queue limit
+STALE_SECONDS = 3600
+
+# Finished job records are removed after this long
+KEEP_SECONDS = 24 * 3600
+
+
+class QueueFull(Exception):
+    """
+    Raised by JobManager.submit when max_pending jobs are already waiting or running.
+    """
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job by JobContext.check once cancellation was requested.
+    """
+
+
+def _state_path(state_dir, job_id):
+    return os.path.join(state_dir, f'{job_id}.json')
+
+
+def _cancel_path(state_dir, job_id):
+    # A separate marker file, so a cancel request can never be lost to a
+    # concurrent progress update of the state file
+    return os.path.join(state_dir, f'{job_id}.cancel')
+
+
+def _timed_path(state_dir, job_id):
+    # Created by the first process that reports the job's stage timings
+    return os.path.join(state_dir, f'{job_id}.timed')
+
+
+def read_state(state_dir, job_id):
+    """
+    Returns a job's state dict, or None if the job is unknown.
+    """
+    try:
+        with open(_state_path(state_dir, job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(state_dir, state):
+    state['updated'] = time.time()
+    fd, tmp = tempfile.mkstemp(prefix=state['id'], suffix='.tmp', dir=state_dir)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, _state_path(state_dir, state['id']))
+
+
+def _update_state(state_dir, job_id, **changes):
+    state = read_state(state_dir, job_id)
+    if state is None:
+        return None
+    # A job cancelled before it started stays cancelled
+    if state['status'] in FINAL_STATES:
+        return state
+    state.update(changes)
+    _write_state(state_dir, state)
+    return state
+
+
+class JobContext:
+    """
+    Handed to a running job: reports progress and lets it stop early when
+    cancelled. Long jobs should call check() between steps.
+    """
+
+    def __init__(self, state_dir, job_id):
+        self.state_dir = state_dir
+        self.job_id = job_id
+
+    def check(self):
+        if os.path.exists(_cancel_path(self.state_dir, self.job_id)):
+            raise JobCancelled(self.job_id)
+
+    def progress(self, message):
+        self.check()
+        _update_state(self.state_dir, self.job_id, progress=message)
+
+
+def _run(state_dir, job_id, func, args, kwargs, profile=None):
+    """
+    Runs one job in a pool process (or inline) and records its outcome.
+    With profile (save_profile arguments), the job runs under cProfile.
+    """
+    ctx = JobContext(state_dir, job_id)
+    # Stage timings (metrics.stage) of the job, kept with its final state
+    token = start_recording()
+    profiler = start_profiler() if profile else None
+    try:
+        ctx.check()
+        _update_state(state_dir, job_id, status=RUNNING, started=time.time())
+        result = func(ctx, *args, **kwargs)
+        ctx.check()
+    except JobCancelled:
+        outcome = {'status': CANCELLED}
+    except Exception as e:
+        outcome = {'status': FAILED, 'error': f'{type(e).__name__}: {e}'}
+    else:
+        outcome = {'status': DONE, 'result': result}
+    finally:
+        # Written before the final state, so a finished job's profile is on disk
+        if profiler is not None:
+            try:
+                save_profile(profiler, **profile)
+            except OSError:
+                pass
+    _update_state(state_dir, job_id, finished=time.time(), timings=stop_recording(token), **outcome)
+
+
+class JobManager:
+    """
+    Runs slow work (parsing, ranking) in a local process pool so request
+    handlers return at once with a job ID.
+
+    Job state lives in one JSON file per job under state_dir, written
+    atomically, so any server process can report on or cancel a job another
+    process submitted. At most max_pending jobs may be queued or running
+    across all processes sharing state_dir; submit raises QueueFull beyond that.
+
+    With workers=0 jobs run inline inside submit (useful for tests and the
+    single-process dev server).
+    """
+
+    def __init__(self, state_dir, workers=2, max_pending=8):
+        self.state_dir = state_dir
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._futures = {}
+        # Request threads submitting at once start one pool, not several
+        self._lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a server process that may have threads is unsafe
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _states(self):
+        for name in os.listdir(self.state_dir):
+            if name.endswith('.json'):
+                state = read_state(self.state_dir, name[:-len('.json')])
+                if state is not None:
+                    yield state
+
+    def pending(self):
+        """
+        Number of live queued or running jobs across all processes. Old
+        finished records are removed along the way.
+        """
+        now = time.time()
+        count = 0
+        for state in self._states():
+            if state['status'] in FINAL_STATES:
+                if now - state['updated'] > KEEP_SECONDS:
+                    for path in (_state_path(self.state_dir, state['id']),
+                                 _cancel_path(self.state_dir, state['id']),
+                                 _timed_path(self.state_dir, state['id'])):
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+            elif now - state['updated'] < STALE_SECONDS:
+                count += 1
+        return count
+
+    def submit(self, kind, func, *args, profile=None, **kwargs):
+        """
+        Queues func(ctx, *args, **kwargs) and returns the new job's ID.
+
+        func must be a module-level function and its arguments and return
+        value JSON/pickle-friendly; the return value is stored as the job's result.
+        profile: keyword arguments of profiling.save_profile (folder, route,
+        tags, retention) to run the job under cProfile, or None.
+        """
+        if self.pending() >= self.max_pending:
+            raise QueueFull(f'{self.max_pending} jobs are already queued or running')
+
+        job_id = uuid.uuid4().hex
+        _write_state(self.state_dir, {
+            'id': job_id, 'kind': kind, 'status': QUEUED, 'progress': 'Queued',
+            'created': time.time(), 'result': None, 'error': None,
+        })
+        if self.workers == 0:
+            _run(self.state_dir, job_id, func, args, kwargs, profile)
+        else:
+            future = self._pool().submit(_run, self.state_dir, job_id, func, args, kwargs, profile)
+            self._futures[job_id] = future
+            future.add_done_callback(lambda _: self._futures.pop(job_id, None))
+        return job_id
+
+    def status(self, job_id):
+        """
+        Returns the job's state dict (id, kind, status, progress, result,
+        error, timestamps), or None if unknown.
+        """
+        state = read_state(self.state_dir, job_id)
+        if state is not None and state['status'] == RUNNING and os.path.exists(
+                _cancel_path(self.state_dir, job_id)):
+            state['progress'] = 'Cancelling'
+        return state
+
+    def take_timings(self, job_id):
+        """
+        Returns a finished job's stage timings ({stage: seconds}) to the
+        first caller in any process, and None after that, so that metrics
+        count each job once however many processes report on it.
+        """
+        state = read_state(self.state_dir, job_id)
+        if state is None or state['status'] not in FINAL_STATES or not state.get('timings'):
+            return None
+        try:
+            os.close(os.open(_timed_path(self.state_dir, job_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return None
+        return state['timings']
+
+    def cancel(self, job_id):
+        """
+        Requests cancellation. A queued job never starts; a running job stops
+        at its next check(). Returns False if the job is unknown or finished.
+        """
+        state = read_state(self.state_dir, job_id)
+        if state is None or state['status'] in FINAL_STATES:
+            return False
+        open(_cancel_path(self.state_dir, job_id), 'w').close()
+        future = self._futures.get(job_id)
+        if state['status'] == QUEUED or (future is not None and future.cancel()):
+            _update_state(self.state_dir, job_id, status=CANCELLED, finished=time.time())
+        return True
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
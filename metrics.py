@@ -0,0 +1,179 @@
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds in seconds, from a sliced page to a full
+# parse of a large upload
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage timings of the request or job running in this context, or None when
+# nothing is being recorded (stage() then costs one lookup)
+_timings = contextvars.ContextVar('timings', default=None)
+
+
+def start_recording():
+    """
+    Starts collecting stage timings in the current context. Returns a token
+    for stop_recording.
+    """
+    return _timings.set({})
+
+
+def stop_recording(token):
+    """
+    Stops collecting and returns {stage: seconds}, summed per stage.
+    """
+    timings = _timings.get()
+    _timings.reset(token)
+    return timings or {}
+
+
+def add_timing(name, seconds):
+    """
+    Adds seconds to a stage of the current recording, if there is one.
+    """
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    """
+    Times the enclosed block as one pipeline stage (e.g. 'parse', 'clean',
+    'rank'). Repeated stages in one request add up. Does nothing unless a
+    recording was started.
+    """
+    if _timings.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """
+    Decorator: every call of the function is timed as stage `name`.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _timings.get() is None:
+                return func(*args, **kwargs)
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def server_timing(timings):
+    """
+    Server-Timing header value for {stage: seconds} (durations in ms).
+    """
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items())
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram of durations, as Prometheus expects them.
+    """
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def samples(self):
+        """
+        Yields (le, cumulative count) for every bucket and +Inf.
+        """
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield repr(float(bound)), total
+        yield '+Inf', self.count
+
+
+class MetricsRegistry:
+    """
+    Process-wide histograms, keyed by metric name and labels. Each server
+    process keeps its own; Prometheus adds them up across the scraped targets.
+    """
+
+    def __init__(self):
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, help='', **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+                self._help.setdefault(name, help)
+            histogram.observe(value)
+
+    def observe_timings(self, timings, **labels):
+        """
+        Observes {stage: seconds} into the stage histogram.
+        """
+        for name, seconds in timings.items():
+            self.observe('savant_stage_seconds', seconds, 'Time spent in each pipeline stage.', stage=name, **labels)
+
+    def render(self):
+        """
+        Prometheus text exposition format (version 0.0.4) of all histograms.
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(self._help):
+                lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, labels), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    pairs = [f'{key}={_quote(value)}' for key, value in labels]
+                    for le, count in histogram.samples():
+                        lines.append(f'{name}_bucket{_labels(pairs + ["le=" + _quote(le)])} {count}')
+                    lines.append(f'{name}_sum{_labels(pairs)} {histogram.sum!r}')
+                    lines.append(f'{name}_count{_labels(pairs)} {histogram.count}')
+        return ''.join(line + '\n' for line in lines)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._help.clear()
+
+
+def render_value(name, kind, help, value):
+    """
+    Prometheus text lines for a single unlabelled gauge or counter.
+    """
+    return f'# HELP {name} {help}\n# TYPE {name} {kind}\n{name} {value}\n'
+
+
+def _labels(pairs):
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _quote(value):
+    text = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'"{text}"'
+
+
+REGISTRY = MetricsRegistry()
@@ -1,215 +1,755 @@
-import pandas as pd
-import numpy as np
-import io
-
-# Standard Target Metrics
-TARGET_METRICS = [
-    "xwOBA",
-    "xBA",
-    "xSLG",
-    "xISO",
-    "xOBP",
-    "Brl",
-    "Brl%",
-    "EV",
-    "Max EV",
-    "HardHit%",
-    "K%",
-    "BB%",
-    "Whiff%",
-    "Chase%",
-    "Speed",
-    "OAA",
-    "Arm Strength",
-    "Bat Speed",
-    "Squared-up Rate",
-    "Swing Length",
-    "Contact%"
-]
-
-# Metrics where Lower is Better (so we invert the rank)
-LOWER_IS_BETTER = [
-    "K%",
-    "Chase%",
-    "Whiff%",
-    "Swing Length"
-]
-
-def load_data(file_storage):
-    """
-    Loads data from a Flask FileStorage object (CSV or XLSX).
-    """
-    filename = file_storage.filename
-    if filename.endswith('.csv'):
-        # Try reading with default utf-8, then latin1 if that fails
-        try:
-            df = pd.read_csv(file_storage)
-        except UnicodeDecodeError:
-            file_storage.seek(0)
-            df = pd.read_csv(file_storage, encoding='latin1')
-    elif filename.endswith(('.xls', '.xlsx')):
-        df = pd.read_excel(file_storage)
-    else:
-        raise ValueError("Unsupported file format. Please upload CSV or XLSX.")
-    return df
-
-def clean_data(df):
-    """
-    Basic cleaning: remove empty rows/cols if necessary.
-    For now, we just return the df as is, assuming the user wants to map columns first.
-    """
-    return df
-
-def clean_numeric_series(series):
-    """
-    Cleans a pandas Series to ensure it's numeric.
-    Handles strings with %, mph, whitespace, etc.
-    """
-    # If already numeric, just coerce to handle mixed types if any
-    if pd.api.types.is_numeric_dtype(series):
-        return pd.to_numeric(series, errors='coerce')
-        
-    # Convert to string, strip whitespace
-    s = series.astype(str).str.strip()
-    
-    # Remove common units
-    s = s.str.replace('%', '', regex=False)
-    s = s.str.replace('mph', '', regex=False, case=False)
-    s = s.str.replace('ft', '', regex=False, case=False)
-    
-    return pd.to_numeric(s, errors='coerce')
-
-def calculate_percentiles(df, mapping):
-    """
-    Calculates 1-100 percentile ranks for the mapped metrics.
-    
-    Args:
-        df (pd.DataFrame): The raw dataframe.
-        mapping (dict): Dictionary mapping 'Standard Metric' -> 'User Column'.
-    
-    Returns:
-        pd.DataFrame: DataFrame with Player Name and Percentile Ranks.
-    """
-    # 1. Create a new DF with just the mapped columns
-    # We assume 'Player Name' is also mapped or we need to ask for it.
-    # For MVP, let's assume the user selects a column for 'Player Name' too, 
-    # or we just keep all columns and append ranks?
-    # The requirement says: "output a single... table displaying the list of players and their final... Percentile Ranks"
-    # So we need a Player Name column. I'll add that to the mapping requirement.
-    
-    result_df = pd.DataFrame()
-    
-    # Handle Player Name
-    player_col = mapping.get('Player Name')
-    if player_col and player_col in df.columns:
-        result_df['Player Name'] = df[player_col]
-    else:
-        # If no player name mapped, use index or a default
-        result_df['Player Name'] = df.index.astype(str)
-
-    for metric in TARGET_METRICS:
-        user_col = mapping.get(metric)
-        if not user_col or user_col not in df.columns:
-            # If not mapped, fill with N/A
-            result_df[metric] = np.nan
-            continue
-        
-        # 2. Type Enforcement: Robust cleaning
-        series = clean_numeric_series(df[user_col])
-        
-        # 3. Percentile Calculation
-        # We need 1-100.
-        # pd.rank(pct=True) gives 0.0 to 1.0. 
-        # We multiply by 100.
-        # We want strict 1-100 integers.
-        # Handling NaNs: rank() automatically skips NaNs (assigns NaN).
-        
-        if metric in LOWER_IS_BETTER:
-            # Lower is better: Rank Descending (Ascending=False)
-            # Example: K%. Lowest K% gets highest rank (100).
-            # So we rank ascending=False.
-            # 1% K% -> Rank 1 (Best) -> Wait.
-            # "Lowest K% should receive the 99th or 100th percentile rank"
-            # So Lowest Value = High Percentile.
-            # If we use rank(ascending=False), the Highest Value gets Rank 1 (low percentile). 
-            # The Lowest Value gets Rank N (high percentile).
-            # Let's verify: [10, 20, 30]. rank(ascending=False) -> 10 is 3rd, 20 is 2nd, 30 is 1st.
-            # pct=True: 10 is 1.0 (100%), 30 is 0.33.
-            # So yes, ascending=False gives the lowest value the highest percentile.
-            ranks = series.rank(pct=True, ascending=False)
-        else:
-            # Higher is better: Rank Ascending.
-            # Highest Value = High Percentile.
-            ranks = series.rank(pct=True, ascending=True)
-            
-        # Convert to 1-100 scale
-        # rank(pct=True) can return e.g. 0.5. * 100 = 50.
-        # We want integers. Round or Ceil?
-        # Usually percentiles are 1-99 or 1-100.
-        # Let's use round(decimals=0).
-        # Also handle the case where rank is NaN.
-        
-        result_df[metric] = (ranks * 100).round(0)
-        
-    return result_df
-
-def calculate_synthetic_xwoba(df, mapping, weights=None):
-    """
-    Calculates a Synthetic xwOBA based on available metrics.
-    Formula:
-    Base (Default 0.280) 
-    + (BB% * w_bb) 
-    - (K% * w_k) 
-    + ((Max EV - 75) / 35 * w_power) 
-    + ((Contact% - 70) * w_contact)
-    
-    All inputs are expected to be 0-100 scale (e.g. 10.5 for 10.5%).
-    """
-    # Default weights
-    if weights is None:
-        weights = {
-            'w_bb': 0.7,
-            'w_k': 0.7,
-            'w_power': 0.25,
-            'w_contact': 0.2,
-            'base_woba': 0.280
-        }
-        
-    # Create a copy to avoid SettingWithCopy warnings on the original df
-    res = pd.DataFrame(index=df.index)
-    
-    # Helper to get series or 0
-    def get_series(metric_name):
-        col = mapping.get(metric_name)
-        if col and col in df.columns:
-            return clean_numeric_series(df[col]).fillna(0)
-        return pd.Series(0, index=df.index)
-
-    bb_pct = get_series('BB%')
-    k_pct = get_series('K%')
-    max_ev = get_series('Max EV')
-    contact_pct = get_series('Contact%') 
-    
-    # Formula components
-    base_woba = float(weights.get('base_woba', 0.280))
-    w_bb = float(weights.get('w_bb', 0.7))
-    w_k = float(weights.get('w_k', 0.7))
-    w_power = float(weights.get('w_power', 0.25))
-    w_contact = float(weights.get('w_contact', 0.2))
-    
-    # BB Contribution
-    bb_val = (bb_pct / 100.0) * w_bb
-    
-    # K Penalty
-    k_val = (k_pct / 100.0) * w_k
-    
-    # Power: Max EV
-    power_val = ((max_ev - 75) / 35.0) * w_power
-    
-    # Contact
-    # Normalize to 0-1 scale: 70% = 0, 100% = 1
-    contact_val = ((contact_pct - 70) / 30.0) * w_contact
-    
-    syn_xwoba = base_woba + bb_val - k_val + power_val + contact_val
-    
-    return syn_xwoba
+import pandas as pd
+import numpy as np
+import io
+from openpyxl import load_workbook
+from pandas.io.parsers import TextParser
+
+from constants import TARGET_METRICS, LOWER_IS_BETTER, SYNTHETIC_COMPONENTS, SYNTHETIC_WEIGHT_KEYS, DEFAULT_WEIGHTS
+from metrics import timed
+
+@timed('parse')
+def load_data(source):
+    """
+    Loads data from a file path or a Flask FileStorage object (CSV or XLSX).
+    """
+    filename = getattr(source, 'filename', source)
+    if filename.endswith('.csv'):
+        # Try reading with default utf-8, then latin1 if that fails
+        try:
+            df = pd.read_csv(source)
+        except UnicodeDecodeError:
+            if hasattr(source, 'seek'):
+                source.seek(0)
+            df = pd.read_csv(source, encoding='latin1')
+    elif filename.endswith('.xlsx'):
+        df = read_xlsx(source)
+    elif filename.endswith('.xls'):
+        df = pd.read_excel(source)
+    else:
+        raise ValueError("Unsupported file format. Please upload CSV or XLSX.")
+    return df
+
+def excel_header(cells):
+    """
+    Column names for a worksheet's first row, named like pd.read_excel does:
+    blank cells become 'Unnamed: <i>' and repeats get '.1', '.2', ...
+    (skipping suffixes already taken by other columns).
+    """
+    names = [f'Unnamed: {i}' if cell is None else str(cell) for i, cell in enumerate(cells)]
+    counts = {}
+    for i, name in enumerate(names):
+        original = name
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[original] = count + 1
+            name = f'{original}.{count}'
+            count = count + 1 if name in names else counts.get(name, 0)
+        names[i] = name
+        counts[name] = count + 1
+    return names
+
+def read_xlsx(source, chunk_rows=20_000):
+    """
+    Reads the first sheet of an .xlsx workbook, streaming its rows.
+
+    openpyxl's read-only mode parses the sheet XML row by row, and every
+    chunk_rows rows the cell values are converted to typed columns with
+    pandas' own TextParser (the same NA and number handling as
+    pd.read_excel). At most one chunk of Python cell values is alive at a
+    time, where pd.read_excel keeps every cell of the sheet until the end.
+
+    Returns:
+        pd.DataFrame: Same frame as pd.read_excel(source).
+    """
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        # Don't trust (or, if missing, compute with a second full pass) the
+        # sheet's stored dimensions; short rows are padded below
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        columns = excel_header(header)
+        width = len(columns)
+        parts = []
+        chunk = []
+        blank = 0
+
+        def flush():
+            part = TextParser(chunk, names=columns[:width], header=None, skip_blank_lines=False).read()
+            for col in part.columns[(part.dtypes == np.float64).to_numpy()]:
+                # read_excel turns whole-number floats into ints
+                values = part[col].to_numpy()
+                if not np.isnan(values).any() and (values == np.trunc(values)).all():
+                    part[col] = values.astype(np.int64)
+            parts.append(part)
+            chunk.clear()
+
+        for row in rows:
+            if all(value is None for value in row):
+                # Blank rows are kept unless they trail the data
+                blank += 1
+                continue
+            chunk.extend([''] * width for _ in range(blank))
+            blank = 0
+            if len(row) > width:
+                # Cells beyond the header get unnamed columns, as in read_excel;
+                # earlier chunks get NaN there when the chunks are concatenated
+                columns = excel_header(list(header) + [None] * (len(row) - len(header)))
+                for pending in chunk:
+                    pending.extend([''] * (len(columns) - width))
+                width = len(columns)
+            # Empty cells are '' so TextParser treats them as NA
+            chunk.append(['' if value is None else value for value in row] + [''] * (width - len(row)))
+            if len(chunk) >= chunk_rows:
+                flush()
+        if chunk:
+            flush()
+    finally:
+        workbook.close()
+
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(parts, ignore_index=True)
+    if len(df.columns) > len(parts[0].columns):
+        # Columns added partway through: concat fills earlier chunks with None
+        # in object columns, read_excel with NaN
+        for col in df.columns[len(parts[0].columns):]:
+            if df[col].dtype == object:
+                values = df[col].to_numpy()
+                values[pd.isna(values)] = np.nan
+                df[col] = values
+    return df
+
+@timed('parse')
+def read_csv_columns(filepath, columns, numeric=(), chunksize=100_000):
+    """
+    Streams a CSV in chunks, keeping only the requested columns.
+
+    Columns listed in `numeric` are cleaned chunk by chunk into float32
+    arrays; the rest are read as text (dtype=str, no type inference). Only one
+    chunk of raw rows is alive at a time, so peak memory grows with
+    len(columns) x rows rather than with the width of the file.
+
+    Returns:
+        tuple: (dict column -> np.ndarray, number of rows)
+    """
+    usecols = list(dict.fromkeys(columns))
+    dtype = {col: str for col in usecols if col not in numeric}
+
+    def stream(encoding):
+        parts = {col: [] for col in usecols}
+        reader = pd.read_csv(filepath, usecols=usecols, dtype=dtype, chunksize=chunksize,
+                             encoding=encoding)
+        with reader:
+            for chunk in reader:
+                for col in usecols:
+                    if col in numeric:
+                        values = clean_numeric_series(chunk[col]).to_numpy(dtype=np.float32, na_value=np.nan)
+                    else:
+                        values = chunk[col].to_numpy(dtype=object)
+                    parts[col].append(values)
+        return parts
+
+    # Same encoding fallback as load_data
+    try:
+        parts = stream('utf-8')
+    except UnicodeDecodeError:
+        parts = stream('latin1')
+
+    arrays = {}
+    for col, chunks in parts.items():
+        if chunks:
+            arrays[col] = np.concatenate(chunks)
+        else:
+            arrays[col] = np.empty(0, dtype=np.float32 if col in numeric else object)
+    rows = len(next(iter(arrays.values()))) if arrays else 0
+    return arrays, rows
+
+def clean_data(df):
+    """
+    Basic cleaning: remove empty rows/cols if necessary.
+    For now, we just return the df as is, assuming the user wants to map columns first.
+    """
+    return df
+
+# Units stripped from numeric text, in the order they are removed
+NUMERIC_UNITS = ['%', 'mph', 'ft']
+
+# Bytes that can appear in a number once units are gone: digits, sign,
+# decimal point, exponent, whitespace and NUL padding. Anything else makes
+# the value missing, including the words nan, NA and inf: text never parses
+# to an infinite stat (see _finite).
+_NUMBER_BYTES = np.zeros(256, dtype=bool)
+_NUMBER_BYTES[np.frombuffer(b'0123456789.+-eE \t\n\r\x0b\x0c\x00', dtype=np.uint8)] = True
+_BLANK_BYTES = np.zeros(256, dtype=bool)
+_BLANK_BYTES[np.frombuffer(b' \t\n\r\x0b\x0c\x00', dtype=np.uint8)] = True
+_DIGIT_BYTES = np.zeros(256, dtype=bool)
+_DIGIT_BYTES[np.frombuffer(b'0123456789', dtype=np.uint8)] = True
+_LETTER_BYTES = np.zeros(256, dtype=bool)
+_LETTER_BYTES[np.frombuffer(b'eE', dtype=np.uint8)] = True
+_SIGN_BYTES = np.zeros(256, dtype=bool)
+_SIGN_BYTES[np.frombuffer(b'+-', dtype=np.uint8)] = True
+
+# Widest text (in bytes) handled by the byte-matrix parser
+_MAX_NUMBER_WIDTH = 64
+
+def _strip_unit(chars, unit):
+    """
+    Deletes every case-insensitive occurrence of unit from each row of a
+    (rows, width) uint8 character matrix, in place. Returns True if any
+    occurrence was found.
+    """
+    k = len(unit)
+    n, width = chars.shape
+    if width < k:
+        return False
+
+    # OR-ing 0x20 lower-cases ASCII letters without touching '%'
+    lowered = chars | 0x20 if unit.isalpha() else chars
+    hit = np.ones((n, width - k + 1), dtype=bool)
+    for i, ch in enumerate(unit.encode()):
+        hit &= lowered[:, i:width - k + 1 + i] == ch
+    if not hit.any():
+        return False
+
+    # None of the units can overlap itself, so every hit is removed
+    if k == 1:
+        drop = hit
+    else:
+        drop = np.zeros(chars.shape, dtype=bool)
+        for i in range(k):
+            drop[:, i:width - k + 1 + i] |= hit
+    chars[drop] = 0
+
+    # Usually the unit ended the text and zeroing it is enough (trailing NULs
+    # are padding). Rows with text after the unit need it shifted left.
+    present = chars != 0
+    gapped = (present[:, 1:] & ~present[:, :-1]).any(axis=1)
+    if gapped.any():
+        sub = chars[gapped]
+        keep = sub != 0
+        target = np.cumsum(keep, axis=1) - 1
+        rows = np.nonzero(keep)[0]
+        kept = sub[keep]
+        sub[:] = 0
+        sub[rows, target[keep]] = kept
+        chars[gapped] = sub
+    return True
+
+def _parse_numeric_text(series):
+    """
+    Fallback for text the byte parser can't take (non-ASCII or very wide):
+    strip whitespace and units with string methods, then to_numeric.
+    """
+    s = series.astype(str).str.strip()
+
+    unit = None
+    for candidate in NUMERIC_UNITS:
+        stripped = s.str.replace(candidate, '', regex=False, case=False)
+        if unit is None and not stripped.equals(s):
+            unit = candidate
+        s = stripped
+
+    return _finite(pd.to_numeric(s, errors='coerce').astype(np.float64)), unit
+
+def _finite(values):
+    # 'inf' and 'Infinity' are not stats: text that spells them is missing
+    values[np.isinf(values)] = np.nan
+    return values
+
+def _coerce(raw):
+    return pd.to_numeric(pd.Series(raw.astype(str)), errors='coerce').to_numpy(dtype=np.float64)
+
+def _parse_odd_rows(raw, chars):
+    """
+    Parses a byte column the C-level cast rejected. Rows with an exponent, no
+    digit, or more than one decimal point or sign go through pd.to_numeric;
+    the rest are still cast in one go.
+    """
+    odd = (_LETTER_BYTES[chars].any(axis=1) | ~_DIGIT_BYTES[chars].any(axis=1)
+           | ((chars == ord('.')).sum(axis=1) > 1) | (_SIGN_BYTES[chars].sum(axis=1) > 1))
+    result = np.empty(len(raw), dtype=np.float64)
+    result[odd] = _coerce(raw[odd])
+    try:
+        result[~odd] = raw[~odd].astype(np.float64)
+    except ValueError:
+        # Misplaced signs or inner spaces ('5-3', '1 2')
+        result[~odd] = _coerce(raw[~odd])
+    return result
+
+def parse_numeric_series(series):
+    """
+    Unit-aware numeric parser behind clean_numeric_series.
+
+    Text is encoded once into a fixed-width byte matrix. Units are then
+    removed and values validated with whole-column array operations, and
+    numpy parses every value in one C-level cast. Handles '11.3%',
+    '98.5 mph', ' 6.1ft ', leading-dot decimals like '.544', and blanks.
+
+    Returns:
+        tuple: (float Series aligned with the input, the unit that was
+        stripped: '%', 'mph', 'ft' or None; the first of NUMERIC_UNITS found
+        if several were)
+    """
+    # If already numeric, just coerce to handle mixed types if any
+    if pd.api.types.is_numeric_dtype(series):
+        return pd.to_numeric(series, errors='coerce'), None
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Cached text columns are categoricals: each distinct text is parsed once
+        parsed, unit = parse_numeric_series(pd.Series(series.cat.categories))
+        codes = series.cat.codes.to_numpy()
+        result = parsed.to_numpy(dtype=np.float64, na_value=np.nan)[codes]
+        result[codes < 0] = np.nan
+        return pd.Series(result, index=series.index, name=series.name), unit
+
+    values = series.to_numpy(dtype=object)
+    try:
+        # Floats, ints and None come through as their str() text, like astype(str)
+        raw = values.astype('S')
+    except UnicodeEncodeError:
+        return _parse_numeric_text(series)
+    if raw.dtype.itemsize > _MAX_NUMBER_WIDTH:
+        return _parse_numeric_text(series)
+
+    chars = raw.view(np.uint8).reshape(len(raw), raw.dtype.itemsize)
+
+    unit = None
+    for candidate in NUMERIC_UNITS:
+        if _strip_unit(chars, candidate) and unit is None:
+            unit = candidate
+
+    # Anything with other characters, or nothing but whitespace, is missing
+    missing = ~_NUMBER_BYTES[chars].all(axis=1) | _BLANK_BYTES[chars].all(axis=1)
+    raw[missing] = b'0'
+
+    try:
+        result = raw.astype(np.float64)
+    except ValueError:
+        # Valid characters but not a number (e.g. '-', '1.2.3', '1e'). Only
+        # rows that could be such tokens are coerced value by value.
+        result = _parse_odd_rows(raw, chars)
+    result[missing] = np.nan
+    # Exponents past the float range ('1e999')
+    _finite(result)
+
+    return pd.Series(result, index=series.index, name=series.name), unit
+
+@timed('clean')
+def clean_numeric_series(series):
+    """
+    Cleans a pandas Series to ensure it's numeric.
+    Handles strings with %, mph, ft, whitespace, leading-dot decimals, etc.
+    Text columns always come back as float64.
+    """
+    return parse_numeric_series(series)[0]
+
+def clean_numeric_value(value):
+    """
+    Scalar version of clean_numeric_series for single values (e.g. from JSON).
+    Returns a float, or NaN if the value is missing or not numeric.
+    """
+    if value is None or isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+
+    # Same parser as the column path, so '1_000' or non-ASCII digits that
+    # Python's float() accepts stay missing here too
+    parsed, _ = parse_numeric_series(pd.Series([str(value)], dtype=object))
+    return float(parsed.iloc[0])
+
+def build_metric_matrix(df, mapping, metrics=TARGET_METRICS):
+    """
+    Cleans the mapped metric columns and stacks them into one 2-D array.
+
+    Args:
+        df (pd.DataFrame): The raw dataframe.
+        mapping (dict): Dictionary mapping 'Standard Metric' -> 'User Column'.
+        metrics (list): Standard metrics to consider, in output order.
+
+    Returns:
+        tuple: (float32 array of shape (rows, mapped), list of the mapped metric names)
+    """
+    # float32, the precision metrics are cached in, whatever the source: values
+    # rank and tie the same whether they come from the cache or a fresh parse.
+    # Values that differ only past float32 precision (~7 digits) tie.
+    mapped = [m for m in metrics if mapping.get(m) and mapping[m] in df.columns]
+    matrix = np.empty((len(df), len(mapped)), dtype=np.float32)
+    for j, metric in enumerate(mapped):
+        matrix[:, j] = clean_numeric_series(df[mapping[metric]]).to_numpy(dtype=np.float32, na_value=np.nan)
+    return matrix, mapped
+
+@timed('rank')
+def rank_percentiles(matrix, lower_is_better=None, groups=None):
+    """
+    Ranks every column of a 2-D array at once, returning 0-100 percentiles.
+
+    Matches Series.rank(pct=True, method='average') * 100 rounded to 0 decimals:
+    ties share their average rank and NaNs are left out of both the ranking and
+    the count.
+
+    Args:
+        matrix (np.ndarray): Float array of shape (rows, metrics).
+        lower_is_better (array-like of bool, optional): Per-column flags. Those
+            columns are negated so the lowest raw value gets the highest percentile.
+        groups (array-like of int, optional): Peer group code per row (see
+            peer_groups). Rows are then ranked only against their own group,
+            like groupby(groups).rank(pct=True), still in one sort.
+
+    Returns:
+        np.ndarray: Float array of the same shape, NaN where the input was NaN.
+    """
+    # Work metric-major so each column's sort runs over contiguous memory
+    values = np.array(np.asarray(matrix, dtype=np.float64).T, order='C')
+    if lower_is_better is not None:
+        flip = np.asarray(lower_is_better, dtype=bool)
+        values[flip] = -values[flip]
+    m, n = values.shape
+    if values.size == 0:
+        return np.full((n, m), np.nan)
+
+    counts = n - np.isnan(values).sum(axis=1, keepdims=True)
+
+    # One argsort for every column; NaNs sort to the end of each row.
+    # Flat indices let the gather/scatter below run as single 1-D passes.
+    # Temporaries are updated in place or dropped early to keep peak memory
+    # at a few copies of the matrix.
+    offsets = (np.arange(m) * n)[:, None]
+    flat_order = np.argsort(values, axis=1)
+    if groups is not None:
+        # A stable sort by group code on top of the value order leaves each
+        # metric sorted by (group, value), with every group's NaNs at its end
+        codes = np.asarray(groups, dtype=np.int64)
+        by_group = np.argsort(codes[flat_order], axis=1, kind='stable')
+        flat_order = np.take_along_axis(flat_order, by_group, axis=1)
+        del by_group
+        sorted_codes = codes[flat_order].ravel()
+    flat_order += offsets
+    flat_order = flat_order.ravel()
+    sorted_vals = values.ravel()[flat_order]
+    del values
+
+    # Runs of tied values in sorted order, never spanning two metrics
+    starts = np.empty(sorted_vals.size, dtype=bool)
+    starts[0] = True
+    np.not_equal(sorted_vals[1:], sorted_vals[:-1], out=starts[1:])
+    starts[::n] = True
+    missing = np.isnan(sorted_vals).reshape(m, n)
+    del sorted_vals
+
+    if groups is not None:
+        # Segments of one (metric, group) each; ranks restart at every segment
+        # and are divided by the segment's own non-NaN count
+        seg_starts = np.empty(starts.size, dtype=bool)
+        seg_starts[0] = True
+        np.not_equal(sorted_codes[1:], sorted_codes[:-1], out=seg_starts[1:])
+        seg_starts[::n] = True
+        del sorted_codes
+        starts |= seg_starts
+        seg_first = np.flatnonzero(seg_starts)
+        del seg_starts
+        seg_len = np.diff(seg_first, append=m * n)
+        seg_counts = np.add.reduceat(~missing.ravel(), seg_first)
+        offsets = np.repeat(seg_first, seg_len).reshape(m, n)
+        counts = np.repeat(seg_counts, seg_len).reshape(m, n)
+        del seg_first, seg_len, seg_counts
+
+    run_first = np.flatnonzero(starts)
+    del starts
+    run_len = np.diff(run_first, append=m * n)
+
+    # Average 1-based rank of each run, as a fraction of the non-NaN count
+    rank = np.repeat(run_first + (run_len - 1) / 2.0, run_len).reshape(m, n)
+    del run_first, run_len
+    rank -= offsets
+    rank += 1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rank /= counts
+    rank[missing] = np.nan
+
+    pct = np.empty(m * n)
+    pct[flat_order] = rank.ravel()
+    del rank, flat_order
+    pct *= 100
+    np.round(pct, 0, out=pct)
+    return pct.reshape(m, n).T
+
+# Percentiles are whole numbers from 0 to 100, so they are kept as int8 with
+# this value standing for a missing percentile. Signed, so that differences
+# between two percentile columns don't wrap around.
+PERCENTILE_NA = -1
+
+def encode_percentiles(pct):
+    """
+    Converts 0-100 percentiles (NaN where missing) to int8 codes, with
+    PERCENTILE_NA for missing values.
+    """
+    pct = np.asarray(pct)
+    codes = np.full(pct.shape, PERCENTILE_NA, dtype=np.int8)
+    known = ~np.isnan(pct)
+    codes[known] = pct[known]
+    return codes
+
+def percentile_array(codes):
+    """
+    Wraps int8 percentile codes as a nullable Int8 column without copying
+    them: missing percentiles are NA, so isna(), to_numpy(na_value=...) and
+    the CSV/JSON writers treat them like NaN.
+    """
+    codes = np.asarray(codes, dtype=np.int8)
+    return pd.arrays.IntegerArray(codes, codes == PERCENTILE_NA)
+
+def percentile_frame(players, codes, metrics, index):
+    """
+    Result table of calculate_percentiles / percentiles_against: Player Name,
+    then one Int8 column per metric from a (metrics, rows) code block.
+    """
+    result_df = pd.DataFrame({metric: percentile_array(codes[i]) for i, metric in enumerate(metrics)},
+                             index=index, columns=metrics, copy=False)
+    result_df.insert(0, 'Player Name', players)
+    return result_df
+
+def peer_groups(df, columns):
+    """
+    Splits rows into peer groups by the combination of values in columns
+    (e.g. level x position). Missing values form their own 'N/A' group.
+
+    Returns:
+        tuple: (int64 group code per row, object array of group labels such
+        as 'D1 / SS', indexed by code)
+    """
+    codes = np.zeros(len(df), dtype=np.int64)
+    parts = []
+    for col in columns:
+        col_codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+        names = np.where(pd.isna(uniques), 'N/A', pd.Index(uniques).astype(str)).astype(object)
+        # Re-factorize so codes stay dense (< rows) however many columns are combined
+        codes, _ = pd.factorize(codes * len(uniques) + col_codes)
+        parts.append((col_codes, names))
+
+    # Labels are built per group from its first row, not per player
+    _, first = np.unique(codes, return_index=True)
+    labels = None
+    for col_codes, names in parts:
+        piece = pd.Series(names[col_codes[first]])
+        labels = piece if labels is None else labels.str.cat(piece, sep=' / ')
+    return codes, labels.to_numpy(dtype=object)
+
+def calculate_percentiles(df, mapping, metrics=TARGET_METRICS, group_by=None):
+    """
+    Calculates 1-100 percentile ranks for the mapped metrics.
+    
+    Args:
+        df (pd.DataFrame): The raw dataframe.
+        mapping (dict): Dictionary mapping 'Standard Metric' -> 'User Column'.
+        metrics (list): Standard metrics to rank (defaults to all TARGET_METRICS).
+        group_by (list, optional): Columns defining peer groups (e.g. level and
+            position). Each player is then ranked only against their group, and
+            a 'Peer Group' column is added after Player Name.
+    
+    Returns:
+        pd.DataFrame: DataFrame with Player Name and Percentile Ranks
+        (nullable Int8, NA where the value or the mapping is missing).
+    """
+    # Handle Player Name
+    player_col = mapping.get('Player Name')
+    if player_col and player_col in df.columns:
+        players = df[player_col]
+    else:
+        # If no player name mapped, use index or a default
+        players = df.index.astype(str)
+
+    # All mapped metrics are cleaned into one matrix and ranked together.
+    # Lower-is-better metrics (K%, Chase%, ...) are negated so that the
+    # lowest raw value gets the highest percentile.
+    group_by = [col for col in (group_by or []) if col in df.columns]
+    codes, labels = peer_groups(df, group_by) if group_by else (None, None)
+
+    matrix, mapped = build_metric_matrix(df, mapping, metrics)
+    ranks = rank_percentiles(matrix, [m in LOWER_IS_BETTER for m in mapped], groups=codes)
+    del matrix
+
+    # Unmapped metrics are N/A. The ranks go straight into one int8 block
+    # (one byte per percentile instead of eight), which the columns share.
+    metrics = list(metrics)
+    block = np.full((len(metrics), len(df)), PERCENTILE_NA, dtype=np.int8)
+    block[[metrics.index(m) for m in mapped]] = encode_percentiles(ranks.T)
+    del ranks
+
+    result_df = percentile_frame(players, block, metrics, df.index)
+    if codes is not None:
+        result_df.insert(1, 'Peer Group', labels[codes])
+    return result_df
+
+class PercentileIndex:
+    """
+    Sorted reference distribution per metric, for ranking new values against
+    an existing population without re-ranking it.
+
+    A looked-up value gets exactly the percentile calculate_percentiles would
+    give it if it were added to the population as one more row: same
+    LOWER_IS_BETTER handling, average rank for ties, same rounding.
+    """
+
+    def __init__(self, distributions):
+        # metric -> ascending float64 array with NaNs removed. Lower-is-better
+        # metrics are stored negated, so "higher is better" holds everywhere.
+        # Values are float32-exact, like the cached metrics they come from.
+        self.distributions = distributions
+
+    @classmethod
+    def from_frame(cls, df, mapping):
+        """
+        Builds the index from a raw dataframe and a column mapping.
+        """
+        matrix, mapped = build_metric_matrix(df, mapping)
+        distributions = {}
+        for j, metric in enumerate(mapped):
+            col = matrix[:, j].astype(np.float64)
+            col = col[~np.isnan(col)]
+            if metric in LOWER_IS_BETTER:
+                col = -col
+            distributions[metric] = np.sort(col)
+        return cls(distributions)
+
+    @property
+    def nbytes(self):
+        return sum(dist.nbytes for dist in self.distributions.values())
+
+    def size(self, metric):
+        """
+        Number of non-missing reference values for a metric (0 if unmapped).
+        """
+        dist = self.distributions.get(metric)
+        return 0 if dist is None else len(dist)
+
+    def percentiles(self, metric, values):
+        """
+        Vectorized lookup: percentiles (0-100, NaN for missing) for an array of
+        cleaned values of one metric. O(log n) per value.
+        """
+        # Rounded to float32 like the stored values, so '18.2%' ties with them
+        values = np.asarray(values, dtype=np.float32).astype(np.float64)
+        dist = self.distributions.get(metric)
+        if dist is None:
+            return np.full(values.shape, np.nan)
+        if metric in LOWER_IS_BETTER:
+            values = -values
+
+        below = np.searchsorted(dist, values, side='left')
+        at_or_below = np.searchsorted(dist, values, side='right')
+        # The new value ties with (at_or_below - below) reference values and
+        # shares their average 1-based rank in a population of n + 1
+        rank = (below + at_or_below) / 2.0 + 1
+        pct = rank / (len(dist) + 1)
+        pct[np.isnan(values)] = np.nan
+        return np.round(pct * 100, 0)
+
+    def lookup(self, values):
+        """
+        Looks up raw values for several metrics.
+
+        Args:
+            values (dict): 'Standard Metric' -> raw value (number or string like '11.3%').
+
+        Returns:
+            dict: 'Standard Metric' -> percentile, or None if the value is missing,
+            not numeric, or the metric is not in the index.
+        """
+        result = {}
+        for metric, raw in values.items():
+            pct = self.percentiles(metric, [clean_numeric_value(raw)])[0]
+            result[metric] = None if np.isnan(pct) else float(pct)
+        return result
+
+@timed('rank')
+def percentiles_against(index, df, mapping, metrics=TARGET_METRICS):
+    """
+    Ranks every player of df against a reference population instead of
+    against each other.
+
+    Args:
+        index: A PercentileIndex (or sketches.SketchIndex) of the reference.
+        df (pd.DataFrame): The raw dataframe.
+        mapping (dict): Dictionary mapping 'Standard Metric' -> 'User Column'.
+        metrics (list): Standard metrics to rank.
+
+    Returns:
+        pd.DataFrame: Same layout as calculate_percentiles; each value is the
+        percentile the player would get if added to the reference.
+    """
+    player_col = mapping.get('Player Name')
+    if player_col and player_col in df.columns:
+        players = df[player_col]
+    else:
+        players = df.index.astype(str)
+
+    matrix, mapped = build_metric_matrix(df, mapping, metrics)
+    metrics = list(metrics)
+    block = np.full((len(metrics), len(df)), PERCENTILE_NA, dtype=np.int8)
+    for j, metric in enumerate(mapped):
+        block[metrics.index(metric)] = encode_percentiles(index.percentiles(metric, matrix[:, j]))
+
+    return percentile_frame(players, block, metrics, df.index)
+
+@timed('features')
+def synthetic_xwoba_features(df, mapping):
+    """
+    Cleans the Synthetic xwOBA inputs once into a (rows, 4) feature matrix.
+
+    Columns follow SYNTHETIC_COMPONENTS, already scaled so the formula is a
+    plain dot product with the weights (see synthetic_xwoba_weights):
+        BB% / 100, -K% / 100, (Max EV - 75) / 35, (Contact% - 70) / 30
+    Missing or unmapped inputs count as 0 before scaling.
+    """
+    features = np.zeros((len(df), len(SYNTHETIC_COMPONENTS)), dtype=np.float64)
+    for j, metric in enumerate(SYNTHETIC_COMPONENTS):
+        col = mapping.get(metric)
+        if col and col in df.columns:
+            features[:, j] = clean_numeric_series(df[col]).fillna(0).to_numpy(dtype=np.float64)
+
+    # BB Contribution / K Penalty: 0-100 scale to a fraction
+    features[:, 0] /= 100.0
+    features[:, 1] /= -100.0
+    # Power: Max EV, 75mph = 0, 110mph = 1
+    features[:, 2] = (features[:, 2] - 75) / 35.0
+    # Contact: 70% = 0, 100% = 1
+    features[:, 3] = (features[:, 3] - 70) / 30.0
+    return features
+
+def synthetic_xwoba_weights(weights=None):
+    """
+    Splits a weights dict into (weight vector matching the feature columns, base value).
+    Missing keys fall back to DEFAULT_WEIGHTS.
+    """
+    weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+    vector = np.array([float(weights[key]) for key in SYNTHETIC_WEIGHT_KEYS])
+    return vector, float(weights['base_woba'])
+
+@timed('score')
+def score_synthetic_xwoba(features, weights=None):
+    """
+    Applies weights to a precomputed feature matrix: one matrix-vector product.
+    """
+    vector, base_woba = synthetic_xwoba_weights(weights)
+    return features @ vector + base_woba
+
+def calculate_synthetic_xwoba(df, mapping, weights=None):
+    """
+    Calculates a Synthetic xwOBA based on available metrics.
+    Formula:
+    Base (Default 0.280) 
+    + (BB% * w_bb) 
+    - (K% * w_k) 
+    + ((Max EV - 75) / 35 * w_power) 
+    + ((Contact% - 70) / 30 * w_contact)
+    
+    All inputs are expected to be 0-100 scale (e.g. 10.5 for 10.5%).
+    When only the weights change, keep synthetic_xwoba_features() and call
+    score_synthetic_xwoba() instead of re-cleaning the inputs.
+    """
+    features = synthetic_xwoba_features(df, mapping)
+    return pd.Series(score_synthetic_xwoba(features, weights), index=df.index)
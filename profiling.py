@@ -0,0 +1,82 @@
+import cProfile
+import os
+import re
+import time
+
+# PROFILE_REQUESTS settings: never, only requests asking for it
+# (?profile=1 or an X-Profile: 1 header), or every request
+PROFILE_MODES = ('off', 'flag', 'all')
+
+PROFILE_SUFFIX = '.prof'
+
+
+def start_profiler():
+    """
+    Returns an enabled cProfile.Profile, or None if another profiler is
+    already active in this thread.
+    """
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+
+def _tag(value):
+    return re.sub(r'[^A-Za-z0-9.-]+', '-', str(value)).strip('-') or 'none'
+
+
+def dump_name(route, digest=None, rows=None):
+    """
+    File name of a profile dump, tagged with the time, route, dataset hash
+    and row count, e.g. 20260101-120000-123_results_3f2a9c1d0b7e_3005rows_412.prof.
+    """
+    now = time.time()
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now)) + f'-{int(now * 1000) % 1000:03d}'
+    rows_tag = 'unknown' if rows is None else int(rows)
+    return (f'{stamp}_{_tag(route)}_{_tag((digest or "none")[:12])}_{rows_tag}rows_{os.getpid()}'
+            f'{PROFILE_SUFFIX}')
+
+
+def save_profile(profiler, folder, route, digest=None, rows=None, keep=50, max_bytes=100 * 1024 * 1024):
+    """
+    Stops the profiler, writes its stats (pstats format, readable with
+    `python -m pstats` or snakeviz) to folder and enforces the retention caps.
+    Returns the dump's path.
+    """
+    profiler.disable()
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, dump_name(route, digest, rows))
+    profiler.dump_stats(path)
+    prune_profiles(folder, keep, max_bytes)
+    return path
+
+
+def prune_profiles(folder, keep, max_bytes):
+    """
+    Deletes the oldest dumps beyond `keep` files or `max_bytes` in total.
+    Returns the number of files deleted.
+    """
+    dumps = []
+    for entry in os.scandir(folder):
+        if entry.name.endswith(PROFILE_SUFFIX):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            dumps.append((st.st_mtime, entry.name, st.st_size))
+    dumps.sort(reverse=True)
+
+    removed = 0
+    total = 0
+    for i, (_, name, size) in enumerate(dumps):
+        total += size
+        # The newest dump is always kept, however large
+        if i > 0 and (i >= keep or total > max_bytes):
+            try:
+                os.remove(os.path.join(folder, name))
+                removed += 1
+            except OSError:
+                pass
+    return removed
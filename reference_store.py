@@ -0,0 +1,197 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from processing import TARGET_METRICS, LOWER_IS_BETTER, PercentileIndex, build_metric_matrix
+from sketches import DEFAULT_K, KLLSketch, SketchIndex
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS populations (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS distributions (
+    population_id INTEGER NOT NULL REFERENCES populations(id) ON DELETE CASCADE,
+    metric TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sorted_values BLOB NOT NULL,
+    PRIMARY KEY (population_id, metric)
+);
+CREATE TABLE IF NOT EXISTS sketches (
+    population_id INTEGER NOT NULL REFERENCES populations(id) ON DELETE CASCADE,
+    metric TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sketch TEXT NOT NULL,
+    PRIMARY KEY (population_id, metric)
+);
+'''
+
+
+class ReferenceStore:
+    """
+    Curated reference populations (e.g. the full D1 hitting set) in a local
+    SQLite file, so small uploads can be ranked against a meaningful
+    population.
+
+    Only what ranking needs is stored: one sorted float64 array per metric,
+    in PercentileIndex's layout (NaNs dropped, lower-is-better metrics
+    negated). Loading a population is a read of those arrays; nothing is
+    re-sorted. Adding rows merges the new sorted values into the stored ones.
+
+    Approximate populations store one KLL sketch per metric instead (as
+    KLLSketch.to_dict() JSON), a few thousand numbers whatever the number of
+    rows, and are ranked with a SketchIndex.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        # (name, version) -> PercentileIndex
+        self._indexes = {}
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per operation, committed on success
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute('PRAGMA foreign_keys = ON')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def populations(self):
+        """
+        Lists stored populations, newest first.
+
+        Returns:
+            list: dicts with name, rows, version, updated_at, approximate and
+            metrics ('Standard Metric' -> number of values).
+        """
+        with self._connect() as conn:
+            populations = conn.execute(
+                'SELECT id, name, rows, version, updated_at FROM populations ORDER BY updated_at DESC'
+            ).fetchall()
+            sizes = conn.execute('SELECT population_id, metric, size FROM distributions').fetchall()
+            sketched = conn.execute('SELECT population_id, metric, size FROM sketches').fetchall()
+
+        metrics = {}
+        for population_id, metric, size in sizes + sketched:
+            metrics.setdefault(population_id, {})[metric] = size
+        approximate = {population_id for population_id, _, _ in sketched}
+        return [
+            {'name': name, 'rows': rows, 'version': version, 'updated_at': updated_at,
+             'approximate': pid in approximate,
+             'metrics': {m: metrics.get(pid, {})[m] for m in TARGET_METRICS if m in metrics.get(pid, {})}}
+            for pid, name, rows, version, updated_at in populations
+        ]
+
+    def version(self, name):
+        """
+        Returns the population's version, bumped on every change (None if unknown).
+        """
+        with self._connect() as conn:
+            row = conn.execute('SELECT version FROM populations WHERE name = ?', (name,)).fetchone()
+        return None if row is None else row[0]
+
+    def add(self, name, df, mapping, approximate=False):
+        """
+        Adds the rows of df to a population, creating it if needed.
+
+        Each metric's new values are sorted on their own and merged into the
+        stored sorted array (O(stored + new log new)); the existing values are
+        not re-sorted or re-cleaned. With approximate=True a new population
+        keeps KLL sketches instead, and new values are merged into those.
+        Rows added later are stored the way the population already is.
+
+        Returns:
+            int: The population's new version.
+        """
+        matrix, mapped = build_metric_matrix(df, mapping)
+
+        with self._connect() as conn:
+            conn.execute('INSERT OR IGNORE INTO populations (name, updated_at) VALUES (?, ?)',
+                         (name, time.time()))
+            population_id, = conn.execute('SELECT id FROM populations WHERE name = ?', (name,)).fetchone()
+            if conn.execute('SELECT 1 FROM distributions WHERE population_id = ?', (population_id,)).fetchone():
+                approximate = False
+            elif conn.execute('SELECT 1 FROM sketches WHERE population_id = ?', (population_id,)).fetchone():
+                approximate = True
+
+            for j, metric in enumerate(mapped):
+                new = matrix[:, j].astype(np.float64)
+                new = new[~np.isnan(new)]
+                if metric in LOWER_IS_BETTER:
+                    new = -new
+                if approximate:
+                    self._add_to_sketch(conn, population_id, metric, new)
+                    continue
+                new.sort()
+
+                row = conn.execute('SELECT sorted_values FROM distributions WHERE population_id = ? AND metric = ?',
+                                   (population_id, metric)).fetchone()
+                if row is not None:
+                    stored = np.frombuffer(row[0], dtype=np.float64)
+                    new = np.insert(stored, np.searchsorted(stored, new, side='right'), new)
+
+                conn.execute('INSERT OR REPLACE INTO distributions (population_id, metric, size, sorted_values) '
+                             'VALUES (?, ?, ?, ?)', (population_id, metric, len(new), new.tobytes()))
+
+            conn.execute('UPDATE populations SET rows = rows + ?, version = version + 1, updated_at = ? '
+                         'WHERE id = ?', (len(df), time.time(), population_id))
+            version, = conn.execute('SELECT version FROM populations WHERE id = ?', (population_id,)).fetchone()
+        return version
+
+    @staticmethod
+    def _add_to_sketch(conn, population_id, metric, values):
+        row = conn.execute('SELECT sketch FROM sketches WHERE population_id = ? AND metric = ?',
+                           (population_id, metric)).fetchone()
+        sketch = KLLSketch(DEFAULT_K) if row is None else KLLSketch.from_dict(json.loads(row[0]))
+        sketch.update(values)
+        conn.execute('INSERT OR REPLACE INTO sketches (population_id, metric, size, sketch) VALUES (?, ?, ?, ?)',
+                     (population_id, metric, len(sketch), json.dumps(sketch.to_dict())))
+
+    def delete(self, name):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM populations WHERE name = ?', (name,))
+
+    def index(self, name):
+        """
+        Returns a PercentileIndex over a stored population, built straight from
+        its stored sorted arrays, or a SketchIndex for an approximate one.
+        Raises KeyError for unknown populations.
+        """
+        version = self.version(name)
+        if version is None:
+            raise KeyError(name)
+
+        key = (name, version)
+        if key not in self._indexes:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    'SELECT d.metric, d.sorted_values FROM distributions d '
+                    'JOIN populations p ON p.id = d.population_id WHERE p.name = ?', (name,)
+                ).fetchall()
+                sketched = conn.execute(
+                    'SELECT s.metric, s.sketch FROM sketches s '
+                    'JOIN populations p ON p.id = s.population_id WHERE p.name = ?', (name,)
+                ).fetchall()
+            # Drop indexes of older versions of this population
+            self._indexes = {k: v for k, v in self._indexes.items() if k[0] != name}
+            if sketched:
+                index = SketchIndex({metric: KLLSketch.from_dict(json.loads(text)) for metric, text in sketched})
+            else:
+                index = PercentileIndex({metric: np.frombuffer(blob, dtype=np.float64) for metric, blob in rows})
+            self._indexes[key] = index
+        return self._indexes[key]
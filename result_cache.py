@@ -0,0 +1,123 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+def sizeof(value):
+    """
+    Approximate memory held by a cached value, in bytes.
+
+    Arrays and objects that know their size (ResultTable, PercentileIndex)
+    report nbytes; dicts, lists and tuples are summed over their items.
+    """
+    nbytes = getattr(value, 'nbytes', None)
+    if nbytes is not None:
+        return int(nbytes)
+    if isinstance(value, dict):
+        return sum(sizeof(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(sizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class ResultCache:
+    """
+    In-process cache of computed results (percentile tables, formula inputs,
+    scored tables) with a memory budget and least-recently-used eviction.
+
+    Keys should identify everything a result depends on, e.g. the dataset's
+    content digest, the column mapping and the formula weights. Entry sizes
+    are re-measured when an entry is used, since tables keep the sort orders
+    they compute. A single value larger than the whole budget is returned
+    but not kept.
+
+    Counters (hits, misses, evictions) are per process.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+        Returns the cached value (marking it most recently used), or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            value, size = entry
+            self._entries.move_to_end(key)
+            self._store(key, value, sizeof(value) - size)
+            return value
+
+    def put(self, key, value):
+        """
+        Caches value under key, evicting least recently used entries to stay
+        within the budget. Returns value.
+        """
+        size = sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if size <= self.max_bytes:
+                self._store(key, value, size)
+        return value
+
+    def get_or_build(self, key, build):
+        """
+        Returns the cached value for key, calling build() and caching its
+        result on a miss.
+        """
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, build())
+        return value
+
+    def _store(self, key, value, added):
+        # Called with the lock held; key is (re)inserted as most recently used
+        size = self._entries[key][1] + added if key in self._entries else added
+        self._entries[key] = (value, size)
+        self.bytes += added
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            old_key, (_, old_size) = next(iter(self._entries.items()))
+            if old_key == key:
+                break
+            del self._entries[old_key]
+            self.bytes -= old_size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        Counters and current usage, for sizing the budget.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else None,
+            }
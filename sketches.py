@@ -0,0 +1,258 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from processing import TARGET_METRICS, LOWER_IS_BETTER, clean_numeric_series, clean_numeric_value
+
+# Default KLL accuracy parameter; see KLLSketch.rank_error
+DEFAULT_K = 200
+
+# Levels never shrink below this many items
+_MIN_LEVEL_CAPACITY = 8
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang & Liberty, 2016) over float values.
+
+    Keeps O(k log(n/k)) items however many values are added. Items on level h
+    stand for 2**h original values; when the sketch is full, the lowest full
+    level is sorted and every other item (random offset) is promoted one
+    level up. Two sketches merge by concatenating their levels and
+    compacting, so sketches of separate files combine without the rows.
+
+    While fewer than about k values have been added nothing is compacted and
+    ranks are exact.
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=None):
+        self.k = int(k)
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+        self._sorted = None
+
+    def __len__(self):
+        return self.n
+
+    @staticmethod
+    def rank_error(k=DEFAULT_K):
+        """
+        Normalized rank error that holds with 99% confidence, as a fraction of
+        the population (about 0.0133 for k=200).
+
+        Uses the empirical fit published with Apache DataSketches' KLL sketch;
+        benchmarks/sketch_accuracy.py measures this implementation against it.
+        """
+        return 2.296 / k ** 0.9723
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(_MIN_LEVEL_CAPACITY, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        while sum(len(items) for items in self.levels) > sum(
+                self._capacity(h) for h in range(len(self.levels))):
+            h = next(h for h, items in enumerate(self.levels) if len(items) >= self._capacity(h))
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+
+            items = np.sort(self.levels[h])
+            # An odd item out stays on this level
+            keep = items[:len(items) % 2]
+            pairs = items[len(keep):]
+            promoted = pairs[self._rng.integers(2)::2]
+            self.levels[h] = keep
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+        self._sorted = None
+
+    def update(self, values):
+        """
+        Adds an array of values; NaNs are ignored.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += values.size
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """
+        Folds another sketch into this one (in place) and returns self.
+        """
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self.k = max(self.k, other.k)
+        self._compress()
+        return self
+
+    def _cumulative(self):
+        if self._sorted is None:
+            items = np.concatenate(self.levels)
+            weights = np.concatenate([np.full(len(lvl), 2.0 ** h) for h, lvl in enumerate(self.levels)])
+            order = np.argsort(items, kind='stable')
+            self._sorted = (items[order], np.concatenate([[0.0], np.cumsum(weights[order])]))
+        return self._sorted
+
+    def counts(self, values):
+        """
+        Estimated number of added values strictly below, and at or below, each
+        of values. Both are exact until the sketch first compacts.
+        """
+        items, cumulative = self._cumulative()
+        values = np.asarray(values, dtype=np.float64)
+        below = cumulative[np.searchsorted(items, values, side='left')]
+        at_or_below = cumulative[np.searchsorted(items, values, side='right')]
+        # Item weights only approximate n, so rescale to the true count
+        total = cumulative[-1]
+        if total:
+            below = below * (self.n / total)
+            at_or_below = at_or_below * (self.n / total)
+        return below, at_or_below
+
+    def quantile(self, q):
+        """
+        Estimated value at fraction q (0-1) of the sorted population.
+        """
+        items, cumulative = self._cumulative()
+        if items.size == 0:
+            return np.nan
+        target = q * cumulative[-1]
+        return items[min(np.searchsorted(cumulative[1:], target, side='left'), items.size - 1)]
+
+    def to_dict(self):
+        return {'k': self.k, 'n': self.n, 'levels': [lvl.tolist() for lvl in self.levels]}
+
+    @classmethod
+    def from_dict(cls, data, seed=None):
+        sketch = cls(data['k'], seed=seed)
+        sketch.n = data['n']
+        sketch.levels = [np.asarray(lvl, dtype=np.float64) for lvl in data['levels']] or [np.empty(0)]
+        return sketch
+
+
+class SketchIndex:
+    """
+    Approximate counterpart of PercentileIndex: one KLLSketch per metric.
+
+    Same interface (size, percentiles, lookup) and the same "as if added as one
+    more row" percentile definition. Each rank is within KLLSketch.rank_error(k)
+    of the population size of the exact rank (99% confidence), i.e. a
+    percentile is off by at most about 100 * rank_error(k) points (1.3 for
+    k=200), plus rounding.
+
+    Memory does not grow with the population, and indexes built from
+    separate files merge with merge().
+    """
+
+    def __init__(self, sketches=None, k=DEFAULT_K):
+        # Lower-is-better metrics are sketched negated, like PercentileIndex
+        self.sketches = sketches if sketches is not None else {}
+        self.k = k
+
+    @classmethod
+    def from_frame(cls, df, mapping, k=DEFAULT_K):
+        """
+        Sketches the mapped metric columns of a dataframe.
+        """
+        return cls(k=k).update(df, mapping)
+
+    @classmethod
+    def from_csv(cls, filepath, mapping, k=DEFAULT_K, chunksize=100_000):
+        """
+        Sketches a CSV in chunks, reading only the mapped metric columns, so the
+        file never has to fit in memory.
+        """
+        index = cls(k=k)
+        columns = [mapping[m] for m in TARGET_METRICS if mapping.get(m)]
+        try:
+            chunks = pd.read_csv(filepath, usecols=columns, dtype=str, chunksize=chunksize)
+            for chunk in chunks:
+                index.update(chunk, mapping)
+        except UnicodeDecodeError:
+            index = cls(k=k)
+            for chunk in pd.read_csv(filepath, usecols=columns, dtype=str, chunksize=chunksize,
+                                     encoding='latin1'):
+                index.update(chunk, mapping)
+        return index
+
+    def update(self, df, mapping):
+        """
+        Adds the rows of a dataframe (e.g. one chunk of a file) and returns self.
+        """
+        for metric in TARGET_METRICS:
+            col = mapping.get(metric)
+            if not col or col not in df.columns:
+                continue
+            # float32, the precision metrics are cached and ranked in
+            values = clean_numeric_series(df[col]).to_numpy(dtype=np.float32, na_value=np.nan).astype(np.float64)
+            if metric in LOWER_IS_BETTER:
+                values = -values
+            self.sketches.setdefault(metric, KLLSketch(self.k)).update(values)
+        return self
+
+    def merge(self, other):
+        """
+        Folds another index (e.g. another season's file) into this one and returns self.
+        """
+        for metric, sketch in other.sketches.items():
+            if metric in self.sketches:
+                self.sketches[metric].merge(sketch)
+            else:
+                self.sketches[metric] = KLLSketch.from_dict(sketch.to_dict())
+        return self
+
+    def size(self, metric):
+        """
+        Number of non-missing reference values for a metric (0 if unmapped).
+        """
+        sketch = self.sketches.get(metric)
+        return 0 if sketch is None else len(sketch)
+
+    def percentiles(self, metric, values):
+        """
+        Vectorized approximate lookup, like PercentileIndex.percentiles.
+        """
+        # Rounded to float32 like the sketched values, so '11.3%' ties with them
+        values = np.asarray(values, dtype=np.float32).astype(np.float64)
+        sketch = self.sketches.get(metric)
+        if sketch is None or len(sketch) == 0:
+            return np.full(values.shape, np.nan)
+        if metric in LOWER_IS_BETTER:
+            values = -values
+
+        below, at_or_below = sketch.counts(values)
+        rank = (below + at_or_below) / 2.0 + 1
+        pct = rank / (len(sketch) + 1)
+        pct[np.isnan(values)] = np.nan
+        return np.round(pct * 100, 0)
+
+    def lookup(self, values):
+        """
+        Looks up raw values for several metrics, like PercentileIndex.lookup.
+        """
+        result = {}
+        for metric, raw in values.items():
+            pct = self.percentiles(metric, [clean_numeric_value(raw)])[0]
+            result[metric] = None if np.isnan(pct) else float(pct)
+        return result
+
+    def save(self, path):
+        """
+        Writes the index as JSON (a few thousand numbers per metric).
+        """
+        with open(path, 'w') as f:
+            json.dump({'k': self.k, 'sketches': {m: s.to_dict() for m, s in self.sketches.items()}}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls({m: KLLSketch.from_dict(s) for m, s in data['sketches'].items()}, k=data['k'])
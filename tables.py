@@ -0,0 +1,183 @@
+import math
+
+import numpy as np
+import pandas as pd
+from markupsafe import Markup, escape
+
+from constants import DEFAULT_PER_PAGE, MAX_PER_PAGE
+from metrics import timed
+from processing import clean_numeric_series
+
+# Percentile tiers for cell colors: below 11, 11-39, 40-59, 60-89, 90 and up
+TIER_BINS = [11, 40, 60, 90]
+TIER_CLASSES = ['rank-1-10', 'rank-11-39', 'rank-40-59', 'rank-60-89', 'rank-90-100']
+_TIER_OPEN = np.array([f'<td class="{tier}">' for tier in TIER_CLASSES], dtype=object)
+
+
+@timed('cells')
+def tier_cells(percentiles, values=None, missing=('rank-na', 'N/A')):
+    """
+    Renders the colored cells of a page as one HTML string per row. Tiers
+    come from the page's percentile matrix in one np.digitize pass; the
+    template only outputs the rows.
+
+    Args:
+        percentiles: (rows, columns) percentiles, NaN where missing.
+        values: Cell values of the same shape (escaped here); defaults to
+            the percentiles as whole numbers.
+        missing: (class, text) for cells without a percentile. A class of
+            None leaves the cell uncolored; a text of None keeps its value.
+
+    Returns:
+        list: One Markup string of <td> cells per row.
+    """
+    pct = np.asarray(percentiles, dtype=np.float64)
+    na = np.isnan(pct)
+    pct = np.where(na, 0, pct)
+
+    opens = _TIER_OPEN[np.digitize(pct, TIER_BINS)]
+    opens[na] = '<td>' if missing[0] is None else f'<td class="{missing[0]}">'
+    if values is None:
+        texts = pct.astype(np.int64).astype(str).astype(object)
+    else:
+        # Plain str: adding a str to a Markup would escape the str
+        texts = np.array([[str(escape(value)) for value in row] for row in np.asarray(values, dtype=object).tolist()],
+                         dtype=object).reshape(pct.shape)
+    if missing[1] is not None:
+        texts[na] = str(escape(missing[1]))
+
+    cells = opens + texts + '</td>'
+    return [Markup(''.join(row)) for row in cells.tolist()]
+
+
+class ResultTable:
+    """
+    A computed results table that is served one page at a time.
+
+    Each column gets a numeric sort key (names and other text columns sort
+    case-insensitively, values like '11.3%' sort by their number, N/A sorts last in both
+    directions). Sort orders are computed the first time a column is sorted
+    and kept, so paging through a sorted table only slices an index array.
+    """
+
+    def __init__(self, frame, name_column='Player Name', text_columns=()):
+        self.frame = frame.reset_index(drop=True)
+        self.name_column = name_column
+        self.text_columns = {name_column, *text_columns}
+        self._keys = {}
+        self._orders = {}
+        self._names = None
+        self._frame_bytes = int(self.frame.memory_usage(index=False, deep=True).sum())
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def nbytes(self):
+        """
+        Approximate memory held: the frame plus the sort keys, sort orders
+        and name index computed so far.
+        """
+        names = 0 if self._names is None else int(self._names.memory_usage(index=False, deep=True))
+        return (self._frame_bytes + names + sum(key.nbytes for key in self._keys.values())
+                + sum(order.nbytes for order in self._orders.values()))
+
+    def with_column(self, name, values, position=None):
+        """
+        Returns a table with one extra (or replaced) column, e.g. scores that
+        depend on request parameters. Sort orders of the other columns are
+        shared with this table, but are counted in both tables' nbytes: the
+        new table keeps them (and the rest of the frame) alive even after
+        this one is evicted.
+        """
+        frame = self.frame.copy(deep=False)
+        if name in frame.columns:
+            frame[name] = values
+        else:
+            frame.insert(len(frame.columns) if position is None else position, name, values)
+
+        table = ResultTable.__new__(ResultTable)
+        table.frame = frame
+        table.name_column = self.name_column
+        table.text_columns = self.text_columns
+        table._names = self._names
+        table._keys = {k: v for k, v in self._keys.items() if k != name}
+        table._orders = {k: v for k, v in self._orders.items() if k[0] != name}
+        table._frame_bytes = int(frame.memory_usage(index=False, deep=True).sum())
+        return table
+
+    def _sort_key(self, column):
+        if column not in self._keys:
+            series = self.frame[column]
+            if column in self.text_columns:
+                # Rank of each name in case-insensitive alphabetical order
+                names = series.astype(str).str.casefold()
+                codes, _ = pd.factorize(names, sort=True)
+                key = codes.astype(np.float64)
+                key[series.isna().to_numpy()] = np.nan
+            else:
+                key = clean_numeric_series(series).to_numpy(dtype=np.float64, na_value=np.nan)
+            self._keys[column] = key
+        return self._keys[column]
+
+    def order(self, column, descending=False):
+        """
+        Row positions sorted by column, missing values last. Ties keep upload order.
+        """
+        cache_key = (column, descending)
+        if cache_key not in self._orders:
+            key = self._sort_key(column)
+            # Negating keeps NaN at the end for descending sorts too
+            self._orders[cache_key] = np.argsort(-key if descending else key, kind='stable')
+        return self._orders[cache_key]
+
+    def _name_mask(self, query):
+        if self._names is None:
+            self._names = self.frame[self.name_column].astype(str).str.casefold()
+        return self._names.str.contains(query.casefold(), regex=False).to_numpy()
+
+    @timed('sort')
+    def positions(self, sort=None, descending=False, query=''):
+        """
+        Row positions of the whole table in display order: sorted by sort
+        (None keeps upload order) and filtered by a name substring.
+        """
+        if sort in self.frame.columns:
+            positions = self.order(sort, descending)
+        else:
+            positions = np.arange(len(self.frame))
+
+        if query:
+            positions = positions[self._name_mask(query)[positions]]
+        return positions
+
+    def page(self, sort=None, descending=False, query='', page=1, per_page=DEFAULT_PER_PAGE):
+        """
+        Selects one page of rows.
+
+        Args:
+            sort (str, optional): Column to sort by; None keeps upload order.
+            descending (bool): Sort direction.
+            query (str): Case-insensitive substring filter on the name column.
+            page (int): 1-based page number, clamped to the available pages.
+            per_page (int): Rows per page, clamped to 1..MAX_PER_PAGE.
+
+        Returns:
+            dict: rows (DataFrame of the page), total (matching rows), page,
+            pages and per_page.
+        """
+        per_page = max(1, min(int(per_page), MAX_PER_PAGE))
+        positions = self.positions(sort, descending, query)
+
+        total = len(positions)
+        pages = max(1, math.ceil(total / per_page))
+        page = max(1, min(int(page), pages))
+        selected = positions[(page - 1) * per_page:page * per_page]
+
+        return {
+            'rows': self.frame.iloc[selected],
+            'total': total,
+            'page': page,
+            'pages': pages,
+            'per_page': per_page,
+        }
@@ -0,0 +1,58 @@
+# Job functions run by jobs.JobManager in pool processes. Each takes a
+# JobContext first and returns a JSON-friendly result.
+from datastore import ensure_cached, read_cached, result_key, write_result, read_result
+from processing import calculate_percentiles, percentiles_against
+from reference_store import ReferenceStore
+
+
+def percentiles_result_key(mapping, group_by=(), reference=None, reference_version=None):
+    """
+    Key under which compute_percentiles stores its table for these settings.
+    """
+    if reference:
+        return result_key('percentiles', mapping, [], reference, reference_version)
+    return result_key('percentiles', mapping, list(group_by), None, None)
+
+
+def ingest_upload(ctx, filepath, cache_root, stream_threshold, digest=None):
+    """
+    Parses an upload into the columnar cache. Returns {'digest': ...}.
+    digest is the upload's content digest, if known, so the file is not
+    hashed again.
+    """
+    ctx.progress('Parsing upload')
+    return {'digest': ensure_cached(filepath, cache_root, stream_threshold=stream_threshold,
+                                    content_digest=digest)}
+
+
+def compute_percentiles(ctx, filepath, cache_root, stream_threshold, mapping, group_by=(),
+                        reference_db=None, reference=None, digest=None):
+    """
+    Ranks an upload (against itself, within peer groups, or against a stored
+    reference population) and stores the table with write_result. digest is
+    the upload's content digest, as for ingest_upload.
+
+    Returns:
+        dict: digest of the dataset and key of the stored result.
+    """
+    ctx.progress('Parsing upload')
+    digest = ensure_cached(filepath, cache_root, stream_threshold=stream_threshold, content_digest=digest)
+
+    store = ReferenceStore(reference_db) if reference else None
+    key = percentiles_result_key(mapping, group_by, reference, store and store.version(reference))
+    if read_result(cache_root, digest, key) is not None:
+        return {'digest': digest, 'key': key}
+
+    ctx.progress('Loading mapped columns')
+    metric_columns = [col for metric, col in mapping.items() if metric != 'Player Name']
+    df = read_cached(cache_root, digest, [*mapping.values(), *group_by], numeric=metric_columns)
+
+    ctx.progress('Ranking')
+    if reference:
+        table = percentiles_against(store.index(reference), df, mapping)
+    else:
+        table = calculate_percentiles(df, mapping, group_by=list(group_by))
+
+    ctx.progress('Saving results')
+    write_result(cache_root, digest, key, table)
+    return {'digest': digest, 'key': key}
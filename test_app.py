@@ -0,0 +1,419 @@
+import gzip
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+import types
+
+import pandas as pd
+import pytest
+
+import app as app_module
+import datastore
+from datastore import read_result
+from tasks import percentiles_result_key
+from processing import TARGET_METRICS, load_data, clean_numeric_series
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MAPPING = {
+    'Player Name': 'playerFullName',
+    'K%': 'K%',
+    'BB%': 'BB%',
+    'Chase%': 'Chase%',
+    'Contact%': 'Contact%',
+    'EV': 'ExitVel',
+    'Max EV': 'MxExitVel',
+}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app_module.app.config, 'CACHE_FOLDER', str(tmp_path / '.cache'))
+    monkeypatch.setitem(app_module.app.config, 'REFERENCE_DB', str(tmp_path / 'reference.sqlite'))
+    monkeypatch.setitem(app_module.app.config, 'JOB_FOLDER', str(tmp_path / '.jobs'))
+    # Jobs run inline, so following redirects lands on the finished results
+    monkeypatch.setitem(app_module.app.config, 'JOB_WORKERS', 0)
+    app_module.app.config['TESTING'] = True
+    with app_module.app.test_client() as client:
+        yield client
+
+
+def test_cold_start_skips_data_libraries(client):
+    # A fresh interpreter, since this one already imported them
+    code = 'import sys, app; print([m for m in ("pandas", "numpy", "openpyxl") if m in sys.modules])'
+    out = subprocess.run([sys.executable, '-c', code], cwd=HERE, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == '[]'
+
+    # The warm-up leaves SciPy to the comps pages
+    code = 'import sys, app; [__import__(m) for m in app.DATA_MODULES]; print("scipy" in sys.modules)'
+    out = subprocess.run([sys.executable, '-c', code], cwd=HERE, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == 'False'
+
+    assert client.get('/healthz').get_json() == {'status': 'ok'}
+
+
+def upload_and_map(client, mapping=MAPPING, group_by=()):
+    with open(os.path.join(HERE, 'hitting.csv'), 'rb') as f:
+        data = f.read()
+    resp = client.post('/upload', data={'file': (io.BytesIO(data), 'hitting.csv')},
+                       content_type='multipart/form-data')
+    assert resp.status_code == 200
+
+    form = {f'map_{metric}': mapping.get(metric, 'None') for metric in TARGET_METRICS}
+    form['map_Player Name'] = mapping['Player Name']
+    form['group_by'] = list(group_by) or ['None']
+    return client.post('/calculate', data=form, follow_redirects=True)
+
+
+def test_uploads_are_content_addressed(client, tmp_path):
+    def upload(data, name):
+        resp = client.post('/upload', data={'file': (io.BytesIO(data), name)}, content_type='multipart/form-data')
+        with client.session_transaction() as sess:
+            return resp.status_code, sess.get('dataset'), sess.get('filename')
+
+    first = upload(b'Player,K%\nAnn,20.1%\n', 'stats.csv')
+    second = upload(b'Player,K%\nBo,18.0%\n', 'stats.csv')
+    again = upload(b'Player,K%\nAnn,20.1%\n', 'copy of stats.csv')
+    assert first[0] == second[0] == 200
+    # Same name, different contents: both kept; same contents: stored once
+    assert first[1] != second[1] and again[1:] == first[1:]
+    assert os.path.exists(tmp_path / first[2]) and os.path.exists(tmp_path / second[2])
+    assert upload(b'x', 'notes.txt')[0] == 400
+
+    # Once the sweeper deleted the session's upload, pages go back to the form
+    assert app_module.sweep_uploads_now()['removed'] == 0
+    os.remove(tmp_path / again[2])
+    assert client.get('/results').headers['Location'].endswith('/')
+    with client.session_transaction() as sess:
+        assert 'filename' not in sess
+
+
+def test_uploads_are_hashed_once(client, monkeypatch):
+    # store_upload hashes the file while saving it; the jobs reuse its digest
+    def rehash(path):
+        raise AssertionError(f'{path} hashed again')
+
+    monkeypatch.setattr(datastore, 'file_digest', rehash)
+    assert upload_and_map(client).status_code == 200
+    with client.session_transaction() as sess:
+        digest = sess['dataset']
+    assert read_result(app_module.app.config['CACHE_FOLDER'], digest, percentiles_result_key(MAPPING)) is not None
+
+
+def test_sweeper_survives_failed_passes(monkeypatch, caplog):
+    class Stop(BaseException):
+        pass
+
+    passes = []
+
+    def sweep():
+        passes.append(1)
+        raise RuntimeError('bad pass')
+
+    def sleep(seconds):
+        if len(passes) == 2:
+            raise Stop
+
+    monkeypatch.setattr(app_module, 'sweep_uploads_now', sweep)
+    monkeypatch.setattr(app_module, 'time', types.SimpleNamespace(sleep=sleep))
+    with pytest.raises(Stop):
+        app_module.sweep_forever()
+    assert len(passes) == 2
+    assert caplog.text.count('Upload sweep failed') == 2 and 'RuntimeError: bad pass' in caplog.text
+
+
+def test_percentile_lookup(client):
+    assert client.post('/api/percentiles', json={'values': {'K%': 10}}).status_code == 400
+
+    assert upload_and_map(client).status_code == 200
+
+    resp = client.post('/api/percentiles', json={'values': {'K%': '5.0%', 'Max EV': 130, 'xBA': 0.3}})
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body['percentiles'] == {'K%': 100.0, 'Max EV': 100.0, 'xBA': None}
+    assert body['population']['xBA'] == 0
+
+    assert client.post('/api/percentiles', json={'values': {'Bogus': 1}}).status_code == 400
+
+
+def test_api_rejects_bodies_that_are_not_objects(client):
+    assert upload_and_map(client).status_code == 200
+    for url in ('/api/percentiles', '/api/synthetic_xwoba', '/api/calibrate', '/api/comps'):
+        for body in ([1, 2], 'K%', 3):
+            resp = client.post(url, json=body)
+            assert resp.status_code == 400 and resp.get_json() == {'error': 'Expected a JSON object.'}
+
+
+def test_synthetic_xwoba_endpoint_matches_page(client):
+    upload_and_map(client)
+    weights = {'w_bb': '0.9', 'w_k': '0.5', 'w_power': '0.3', 'w_contact': '0.1', 'base_woba': '0.3'}
+
+    resp = client.post('/api/synthetic_xwoba', json={'weights': weights})
+    assert resp.status_code == 200
+    body = resp.get_json()
+    scores = body['scores']
+    # One page, best score first
+    assert len(scores) == 50
+    assert scores == sorted(scores, reverse=True)
+    assert body['view']['total'] == 3005
+    assert body['rows_html'].count('<tr>') == 50
+
+    # The page rendered afterwards uses the weights the endpoint stored
+    page = client.get('/advanced_analysis').get_data(as_text=True)
+    assert 'value="0.9"' in page
+    assert f'<td class="highlight-metric">{scores[0]}</td>' in page
+
+
+def test_calibrate_weights_against_outcome(client):
+    upload_and_map(client)
+    page = client.get('/advanced_analysis').get_data(as_text=True)
+    assert '<option value="OPS" selected>OPS</option>' in page
+
+    resp = client.post('/api/calibrate', json={'outcome': 'OBP', 'folds': 4})
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert set(body['weights']) == {'w_bb', 'w_k', 'w_power', 'w_contact', 'base_woba'}
+    assert body['diagnostics']['folds'] == 4
+    assert body['diagnostics']['cv_rmse'] < body['diagnostics']['baseline_rmse']
+
+    assert client.post('/api/calibrate', json={'outcome': 'nope'}).status_code == 400
+    assert client.post('/api/calibrate', json={'outcome': 'OBP', 'folds': 1}).status_code == 400
+
+
+def test_player_comps(client, monkeypatch):
+    upload_and_map(client)
+    resp = client.post('/api/comps', json={'player': 'cardell thibodeaux', 'k': 3})
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body['player']['Player Name'] == 'Cardell Thibodeaux'
+    assert set(body['metrics']) == set(MAPPING) - {'Player Name'}
+    distances = [comp['distance'] for comp in body['comps']]
+    assert len(distances) == 3 and distances == sorted(distances)
+
+    # The index is built once per dataset and mapping
+    import comps
+    monkeypatch.setattr(comps, 'calculate_percentiles', None)
+    page = client.get('/comps?player=Cardell+Thibodeaux&k=3').get_data(as_text=True)
+    assert page.count('<td class="player-name">') == 4
+    assert body['comps'][0]['Player Name'] in page
+
+    assert client.post('/api/comps', json={'player': 'Nobody'}).status_code == 404
+    assert 'No player named' in client.get('/comps?player=Nobody').get_data(as_text=True)
+
+
+def test_server_timing_and_metrics(client):
+    upload_and_map(client)
+
+    resp = client.get('/advanced_analysis')
+    stages = dict(part.split(';dur=') for part in resp.headers['Server-Timing'].split(', '))
+    # Tables may already be in the result cache; paging and rendering always run
+    assert {'sort', 'page', 'cells', 'render', 'total'} <= set(stages)
+    assert all(float(ms) >= 0 for ms in stages.values())
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'savant_stage_seconds_count{route="advanced_analysis",stage="render"}' in text
+    assert 'savant_request_seconds_count{route="advanced_analysis"}' in text
+    # Ranking ran in the percentiles job; it is reported once, under the job
+    assert 'route="job:percentiles",stage="rank"' in text
+    assert 'savant_result_cache_entries ' in text
+
+
+def test_profile_flag(client, monkeypatch, tmp_path):
+    upload_and_map(client)
+    monkeypatch.setitem(app_module.app.config, 'PROFILE_FOLDER', str(tmp_path / 'profiles'))
+    assert 'X-Profile-Dump' not in client.get('/results?profile=1').headers
+
+    monkeypatch.setitem(app_module.app.config, 'PROFILE_REQUESTS', 'flag')
+    assert 'X-Profile-Dump' not in client.get('/results').headers
+    dump = client.get('/results', headers={'X-Profile': '1'}).headers['X-Profile-Dump']
+    assert '_results_' in dump and '_3005rows_' in dump
+    assert os.listdir(tmp_path / 'profiles') == [dump]
+
+
+def test_invalid_profile_mode_disables_profiling(client, monkeypatch, caplog):
+    upload_and_map(client)
+    monkeypatch.setitem(app_module.app.config, 'PROFILE_REQUESTS', 'yes')
+    app_module.check_profile_mode()
+    assert app_module.app.config['PROFILE_REQUESTS'] == 'off'
+    assert "not 'yes'" in caplog.text
+    resp = client.get('/results?profile=1')
+    assert resp.status_code == 200 and 'X-Profile-Dump' not in resp.headers
+
+
+def test_results_are_paged_sorted_and_filtered(client):
+    resp = upload_and_map(client)
+    page = resp.get_data(as_text=True)
+    assert 'Ranked <strong>3005</strong> Players' in page
+    assert page.count('<td class="player-name">') == 50
+
+    page = client.get('/results?sort=K%25&order=desc&per_page=10&page=2').get_data(as_text=True)
+    assert page.count('<td class="player-name">') == 10
+    assert 'Page 2 of 301' in page
+
+    page = client.get('/results?q=thibodeaux').get_data(as_text=True)
+    assert page.count('<td class="player-name">') == 1
+    assert 'Cardell Thibodeaux' in page
+
+
+def test_result_cache_reuses_tables(client, monkeypatch):
+    monkeypatch.setattr(app_module, '_result_caches', {})
+    upload_and_map(client)
+    client.get('/results?page=2')
+    client.get('/advanced_analysis')
+    client.get('/advanced_analysis?page=2')
+
+    # Misses: the percentile table, the formula inputs, the scored table
+    stats = client.get('/api/cache_stats').get_json()
+    assert (stats['entries'], stats['hits'], stats['misses'], stats['evictions']) == (3, 3, 3, 0)
+    assert 0 < stats['bytes'] <= stats['max_bytes']
+
+
+def test_pages_revalidate_and_compress(client):
+    upload_and_map(client)
+    resp = client.get('/results', headers={'Accept-Encoding': 'gzip'})
+    etag = resp.headers['ETag']
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert 'Ranked <strong>3005</strong> Players' in gzip.decompress(resp.data).decode()
+
+    assert client.get('/results', headers={'If-None-Match': etag}).status_code == 304
+    assert client.get('/results?page=2', headers={'If-None-Match': etag}).status_code == 200
+
+    # New weights give the advanced page a new ETag
+    etag = client.get('/advanced_analysis').headers['ETag']
+    assert client.get('/advanced_analysis', headers={'If-None-Match': etag}).status_code == 304
+    client.post('/api/synthetic_xwoba', json={'weights': {'w_bb': 0.9}})
+    assert client.get('/advanced_analysis', headers={'If-None-Match': etag}).status_code == 200
+
+    # Static URLs carry a content hash and may be cached for good
+    page = client.get('/advanced_analysis').get_data(as_text=True)
+    css = re.search(r'"(/static/style.css\?v=\w+)"', page).group(1)
+    resp = client.get(css, headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    with open(os.path.join(HERE, 'static', 'style.css'), 'rb') as f:
+        assert gzip.decompress(resp.data) == f.read()
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_advanced_shows_values_as_uploaded(client, monkeypatch, streaming):
+    monkeypatch.setattr(app_module, '_result_caches', {})
+    if streaming:
+        monkeypatch.setitem(app_module.app.config, 'STREAMING_THRESHOLD_BYTES', 0)
+    upload_and_map(client)
+
+    # Ranked from cleaned numbers, displayed and exported as in the file
+    page = client.get('/advanced_analysis?q=thibodeaux').get_data(as_text=True)
+    assert '>11.3%<' in page and '>81.3%<' in page
+    exported = pd.read_csv(io.BytesIO(client.get('/export/synthetic_xwoba.csv?q=thibodeaux').data), dtype=str)
+    assert exported[['K%', 'BB%', 'Contact%', 'Max EV']].values.tolist() == [['11.3%', '16.4%', '81.3%', '101.9']]
+
+
+def test_exports_stream_cached_tables(client):
+    assert client.get('/export/percentiles.csv').status_code == 400
+    upload_and_map(client)
+
+    resp = client.get('/export/percentiles.csv?sort=K%25&order=desc')
+    assert resp.is_streamed
+    assert resp.headers['Content-Disposition'] == 'attachment; filename=percentiles.csv'
+    exported = pd.read_csv(io.BytesIO(resp.data))
+    assert len(exported) == 3005
+    assert exported['K%'].dropna().is_monotonic_decreasing
+
+    resp = client.get('/export/synthetic_xwoba.ndjson?q=thibodeaux')
+    rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+    assert len(rows) == 1 and rows[0]['Player Name'] == 'Cardell Thibodeaux'
+    assert isinstance(rows[0]['Synthetic xwOBA'], float)
+
+    assert client.get('/export/percentiles.xlsx').status_code == 404
+    assert client.get('/export/percentiles.parquet').status_code in (200, 501)
+
+
+def test_parquet_link_only_with_pyarrow(client, monkeypatch):
+    upload_and_map(client)
+    for available in (False, True):
+        monkeypatch.setattr(app_module, 'parquet_available', lambda: available)
+        page = client.get('/results').get_data(as_text=True)
+        assert '/export/percentiles.csv' in page
+        assert ('/export/percentiles.parquet' in page) == available
+
+
+def test_peer_groups_switch_without_reparsing(client, monkeypatch):
+    page = upload_and_map(client, group_by=['newestTeamLevel', 'pos']).get_data(as_text=True)
+    assert 'within peer groups by <strong>newestTeamLevel × pos</strong>' in page
+    assert '<td>BBC / LF</td>' in page
+
+    # Switching the grouping re-ranks from the columnar cache
+    def no_parsing(*args, **kwargs):
+        raise AssertionError('upload was parsed again')
+    monkeypatch.setattr(datastore, 'load_data', no_parsing)
+    monkeypatch.setattr(datastore, 'read_csv_columns', no_parsing)
+
+    page = client.post('/peer_groups', data={'group_by': ['pos', 'None']},
+                       follow_redirects=True).get_data(as_text=True)
+    assert 'within peer groups by <strong>pos</strong>' in page
+
+    with client.session_transaction() as sess:
+        digest = sess['dataset']
+    table = read_result(app_module.app.config['CACHE_FOLDER'], digest, percentiles_result_key(MAPPING, ['pos']))
+    df = load_data(os.path.join(HERE, 'hitting.csv'))
+    expected = (clean_numeric_series(df['MxExitVel']).groupby(df['pos']).rank(pct=True) * 100).round(0)
+    assert table['Max EV'].tolist() == expected.tolist()
+    assert table['Peer Group'].tolist() == df['pos'].tolist()
+
+
+def test_rank_small_upload_against_reference(client):
+    upload_and_map(client)
+    client.post('/reference/save', data={'name': 'D1'})
+    client.post('/reference/save', data={'name': 'D1 sketch', 'approximate': '1'})
+
+    # A 20-player showcase file, ranked against the stored population
+    df = load_data(os.path.join(HERE, 'hitting.csv'))
+    showcase = df.head(20).to_csv(index=False).encode()
+    client.post('/upload', data={'file': (io.BytesIO(showcase), 'showcase.csv')},
+                content_type='multipart/form-data')
+    form = {f'map_{metric}': MAPPING.get(metric, 'None') for metric in TARGET_METRICS}
+    form['map_Player Name'] = MAPPING['Player Name']
+    client.post('/calculate', data=form)
+
+    page = client.post('/reference', data={'reference': 'D1'}, follow_redirects=True).get_data(as_text=True)
+    assert 'against reference population <strong>D1</strong>' in page
+    assert 'D1 (3005 players)' in page
+
+    resp = client.post('/api/percentiles', json={'values': {'K%': '5.0%'}, 'reference': 'D1'})
+    assert resp.get_json() == {'percentiles': {'K%': 100.0}, 'population': {'K%': 3005}}
+    resp = client.post('/api/percentiles', json={'values': {'K%': '5.0%'}, 'reference': 'D1 sketch'})
+    assert resp.get_json() == {'percentiles': {'K%': 100.0}, 'population': {'K%': 3005}}
+    assert 'D1 sketch (3005 players, approximate)' in page
+    assert client.post('/api/percentiles', json={'values': {'K%': 1}, 'reference': 'nope'}).status_code == 404
+
+
+def test_calculate_returns_job_at_once(client, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, 'JOB_WORKERS', 1)
+    with open(os.path.join(HERE, 'hitting.csv'), 'rb') as f:
+        client.post('/upload', data={'file': (f, 'hitting.csv')}, content_type='multipart/form-data')
+
+    form = {f'map_{metric}': MAPPING.get(metric, 'None') for metric in TARGET_METRICS}
+    form['map_Player Name'] = MAPPING['Player Name']
+    resp = client.post('/calculate', data=form)
+    assert resp.status_code == 302
+    job_id = resp.location.rsplit('/', 1)[-1]
+
+    try:
+        for _ in range(600):
+            status = client.get(f'/api/jobs/{job_id}').get_json()
+            if status['status'] not in ('queued', 'running'):
+                break
+            time.sleep(0.05)
+        assert status['status'] == 'done'
+
+        page = client.get(f'/jobs/{job_id}', follow_redirects=True).get_data(as_text=True)
+        assert 'Ranked <strong>3005</strong> Players' in page
+    finally:
+        for manager in app_module._job_managers.values():
+            manager.shutdown()
+        app_module._job_managers.clear()
@@ -0,0 +1,26 @@
+from benchmarks.suite import run_suite, find_regressions
+
+
+def test_suite_runs_every_step():
+    import app as app_module
+    config = dict(app_module.app.config)
+    stores = set(app_module._reference_stores)
+    document = run_suite(sizes=[200], repeat=1)
+    # The Flask steps ran against temporary folders and databases only
+    assert dict(app_module.app.config) == config
+    assert set(app_module._reference_stores) == stores
+    steps = document['results']['200']
+    assert set(steps) == {
+        'load_data', 'clean_numeric_series', 'calculate_percentiles', 'calculate_synthetic_xwoba',
+        'flask_upload', 'flask_calculate', 'flask_advanced_analysis', 'flask_flow',
+    }
+    assert all(seconds > 0 for seconds in steps.values())
+
+
+def test_find_regressions():
+    baseline = {'results': {'1000': {'load_data': 1.0, 'calculate_percentiles': 0.001}}}
+    current = {'results': {'1000': {'load_data': 1.5, 'calculate_percentiles': 0.003, 'new_step': 9.0}}}
+
+    # The tiny step is within the absolute allowance; the new step has no baseline
+    assert find_regressions(current, baseline, tolerance=1.25) == [('1000', 'load_data', 1.0, 1.5)]
+    assert find_regressions(current, baseline, tolerance=2.0) == []
@@ -1,42 +1,212 @@
-import pandas as pd
-import numpy as np
-from processing import calculate_percentiles
-
-def test_calculation():
-    # Create dummy data
-    data = {
-        'Name': ['A', 'B', 'C', 'D', 'E'],
-        'ExitVelocity': [100, 90, 80, 70, np.nan], # Higher is better
-        'Strikeouts': [10, 20, 30, 40, 50],      # Lower is better (K%)
-        'SwingLength': [6.0, 6.5, 7.0, 7.5, 8.0] # Lower is better
-    }
-    df = pd.DataFrame(data)
-    
-    mapping = {
-        'Player Name': 'Name',
-        'Max EV': 'ExitVelocity',
-        'K%': 'Strikeouts',
-        'Swing Length': 'SwingLength'
-    }
-    
-    print("Input Data:")
-    print(df)
-    
-    results = calculate_percentiles(df, mapping)
-    
-    print("\nCalculated Percentiles:")
-    print(results[['Player Name', 'Max EV', 'K%', 'Swing Length']])
-    
-    # Assertions
-    # Swing Length: A(6.0) is lowest -> Highest Rank (100). E(8.0) is highest -> Lowest Rank (20).
-    
-    row_a = results[results['Player Name'] == 'A'].iloc[0]
-    assert row_a['Swing Length'] == 100.0, f"Expected 100 for Swing Length 6.0, got {row_a['Swing Length']}"
-    
-    row_e = results[results['Player Name'] == 'E'].iloc[0]
-    assert row_e['Swing Length'] == 20.0, f"Expected 20 for Swing Length 8.0, got {row_e['Swing Length']}"
-    
-    print("\nAll tests passed!")
-
-if __name__ == "__main__":
-    test_calculation()
+import os
+import pandas as pd
+import numpy as np
+from processing import calculate_percentiles
+
+def test_calculation():
+    # Create dummy data
+    data = {
+        'Name': ['A', 'B', 'C', 'D', 'E'],
+        'ExitVelocity': [100, 90, 80, 70, np.nan], # Higher is better
+        'Strikeouts': [10, 20, 30, 40, 50],      # Lower is better (K%)
+        'SwingLength': [6.0, 6.5, 7.0, 7.5, 8.0] # Lower is better
+    }
+    df = pd.DataFrame(data)
+    
+    mapping = {
+        'Player Name': 'Name',
+        'Max EV': 'ExitVelocity',
+        'K%': 'Strikeouts',
+        'Swing Length': 'SwingLength'
+    }
+    
+    results = calculate_percentiles(df, mapping)
+
+    # Higher is better for Max EV; the missing value stays unranked
+    assert results['Max EV'].tolist() == [100, 75, 50, 25, pd.NA]
+    # Lower is better for K% and Swing Length: A (10, 6.0) ranks 100, E (50, 8.0) ranks 20
+    assert results['K%'].tolist() == [100, 80, 60, 40, 20]
+    assert results['Swing Length'].tolist() == [100, 80, 60, 40, 20]
+    assert results['Player Name'].tolist() == ['A', 'B', 'C', 'D', 'E']
+    # Unmapped metrics are all missing
+    assert results['xwOBA'].isna().all()
+
+
+def _reference_percentiles(df, mapping):
+    # The original one-metric-at-a-time Series.rank implementation
+    from processing import TARGET_METRICS, LOWER_IS_BETTER, clean_numeric_series
+    result_df = pd.DataFrame()
+    player_col = mapping.get('Player Name')
+    if player_col and player_col in df.columns:
+        result_df['Player Name'] = df[player_col]
+    else:
+        result_df['Player Name'] = df.index.astype(str)
+    for metric in TARGET_METRICS:
+        user_col = mapping.get(metric)
+        if not user_col or user_col not in df.columns:
+            result_df[metric] = pd.Series(pd.NA, index=df.index, dtype='Int8')
+            continue
+        series = clean_numeric_series(df[user_col])
+        ranks = series.rank(pct=True, ascending=metric not in LOWER_IS_BETTER)
+        # Percentiles are kept as nullable small integers
+        result_df[metric] = (ranks * 100).round(0).astype('Int8')
+    return result_df
+
+def test_vectorized_matches_series_rank():
+    from processing import TARGET_METRICS
+    rng = np.random.default_rng(7)
+    n = 2000
+    data = {'Name': [f'P{i}' for i in range(n)]}
+    for i, metric in enumerate(TARGET_METRICS):
+        # Few distinct values so ties are common, plus some NaNs
+        col = rng.integers(0, 40, n).astype(float)
+        col[rng.random(n) < 0.1] = np.nan
+        data[metric] = col
+    data['K%'] = [f'{v}%' for v in data['K%']]
+    df = pd.DataFrame(data)
+    mapping = {m: m for m in TARGET_METRICS if m != 'OAA'}
+    mapping['Player Name'] = 'Name'
+
+    pd.testing.assert_frame_equal(calculate_percentiles(df, mapping), _reference_percentiles(df, mapping))
+
+def test_vectorized_matches_series_rank_on_hitting_csv():
+    df = pd.read_csv(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hitting.csv'))
+    mapping = {
+        'Player Name': 'playerFullName', 'K%': 'K%', 'BB%': 'BB%', 'Chase%': 'Chase%',
+        'Contact%': 'Contact%', 'EV': 'ExitVel', 'Max EV': 'MxExitVel', 'xOBP': 'OBP', 'xSLG': 'SLG',
+    }
+    pd.testing.assert_frame_equal(calculate_percentiles(df, mapping), _reference_percentiles(df, mapping))
+
+def test_percentile_index_matches_reranking():
+    from processing import PercentileIndex
+    rng = np.random.default_rng(3)
+    n = 500
+    population = pd.DataFrame({
+        'Name': [f'P{i}' for i in range(n)],
+        'EV': rng.integers(80, 100, n).astype(float),
+        'K': [f'{v:.1f}%' for v in rng.integers(100, 300, n) / 10],
+    })
+    population.loc[::7, 'EV'] = np.nan
+    mapping = {'Player Name': 'Name', 'Max EV': 'EV', 'K%': 'K'}
+    index = PercentileIndex.from_frame(population, mapping)
+
+    for ev, k in [(95.0, '18.2%'), (80.0, '10.0%'), (120.0, '29.9%'), (90.0, '20.0%')]:
+        prospect = pd.DataFrame({'Name': ['New'], 'EV': [ev], 'K': [k]})
+        expected = calculate_percentiles(pd.concat([population, prospect], ignore_index=True), mapping).iloc[-1]
+        got = index.lookup({'Max EV': ev, 'K%': k, 'xBA': 0.3})
+        assert got['Max EV'] == expected['Max EV']
+        assert got['K%'] == expected['K%']
+        assert got['xBA'] is None
+
+def test_synthetic_xwoba_matches_formula():
+    from processing import calculate_synthetic_xwoba, synthetic_xwoba_features, score_synthetic_xwoba
+    df = pd.DataFrame({
+        'BB': ['10.0%', '5.5%', None],
+        'K': [20.0, 30.0, 15.0],
+        'EV': [105.0, np.nan, 95.0],
+    })
+    mapping = {'BB%': 'BB', 'K%': 'K', 'Max EV': 'EV'}  # Contact% unmapped -> 0
+    weights = {'w_bb': 0.8, 'w_k': 0.6, 'w_power': 0.3, 'w_contact': 0.1, 'base_woba': 0.3}
+
+    bb = np.array([10.0, 5.5, 0.0])
+    k = np.array([20.0, 30.0, 15.0])
+    ev = np.array([105.0, 0.0, 95.0])
+    expected = 0.3 + bb / 100 * 0.8 - k / 100 * 0.6 + (ev - 75) / 35 * 0.3 + (0 - 70) / 30 * 0.1
+
+    np.testing.assert_allclose(calculate_synthetic_xwoba(df, mapping, weights), expected)
+    features = synthetic_xwoba_features(df, mapping)
+    np.testing.assert_allclose(score_synthetic_xwoba(features, weights), expected)
+
+def test_numeric_cleaner_handles_units_and_text():
+    from processing import clean_numeric_series, parse_numeric_series
+    raw = pd.Series(['11.3%', ' 12.0 % ', '.544', '98.5 MPH', '6.1ft', 'N/A', '', None, '1.2.3', 'abc'], dtype=object)
+    expected = [11.3, 12.0, 0.544, 98.5, 6.1, np.nan, np.nan, np.nan, np.nan, np.nan]
+    np.testing.assert_array_equal(clean_numeric_series(raw).to_numpy(), expected)
+
+    assert parse_numeric_series(pd.Series(['20.1%', '18%']))[1] == '%'
+    assert parse_numeric_series(pd.Series(['92 mph', '95.5 mph']))[1] == 'mph'
+    assert parse_numeric_series(pd.Series(['1.5', '2']))[1] is None
+
+def test_numeric_cleaner_null_tokens_only_coerce_their_rows(monkeypatch):
+    import processing
+    raw = pd.Series(['1.5', 'NA', '-', '--', '-2', '1e3', 'inf', '.5', '5-3', '7'] * 100, dtype=object)
+    expected = pd.to_numeric(raw, errors='coerce').to_numpy()
+    expected[np.isinf(expected)] = np.nan
+
+    coerced = []
+    coerce = processing._coerce
+    monkeypatch.setattr(processing, '_coerce', lambda raw: coerced.append(len(raw)) or coerce(raw))
+    np.testing.assert_array_equal(processing.clean_numeric_series(raw).to_numpy(), expected)
+    # 'NA' and 'inf' are missing up front; the odd-looking rows, then the
+    # rows left after the '5-3' ones fail the cast
+    assert coerced == [300, 700]
+
+    coerced.clear()
+    np.testing.assert_array_equal(processing.clean_numeric_series(raw[raw != '5-3']).to_numpy(),
+                                  expected[raw != '5-3'])
+    assert coerced == [300]
+
+def _fuzz_corpus(size=5000, seed=0):
+    rng = np.random.default_rng(seed)
+    pieces = ['1', '2', '5', '0', '9', '.', '+', '-', 'e', 'E', '%', 'mph', 'MPH', 'ft', 'Ft',
+              ' ', '\t', 'NA', 'nan', 'inf', 'Infinity', '_', '\u0661', 'x', ',']
+    corpus = [''.join(rng.choice(pieces, rng.integers(1, 7))) for _ in range(size)]
+    # Past mismatches against the legacy cleaner
+    return corpus + ['Infinityft \t', '-inf%', ' nanmph', '1_000', '\u0661', '1e999', '.5ft', '']
+
+def test_numeric_cleaner_matches_legacy_on_fuzz_corpus():
+    from benchmarks.clean_numeric import legacy_clean_numeric_series
+    from processing import clean_numeric_series
+    raw = pd.Series(_fuzz_corpus(), dtype=object)
+    # The legacy chain parsed 'inf' text to an infinite stat; it is missing now
+    expected = legacy_clean_numeric_series(raw).to_numpy(dtype=np.float64)
+    expected[np.isinf(expected)] = np.nan
+    np.testing.assert_array_equal(clean_numeric_series(raw).to_numpy(), expected)
+    # The same values through the categorical and non-ASCII paths
+    np.testing.assert_array_equal(clean_numeric_series(raw.astype('category')).to_numpy(), expected)
+    np.testing.assert_array_equal(clean_numeric_series(pd.concat([raw, pd.Series(['\u00e9'])]))
+                                  .to_numpy()[:-1], expected)
+
+def test_ranks_at_float32_precision():
+    from processing import calculate_percentiles
+    values = [0.30000001, 0.30000002, 0.30000003, 0.5]
+    df = pd.DataFrame({'Name': list('abcd'), 'xBA': values})
+    ranked = calculate_percentiles(df, {'Player Name': 'Name', 'xBA': 'xBA'})
+    # The first two are the same float32 and tie; float64 ranks would be 25, 50, 75, 100
+    assert ranked['xBA'].tolist() == [38, 38, 75, 100]
+    expected = (pd.Series(values, dtype=np.float32).rank(pct=True) * 100).round(0)
+    assert ranked['xBA'].tolist() == expected.tolist()
+
+def test_grouped_ranking_matches_groupby_rank():
+    from processing import rank_percentiles
+    rng = np.random.default_rng(1)
+    matrix = rng.integers(0, 20, (5000, 3)).astype(float)
+    matrix[rng.random(matrix.shape) < 0.1] = np.nan
+    groups = rng.integers(0, 50, 5000)
+
+    got = rank_percentiles(matrix, [False, True, False], groups=groups)
+    for j, sign in enumerate([1, -1, 1]):
+        expected = (pd.Series(matrix[:, j] * sign).groupby(groups).rank(pct=True) * 100).round(0)
+        np.testing.assert_array_equal(got[:, j], expected.to_numpy())
+
+def test_tier_cells_match_color_tiers():
+    from tables import tier_cells
+    pct = np.array([[10, 11, 39.9, 40, 59, 60, 89, 90, np.nan]])
+    expected = ['rank-1-10">10', 'rank-11-39">11', 'rank-11-39">39', 'rank-40-59">40', 'rank-40-59">59',
+                'rank-60-89">60', 'rank-60-89">89', 'rank-90-100">90', 'rank-na">N/A']
+    assert tier_cells(pct) == [''.join(f'<td class="{cell}</td>' for cell in expected)]
+
+    # Raw values are escaped; cells without a percentile stay uncolored
+    cells = tier_cells([[95, np.nan]], [['<b>', 3.5]], missing=(None, None))
+    assert cells == ['<td class="rank-90-100">&lt;b&gt;</td><td>3.5</td>']
+
+def test_scalar_cleaner_matches_column_cleaner():
+    from processing import clean_numeric_series, clean_numeric_value
+    corpus = _fuzz_corpus(seed=1) + ['11.6%', ' 98.5 MPH ', '\u00e9', 'N/A', '1_000', '\u0661\u0662']
+    expected = clean_numeric_series(pd.Series(corpus, dtype=object)).to_numpy()
+    np.testing.assert_array_equal([clean_numeric_value(v) for v in corpus], expected)
+    assert np.isnan(clean_numeric_value('1_000')) and np.isnan(clean_numeric_value('\u0661'))
+    assert clean_numeric_value(0.25) == 0.25 and np.isnan(clean_numeric_value(None))
+
+if __name__ == "__main__":
+    test_calculation()
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from calibration import calibrate_weights, calibration_inputs, ridge_path
+from processing import synthetic_xwoba_features
+
+MAPPING = {'BB%': 'bb', 'K%': 'k', 'Max EV': 'ev', 'Contact%': 'contact'}
+
+
+def frame(rows=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'bb': rng.uniform(2, 20, rows),
+        'k': rng.uniform(5, 35, rows),
+        'ev': rng.uniform(80, 110, rows),
+        'contact': rng.uniform(60, 95, rows),
+    })
+
+
+def test_ridge_path_matches_least_squares():
+    features = synthetic_xwoba_features(frame(), MAPPING)
+    target = np.random.default_rng(1).normal(size=len(features))
+
+    weights, intercepts = ridge_path(features, target, [0.0, 1.0])
+    design = np.column_stack([features, np.ones(len(features))])
+    expected = np.linalg.lstsq(design, target, rcond=None)[0]
+    np.testing.assert_allclose(weights[0], expected[:4])
+    assert intercepts[0] == pytest.approx(expected[4])
+    # A large penalty shrinks the weights
+    assert np.abs(weights[1]).sum() < np.abs(weights[0]).sum()
+
+
+def test_calibration_recovers_weights():
+    df = frame()
+    true = {'w_bb': 0.9, 'w_k': 0.4, 'w_power': 0.15, 'w_contact': 0.05, 'base_woba': 0.3}
+    features = synthetic_xwoba_features(df, MAPPING)
+    noise = np.random.default_rng(2).normal(0, 0.005, len(df))
+    df['obp'] = features @ [0.9, 0.4, 0.15, 0.05] + 0.3 + noise
+    # Rows missing an input or the outcome are left out, not zero-filled
+    df.loc[:9, 'ev'] = np.nan
+    df.loc[10:19, 'obp'] = np.nan
+
+    features, target, fitted = calibration_inputs(df, MAPPING, 'obp')
+    assert len(target) == len(df) - 20
+    result = calibrate_weights(features, target, fitted)
+    for key, value in true.items():
+        assert result['weights'][key] == pytest.approx(value, abs=0.01)
+    diagnostics = result['diagnostics']
+    assert diagnostics['rows'] == len(df) - 20
+    assert diagnostics['cv_r2'] > 0.9
+    assert diagnostics['cv_rmse'] < diagnostics['baseline_rmse']
+
+
+def test_unmapped_inputs_keep_their_weight():
+    df = frame()
+    df['ops'] = synthetic_xwoba_features(df, MAPPING) @ [0.9, 0.4, 0.15, 0.05] + 0.7
+    mapping = {metric: col for metric, col in MAPPING.items() if metric != 'Max EV'}
+
+    features, target, fitted = calibration_inputs(df, mapping, 'ops')
+    assert fitted == ['BB%', 'K%', 'Contact%']
+    result = calibrate_weights(features, target, fitted, baseline={'w_power': 0.5})
+    assert result['weights']['w_power'] == 0.5
+    assert result['weights']['w_bb'] == pytest.approx(0.9, abs=0.05)
+    assert result['diagnostics']['train_r2'] > 0.5
+
+    with pytest.raises(ValueError):
+        calibrate_weights(features[:5], target[:5], fitted)
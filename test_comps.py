@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from comps import CompsIndex, NEUTRAL_PERCENTILE
+
+
+def test_comps_match_brute_force():
+    rng = np.random.default_rng(0)
+    percentiles = rng.integers(1, 101, (2000, 6)).astype(float)
+    names = [f'Player {i}' for i in range(2000)]
+    index = CompsIndex(names, percentiles, list('abcdef'))
+
+    positions, distances = index.query(7, k=5)
+    gaps = np.sqrt(((percentiles - percentiles[7]) ** 2).mean(axis=1))
+    gaps[7] = np.inf
+    expected = np.argsort(gaps, kind='stable')[:5]
+    np.testing.assert_allclose(distances, gaps[expected])
+    assert 7 not in positions
+    assert index.find(' player 7 ') == [7]
+
+
+def test_missing_percentiles_count_as_neutral():
+    percentiles = np.array([
+        [90, 90, 90, 90],
+        [90, 90, np.nan, 90],          # one gap: filled with the middle of the pool
+        [90, np.nan, np.nan, np.nan],  # mostly unknown: never offered as a comp
+        [10, 10, 10, 10],
+    ])
+    index = CompsIndex(['A', 'B', 'C', 'D'], percentiles, list('wxyz'))
+
+    positions, distances = index.query(0, k=3)
+    assert positions.tolist() == [1, 3]
+    assert distances[0] == pytest.approx((90 - NEUTRAL_PERCENTILE) / 2)
+    # A sparse player can still be looked up
+    assert index.query(2, k=1)[0].tolist() == [1]
+
+    with pytest.raises(ValueError):
+        CompsIndex(['A'], np.empty((1, 0)), [])
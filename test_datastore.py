@@ -0,0 +1,221 @@
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import datastore
+from datastore import ensure_cached, cached_columns, read_cached, read_header, write_result, read_result
+from processing import load_data, calculate_percentiles, clean_numeric_series, read_xlsx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _as_cached(frame, cached):
+    # Repeated text comes back from the cache as categoricals
+    return frame.astype({col: 'category' for col in cached.columns if cached[col].dtype == 'category'})
+
+
+def test_cache_roundtrip(tmp_path):
+    src = tmp_path / 'hitting.csv'
+    shutil.copy(os.path.join(HERE, 'hitting.csv'), src)
+    cache = str(tmp_path / 'cache')
+
+    digest = ensure_cached(str(src), cache)
+    original = load_data(str(src))
+    cached = read_cached(cache, digest)
+
+    assert cached_columns(cache, digest) == list(original.columns)
+    # Compact dtypes: narrowest integers, categorical text; decimals keep float64
+    assert cached['MxExitVel'].dtype == np.float64
+    assert cached['HR'].dtype == np.int8 and cached['playerId'].dtype == np.int32
+    assert cached['newestTeamLevel'].dtype == 'category' and cached['playerFullName'].dtype == object
+    pd.testing.assert_frame_equal(cached, _as_cached(original, cached), check_dtype=False)
+
+    mapping = {'Player Name': 'playerFullName', 'K%': 'K%', 'BB%': 'BB%', 'Max EV': 'MxExitVel'}
+    pd.testing.assert_frame_equal(
+        calculate_percentiles(read_cached(cache, digest, list(mapping.values())), mapping),
+        calculate_percentiles(original, mapping),
+    )
+
+
+def test_floats_narrowed_only_when_exact(tmp_path):
+    src = tmp_path / 'ids.csv'
+    src.write_text('Name,mlbId,Games,EV\nA,123456789,12,90.1\nB,,,95.2\n')
+    cache = str(tmp_path / 'cache')
+
+    cached = read_cached(cache, ensure_cached(str(src), cache))
+
+    # An ID past 2**24 is not exact in float32 (123456789 would read back as 123456792)
+    assert cached['mlbId'].dtype == np.float64 and cached['mlbId'][0] == 123456789
+    assert cached['Games'].dtype == np.float32 and cached['Games'][0] == 12
+    assert cached['EV'].tolist() == [90.1, 95.2]
+
+
+def test_cache_invalidated_when_file_changes(tmp_path):
+    src = tmp_path / 'data.csv'
+    src.write_text('Name,EV\nA,90\nB,95\n')
+    cache = str(tmp_path / 'cache')
+
+    first = ensure_cached(str(src), cache)
+    assert ensure_cached(str(src), cache, first) == first
+
+    src.write_text('Name,EV\nA,90\nB,95\nC,101\n')
+    os.utime(src, ns=(1, 1))
+    second = ensure_cached(str(src), cache, first)
+
+    assert second != first
+    assert read_cached(cache, second)['EV'].tolist() == [90, 95, 101]
+
+
+def test_concurrent_builds_parse_once(tmp_path, monkeypatch):
+    src = tmp_path / 'data.csv'
+    src.write_text('Name,EV\nA,90\nB,95\n')
+    cache = str(tmp_path / 'cache')
+    parses = []
+
+    def slow_load(path):
+        parses.append(path)
+        time.sleep(0.3)
+        return load_data(path)
+
+    # Like the ingest and percentile jobs asking for the same upload at once
+    monkeypatch.setattr(datastore, 'load_data', slow_load)
+    digests = []
+    threads = [threading.Thread(target=lambda: digests.append(ensure_cached(str(src), cache))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(parses) == 1 and digests[0] == digests[1]
+    assert read_cached(cache, digests[0])['EV'].tolist() == [90, 95]
+    assert not [f for f in os.listdir(cache) if f.endswith('.lock')]
+
+
+def test_lock_of_a_dead_builder_is_ignored(tmp_path):
+    src = tmp_path / 'data.csv'
+    src.write_text('Name,EV\nA,90\n')
+    cache = tmp_path / 'cache'
+    cache.mkdir()
+    dead = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                          capture_output=True, text=True, check=True).stdout.strip()
+    (cache / f'.{datastore.file_digest(str(src))}.lock').write_text(dead)
+
+    digest = ensure_cached(str(src), str(cache))
+    assert read_cached(str(cache), digest)['EV'].tolist() == [90]
+
+
+def test_parsed_entry_stores_cleaned_metrics(tmp_path, monkeypatch):
+    src = tmp_path / 'hitting.csv'
+    shutil.copy(os.path.join(HERE, 'hitting.csv'), src)
+    cache = str(tmp_path / 'cache')
+    digest = ensure_cached(str(src), cache)
+
+    metrics = read_cached(cache, digest, ['playerFullName', 'K%', 'HR'], numeric=['K%', 'HR'])
+    assert metrics['K%'].dtype == np.float32 and metrics['HR'].dtype == np.int8
+    assert metrics['K%'].tolist() == clean_numeric_series(load_data(str(src))['K%']).astype(np.float32).tolist()
+    # Raw readers still get the column as uploaded
+    assert read_cached(cache, digest, ['K%'])['K%'][0].endswith('%')
+
+    # Later reads (any process) map the stored array instead of parsing the text again
+    monkeypatch.setattr(datastore, 'clean_numeric_series', None)
+    again = read_cached(cache, digest, ['K%'], numeric=['K%'])
+    assert not again['K%'].to_numpy().flags.writeable
+    pd.testing.assert_series_equal(again['K%'], metrics['K%'])
+
+
+def test_streaming_mode_ingests_only_requested_columns(tmp_path):
+    src = tmp_path / 'hitting.csv'
+    shutil.copy(os.path.join(HERE, 'hitting.csv'), src)
+    cache = str(tmp_path / 'cache')
+
+    # Threshold 0 forces streaming mode: the upload step reads only the header
+    digest = ensure_cached(str(src), cache, stream_threshold=0)
+    assert cached_columns(cache, digest) == list(load_data(str(src)).columns)
+
+    mapping = {'Player Name': 'playerFullName', 'K%': 'K%', 'Contact%': 'Contact%', 'Max EV': 'MxExitVel'}
+    metric_cols = ['K%', 'Contact%', 'MxExitVel']
+    streamed = read_cached(cache, digest, list(mapping.values()), numeric=metric_cols)
+
+    assert list(streamed.columns) == ['playerFullName', 'K%', 'Contact%', 'MxExitVel']
+    assert streamed['K%'].dtype == 'float32'
+    # Only the four mapped columns were written to the cache
+    assert len({f.split('.')[0] for f in os.listdir(os.path.join(cache, digest)) if f.endswith('.npy')}) == 4
+    pd.testing.assert_frame_equal(
+        calculate_percentiles(streamed, mapping),
+        calculate_percentiles(load_data(str(src)), mapping),
+    )
+
+    # Second read comes from the stored arrays
+    pd.testing.assert_frame_equal(read_cached(cache, digest, list(mapping.values()), numeric=metric_cols), streamed)
+
+
+def test_concurrent_ingests_keep_each_others_columns(tmp_path):
+    src = tmp_path / 'hitting.csv'
+    shutil.copy(os.path.join(HERE, 'hitting.csv'), src)
+    cache = str(tmp_path / 'cache')
+    digest = ensure_cached(str(src), cache, stream_threshold=0)
+
+    # Two requests that read meta.json before either wrote its columns
+    first, second = datastore._read_meta(cache, digest), datastore._read_meta(cache, digest)
+    datastore._ingest_columns(cache, digest, first, ['playerFullName'], [])
+    datastore._ingest_columns(cache, digest, second, [], ['K%'])
+
+    meta = datastore._read_meta(cache, digest)
+    assert 'playerFullName' in meta['stored'] and 'K%' in meta['cleaned']
+    assert second['stored'] == meta['stored']
+    assert not [f for f in os.listdir(cache) if f.endswith('.lock')]
+
+
+def _is_mapped(values):
+    while values is not None:
+        if isinstance(values, np.memmap):
+            return True
+        values = values.base
+    return False
+
+
+def test_cached_numbers_are_memory_mapped(tmp_path):
+    src = tmp_path / 'hitting.csv'
+    shutil.copy(os.path.join(HERE, 'hitting.csv'), src)
+    cache = str(tmp_path / 'cache')
+    mapping = {'Player Name': 'playerFullName', 'K%': 'K%', 'Max EV': 'MxExitVel'}
+
+    digest = ensure_cached(str(src), cache, stream_threshold=0)
+    read_cached(cache, digest, list(mapping.values()), numeric=['K%', 'MxExitVel'])
+    df = read_cached(cache, digest, list(mapping.values()), numeric=['K%', 'MxExitVel'])
+    assert _is_mapped(df['K%'].to_numpy())
+    assert not _is_mapped(df['playerFullName'].to_numpy())
+
+    table = calculate_percentiles(df, mapping)
+    write_result(cache, digest, 'k', table)
+    stored = read_result(cache, digest, 'k')
+    pd.testing.assert_frame_equal(stored, table)
+    # Percentiles are one byte each on disk and shared between processes,
+    # so never written to in place
+    codes = stored['K%'].array._data
+    assert codes.dtype == np.int8 and _is_mapped(codes)
+    assert not codes.flags.writeable
+
+
+def test_xlsx_is_streamed_into_the_cache(tmp_path):
+    src = tmp_path / 'hitting.xlsx'
+    original = load_data(os.path.join(HERE, 'hitting.csv')).head(300)
+    original.loc[5, 'pos'] = None
+    original.to_excel(src, index=False)
+    cache = str(tmp_path / 'cache')
+
+    # Small chunks exercise the chunk boundaries; the result matches read_excel
+    expected = pd.read_excel(src)
+    pd.testing.assert_frame_equal(read_xlsx(str(src), chunk_rows=7), expected)
+
+    digest = ensure_cached(str(src), cache)
+    assert cached_columns(cache, digest) == list(expected.columns)
+    assert read_header(str(src)) == list(expected.columns)
+    cached = read_cached(cache, digest)
+    pd.testing.assert_frame_equal(cached, _as_cached(expected, cached), check_dtype=False)
@@ -0,0 +1,61 @@
+import importlib.util
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from exports import export_rows, ParquetUnavailable
+
+FRAME = pd.DataFrame({
+    'Player Name': ['Ann', 'Bo', np.nan, 'Cy', 'Di'],
+    'Peer Group': ['C', 'SS', 'C', 'SS', np.nan],
+    'K%': [12.5, np.nan, 88.0, 40.0, 1.5],
+})
+
+
+def test_csv_and_ndjson_stream_in_chunks():
+    positions = np.array([4, 0, 2, 3])
+
+    chunks = list(export_rows(FRAME, positions, 'csv', chunk_rows=2))
+    assert len(chunks) == 3  # header + two chunks
+    pd.testing.assert_frame_equal(pd.read_csv(io.StringIO(''.join(chunks))),
+                                  FRAME.iloc[positions].reset_index(drop=True))
+
+    chunks = list(export_rows(FRAME, positions, 'ndjson', chunk_rows=3))
+    assert len(chunks) == 2
+    lines = ''.join(chunks).splitlines()
+    assert lines[0] == '{"Player Name":"Di","Peer Group":null,"K%":1.5}'
+    read = pd.read_json(io.StringIO(''.join(chunks)), lines=True)
+    # null comes back as None in text columns
+    pd.testing.assert_frame_equal(read.where(read.notna(), np.nan), FRAME.iloc[positions].reset_index(drop=True))
+
+    assert list(export_rows(FRAME, positions[:0], 'ndjson')) == []
+
+
+def test_parquet_needs_pyarrow():
+    if importlib.util.find_spec('pyarrow') is None:
+        with pytest.raises(ParquetUnavailable):
+            export_rows(FRAME, np.arange(5), 'parquet')
+    else:
+        data = b''.join(export_rows(FRAME, np.arange(5), 'parquet', chunk_rows=2))
+        pd.testing.assert_frame_equal(pd.read_parquet(io.BytesIO(data)), FRAME)
+
+
+def test_compact_columns_export_like_plain_ones():
+    # Cached tables hold categorical text, float32 values and Int8 percentiles
+    frame = pd.DataFrame({
+        'Player Name': pd.Categorical(['Ann', None, 'Bo']),
+        'K%': pd.array([12, None, 100], dtype='Int8'),
+        'EV': np.array([85.3, np.nan, 0.312], dtype=np.float32),
+    })
+    positions = np.arange(3)
+
+    assert ''.join(export_rows(frame, positions, 'csv')) == 'Player Name,K%,EV\nAnn,12,85.3\n,,\nBo,100,0.312\n'
+    # float32 values read back as the numbers they were written as
+    assert [json.loads(line) for line in ''.join(export_rows(frame, positions, 'ndjson')).splitlines()] == [
+        {'Player Name': 'Ann', 'K%': 12, 'EV': 85.3},
+        {'Player Name': None, 'K%': None, 'EV': None},
+        {'Player Name': 'Bo', 'K%': 100, 'EV': 0.312},
+    ]
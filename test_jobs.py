@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from jobs import JobManager, QueueFull, DONE, FAILED, CANCELLED
+from metrics import stage
+
+
+def add(ctx, a, b):
+    ctx.progress('Adding')
+    return a + b
+
+
+def staged(ctx):
+    with stage('parse'):
+        time.sleep(0.01)
+    return 1
+
+
+def fail(ctx):
+    raise ValueError('bad file')
+
+
+def slow(ctx, steps):
+    for i in range(steps):
+        ctx.progress(f'Step {i}')
+        time.sleep(0.05)
+    return steps
+
+
+def wait_for(manager, job_id, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.status(job_id)
+        if job['status'] in (DONE, FAILED, CANCELLED):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = JobManager(str(tmp_path / 'jobs'), workers=1, max_pending=2)
+    yield manager
+    manager.shutdown()
+
+
+def test_jobs_run_in_pool_and_record_results(manager):
+    job = wait_for(manager, manager.submit('add', add, 2, 3))
+    assert job['status'] == DONE
+    assert job['result'] == 5
+
+    job = wait_for(manager, manager.submit('fail', fail))
+    assert job['status'] == FAILED
+    assert job['error'] == 'ValueError: bad file'
+
+
+def test_job_timings_are_taken_once(manager):
+    job_id = manager.submit('staged', staged)
+    job = wait_for(manager, job_id)
+    assert job['timings']['parse'] >= 0.01
+
+    # Counted by the first process to report the job, never again
+    other = JobManager(manager.state_dir, workers=0)
+    assert other.take_timings(job_id) == job['timings']
+    assert manager.take_timings(job_id) is None
+
+
+def test_cancel_and_queue_limit(manager):
+    running = manager.submit('slow', slow, 400)
+    queued = manager.submit('slow', slow, 400)
+    with pytest.raises(QueueFull):
+        manager.submit('slow', slow, 1)
+
+    # The queued job never starts; the running one stops at its next step
+    assert manager.cancel(queued)
+    assert manager.status(queued)['status'] == CANCELLED
+    assert manager.cancel(running)
+    assert wait_for(manager, running)['status'] == CANCELLED
+    assert not manager.cancel(running)
+
+    # Another process sharing the folder sees the same jobs
+    assert JobManager(manager.state_dir, workers=0).status(running)['status'] == CANCELLED
+    assert wait_for(manager, manager.submit('add', add, 1, 1))['result'] == 2
@@ -0,0 +1,39 @@
+import time
+
+from metrics import MetricsRegistry, server_timing, stage, start_recording, stop_recording, timed
+
+
+@timed('parse')
+def parse():
+    with stage('clean'):
+        time.sleep(0.002)
+    return 'rows'
+
+
+def test_stages_add_up_only_while_recording():
+    assert parse() == 'rows'  # not recording: nothing to collect
+
+    token = start_recording()
+    parse()
+    parse()
+    timings = stop_recording(token)
+    assert set(timings) == {'parse', 'clean'}
+    # Nested stages: the outer one includes the inner one
+    assert timings['parse'] >= timings['clean'] >= 0.004
+
+    assert server_timing({'parse': 0.0123, 'total': 0.5}) == 'parse;dur=12.3, total;dur=500.0'
+
+
+def test_histograms_render_prometheus_text():
+    registry = MetricsRegistry()
+    registry.observe_timings({'rank': 0.003}, route='results')
+    registry.observe_timings({'rank': 0.004, 'render': 2.0}, route='results')
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ['# HELP savant_stage_seconds Time spent in each pipeline stage.',
+                         '# TYPE savant_stage_seconds histogram']
+    assert 'savant_stage_seconds_bucket{route="results",stage="rank",le="0.0025"} 0' in lines
+    assert 'savant_stage_seconds_bucket{route="results",stage="rank",le="0.005"} 2' in lines
+    assert 'savant_stage_seconds_bucket{route="results",stage="render",le="+Inf"} 1' in lines
+    assert 'savant_stage_seconds_count{route="results",stage="rank"} 2' in lines
+    assert 'savant_stage_seconds_sum{route="results",stage="render"} 2.0' in lines
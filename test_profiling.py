@@ -0,0 +1,40 @@
+import os
+import pstats
+
+from jobs import JobManager
+from profiling import dump_name, prune_profiles, save_profile, start_profiler
+from test_jobs import add, wait_for
+
+
+def test_dumps_are_tagged_and_capped(tmp_path):
+    name = dump_name('advanced_analysis', '9a927fd9d08b1234', 3005)
+    assert '_advanced-analysis_9a927fd9d08b_3005rows_' in name
+    assert name.endswith('.prof')
+
+    folder = str(tmp_path)
+    for i in range(4):
+        profiler = start_profiler()
+        sum(range(1000))
+        path = save_profile(profiler, folder, 'results', 'abc', i, keep=3)
+        os.utime(path, ns=(i * 10**9, i * 10**9))
+    dumps = sorted(os.listdir(folder))
+    assert len(dumps) == 3 and not any('_0rows_' in dump for dump in dumps)
+    assert pstats.Stats(os.path.join(folder, dumps[-1])).total_calls > 0
+
+    # The size cap drops the oldest until the rest fits; the newest always stays
+    newest, second = (os.path.getsize(os.path.join(folder, dump)) for dump in dumps[::-1][:2])
+    assert prune_profiles(folder, keep=10, max_bytes=newest + second) == 1
+    assert prune_profiles(folder, keep=10, max_bytes=1) == 1
+    assert len(os.listdir(folder)) == 1
+
+
+def test_pool_jobs_can_be_profiled(tmp_path):
+    manager = JobManager(str(tmp_path / 'jobs'), workers=1)
+    try:
+        profile = {'folder': str(tmp_path / 'profiles'), 'route': 'job-add', 'digest': 'abc', 'rows': 2}
+        job = wait_for(manager, manager.submit('add', add, 2, 3, profile=profile))
+        assert job['result'] == 5
+    finally:
+        manager.shutdown()
+    [dump] = os.listdir(tmp_path / 'profiles')
+    assert '_job-add_abc_2rows_' in dump
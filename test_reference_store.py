@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pytest
+
+from processing import load_data, PercentileIndex
+from reference_store import ReferenceStore
+from sketches import KLLSketch, SketchIndex
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MAPPING = {'Player Name': 'playerFullName', 'K%': 'K%', 'BB%': 'BB%', 'Max EV': 'MxExitVel'}
+
+
+def test_incremental_add_matches_full_population(tmp_path):
+    df = load_data(os.path.join(HERE, 'hitting.csv'))
+    store = ReferenceStore(str(tmp_path / 'ref.sqlite'))
+
+    assert store.add('D1', df.iloc[:1000], MAPPING) == 1
+    assert store.add('D1', df.iloc[1000:], MAPPING) == 2
+
+    expected = PercentileIndex.from_frame(df, MAPPING)
+    # A fresh store reads the stored distributions back from disk
+    index = ReferenceStore(str(tmp_path / 'ref.sqlite')).index('D1')
+    assert set(index.distributions) == set(expected.distributions)
+    for metric, values in expected.distributions.items():
+        np.testing.assert_array_equal(index.distributions[metric], values)
+
+    [population] = store.populations()
+    assert population['name'] == 'D1'
+    assert population['rows'] == len(df)
+    assert population['metrics']['K%'] == expected.size('K%')
+
+
+def test_index_follows_updates_and_deletes(tmp_path):
+    store = ReferenceStore(str(tmp_path / 'ref.sqlite'))
+    store.add('Showcase', load_data(os.path.join(HERE, 'hitting.csv')).head(10), MAPPING)
+    assert store.index('Showcase').size('K%') == 10
+
+    store.add('Showcase', load_data(os.path.join(HERE, 'hitting.csv')).tail(5), MAPPING)
+    assert store.index('Showcase').size('K%') == 15
+
+    store.delete('Showcase')
+    assert store.populations() == []
+    with pytest.raises(KeyError):
+        store.index('Showcase')
+
+
+def test_approximate_population_keeps_sketches(tmp_path):
+    df = load_data(os.path.join(HERE, 'hitting.csv'))
+    store = ReferenceStore(str(tmp_path / 'ref.sqlite'))
+    store.add('D1 sketch', df.iloc[:1000], MAPPING, approximate=True)
+    # Later rows follow the population's layout whatever the flag says
+    store.add('D1 sketch', df.iloc[1000:], MAPPING)
+
+    index = ReferenceStore(str(tmp_path / 'ref.sqlite')).index('D1 sketch')
+    exact = PercentileIndex.from_frame(df, MAPPING)
+    assert isinstance(index, SketchIndex)
+    [population] = store.populations()
+    assert population['approximate'] and population['metrics']['K%'] == exact.size('K%')
+
+    values = np.linspace(70, 115, 50)
+    error = np.abs(index.percentiles('Max EV', values) - exact.percentiles('Max EV', values))
+    assert error.max() <= 100 * KLLSketch.rank_error() + 1
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from result_cache import ResultCache, sizeof
+from tables import ResultTable
+
+
+def test_lru_eviction_within_budget():
+    cache = ResultCache(max_bytes=3000)
+    for name in 'abc':
+        cache.put(name, np.zeros(100))  # 800 bytes each
+    assert cache.get('a') is not None  # 'b' is now least recently used
+
+    cache.put('d', np.zeros(100))
+    assert 'b' not in cache
+    assert [name in cache for name in 'acd'] == [True, True, True]
+    assert cache.bytes == 2400
+
+    # Too large to ever fit: returned, not kept, nothing evicted
+    assert len(cache.put('huge', np.zeros(1000))) == 1000
+    assert 'huge' not in cache and len(cache) == 3
+
+    # A rebuilt 'b' pushes out 'c', now the least recently used
+    assert cache.get_or_build('b', lambda: np.ones(100))[0] == 1
+    assert 'c' not in cache
+    assert cache.stats() == {
+        'entries': 3, 'bytes': 2400, 'max_bytes': 3000, 'hits': 1, 'misses': 1, 'evictions': 2,
+        'hit_rate': 0.5,
+    }
+
+
+def test_table_sizes_are_remeasured_on_use():
+    table = ResultTable(pd.DataFrame({'Player Name': ['B', 'a', 'C'] * 100, 'K%': np.arange(300.0)}))
+    cache = ResultCache(max_bytes=10**6)
+    cache.put('t', table)
+    before = cache.bytes
+    assert before == sizeof(table) > 300 * 8
+
+    # Sorting keeps a sort key and an order array in the table
+    table.page('K%', descending=True)
+    cache.get('t')
+    assert cache.bytes == sizeof(table) == before + 300 * 8 * 2
+    assert sizeof({'table': table, 'features': np.zeros((300, 4))}) == cache.bytes + 300 * 4 * 8
+
+
+def test_derived_tables_count_what_they_keep_alive():
+    base = ResultTable(pd.DataFrame({'Player Name': ['B', 'a', 'C'] * 100, 'K%': np.arange(300.0)}))
+    base.page('K%')
+    scored = base.with_column('Score', np.ones(300), position=1)
+
+    # The shared frame columns and K% sort order stay alive with the scored
+    # table even once the base table is evicted
+    assert sizeof(scored) == sizeof(base) + 300 * 8
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+
+from processing import load_data, clean_numeric_series, PercentileIndex, percentiles_against
+from sketches import KLLSketch, SketchIndex
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MAPPING = {'Player Name': 'playerFullName', 'K%': 'K%', 'BB%': 'BB%', 'Max EV': 'MxExitVel'}
+
+
+def _exact_counts(population, values):
+    ordered = np.sort(population)
+    return np.searchsorted(ordered, values, 'left'), np.searchsorted(ordered, values, 'right')
+
+
+def test_sketch_is_exact_while_small():
+    values = np.array([3.0, 1.0, 2.0, 2.0, np.nan])
+    sketch = KLLSketch(k=200).update(values)
+    assert len(sketch) == 4
+    below, at_or_below = sketch.counts([2.0, 5.0])
+    assert below.tolist() == [1, 4]
+    assert at_or_below.tolist() == [3, 4]
+
+
+def test_merged_sketches_stay_within_error_bound():
+    rng = np.random.default_rng(0)
+    parts = [rng.normal(loc, 1, 200_000).round(2) for loc in (0.0, 0.5, 1.0)]
+    merged = KLLSketch(seed=0)
+    for i, part in enumerate(parts):
+        merged.merge(KLLSketch(seed=i + 1).update(part))
+
+    population = np.concatenate(parts)
+    probes = np.quantile(population, np.linspace(0, 1, 201))
+    below, at_or_below = merged.counts(probes)
+    exact_below, exact_at_or_below = _exact_counts(population, probes)
+
+    assert len(merged) == population.size
+    assert sum(len(level) for level in merged.levels) < 2_000
+    bound = KLLSketch.rank_error() * population.size
+    assert np.abs(below - exact_below).max() <= bound
+    assert np.abs(at_or_below - exact_at_or_below).max() <= bound
+
+
+def test_sketch_index_matches_exact_index(tmp_path):
+    df = load_data(os.path.join(HERE, 'hitting.csv'))
+    exact = percentiles_against(PercentileIndex.from_frame(df, MAPPING), df, MAPPING)
+
+    streamed = SketchIndex.from_csv(os.path.join(HERE, 'hitting.csv'), MAPPING, chunksize=1_000)
+    streamed.save(tmp_path / 'sketch.json')
+    approx = percentiles_against(SketchIndex.load(tmp_path / 'sketch.json'), df, MAPPING)
+
+    assert streamed.size('K%') == PercentileIndex.from_frame(df, MAPPING).size('K%')
+    for metric in ('K%', 'BB%', 'Max EV'):
+        diff = (exact[metric] - approx[metric]).abs()
+        # Rank error bound in percentile points, plus one point of rounding
+        assert diff.max() <= 100 * KLLSketch.rank_error() + 1
+    assert approx['xBA'].isna().all()
+
+
+def test_small_sketch_ranks_ties_like_exact_index(tmp_path):
+    from reference_store import ReferenceStore
+    df = load_data(os.path.join(HERE, 'hitting.csv')).head(150).copy()
+    # Many players tied on values that are not float64-exact in float32
+    df['K%'] = np.resize(['11.3%', '18.2%', '9.7%', '11.3%', '22.1%'], len(df))
+    queries = {'K%': '11.3%', 'BB%': df['BB%'].iloc[0], 'Max EV': df['MxExitVel'].iloc[0]}
+
+    exact = PercentileIndex.from_frame(df, MAPPING)
+    store = ReferenceStore(str(tmp_path / 'ref.sqlite'))
+    store.add('Showcase', df, MAPPING, approximate=True)
+    # Still exact at this size, so every percentile must match, ties included
+    for index in (SketchIndex.from_frame(df, MAPPING), store.index('Showcase')):
+        assert index.lookup(queries) == exact.lookup(queries)
+        for metric, col in (('K%', 'K%'), ('BB%', 'BB%'), ('Max EV', 'MxExitVel')):
+            values = clean_numeric_series(df[col]).to_numpy()
+            np.testing.assert_array_equal(index.percentiles(metric, values), exact.percentiles(metric, values))
@@ -0,0 +1,74 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from upload_store import store_upload, sweep_uploads, touch_upload
+
+
+def test_uploads_are_stored_once_by_content(tmp_path):
+    data = b'Player,K%\nAnn,20.1%\n'
+    digest, path = store_upload(io.BytesIO(data), str(tmp_path), 'stats.CSV', chunk_size=4)
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert os.path.basename(path) == f'{digest}.csv'
+
+    # Same contents under another name: one stored file
+    mtime = os.stat(path).st_mtime_ns
+    assert store_upload(io.BytesIO(data), str(tmp_path), 'roster.csv') == (digest, path)
+    # Different contents under the same name: no overwrite
+    other, other_path = store_upload(io.BytesIO(data + b'Bo,18%\n'), str(tmp_path), 'stats.csv')
+    assert other != digest and os.path.exists(path)
+    assert sorted(os.listdir(tmp_path)) == sorted([os.path.basename(path), os.path.basename(other_path)])
+    # Uses move the access time only; the cache compares size and mtime
+    assert os.stat(path).st_mtime_ns == mtime
+
+    with pytest.raises(ValueError):
+        store_upload(io.BytesIO(data), str(tmp_path), 'notes.txt')
+    assert not touch_upload(str(tmp_path / 'missing.csv'))
+
+
+def test_sweep_applies_ttl_then_quota(tmp_path):
+    folder, cache = tmp_path, tmp_path / '.cache'
+    now = 1_000_000.0
+    paths = {}
+    for name, age in [('old', 10_000), ('mid', 5_000), ('new', 1_000), ('active', 60)]:
+        digest, path = store_upload(io.BytesIO(name.encode() * 1000), str(folder), f'{name}.csv')
+        entry = cache / digest
+        entry.mkdir(parents=True)
+        (entry / 'c0.npy').write_bytes(b'x' * 1000)
+        for p in (path, entry):
+            os.utime(p, (now - age, now - age))
+        paths[name] = (path, entry)
+    sizes = {name: os.path.getsize(path) + 1000 for name, (path, _) in paths.items()}
+
+    # 'old' is past the TTL; the rest fit the quota
+    result = sweep_uploads(str(folder), str(cache), ttl_seconds=8_000, max_bytes=10**9, now=now)
+    assert result['removed'] == 1 and result['freed'] == sizes['old']
+    assert not os.path.exists(paths['old'][0]) and not os.path.exists(paths['old'][1])
+
+    # Over quota: least recently used first, never anything in active use
+    result = sweep_uploads(str(folder), str(cache), ttl_seconds=8_000, max_bytes=1, min_age=600, now=now)
+    assert result['removed'] == 2
+    assert os.path.exists(paths['active'][0]) and os.path.exists(paths['active'][1])
+    assert result['bytes'] == sizes['active']
+
+
+def test_sweep_removes_abandoned_builds(tmp_path):
+    folder, cache = tmp_path, tmp_path / '.cache'
+    now = 1_000_000.0
+    digest, _ = store_upload(io.BytesIO(b'Player\nAnn\n'), str(folder), 'stats.csv')
+    builds = {'entry': cache / '.build-a', 'result': cache / digest / 'results' / '.build-b',
+              'running': cache / '.build-c'}
+    for name, path in builds.items():
+        path.mkdir(parents=True)
+        (path / 'c0.npy').write_bytes(b'x' * 100)
+        age = 60 if name == 'running' else 10_000
+        os.utime(path, (now - age, now - age))
+    os.utime(cache / digest, (now, now))
+
+    result = sweep_uploads(str(folder), str(cache), ttl_seconds=10**9, max_bytes=10**9, now=now)
+    assert result['removed'] == 0 and result['freed'] == 200
+    assert not builds['entry'].exists() and not builds['result'].exists()
+    # Still being written to by a live build
+    assert builds['running'].exists()
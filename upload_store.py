@@ -0,0 +1,176 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+
+# Stored uploads are named <sha256 of the contents><extension>
+_STORED_NAME = re.compile(r'^([0-9a-f]{64})(\.[a-z0-9]+)?$')
+
+UPLOAD_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+# A use refreshes an upload's last-use time at most this often
+TOUCH_INTERVAL = 60
+
+
+def upload_extension(filename):
+    """
+    Lower-cased extension of an uploaded file name ('.csv', ...); the
+    loaders pick the parser by it. Raises ValueError for other types.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in UPLOAD_EXTENSIONS:
+        raise ValueError(f'Unsupported file type: {ext or filename}')
+    return ext
+
+
+def store_upload(stream, folder, filename, chunk_size=1 << 20):
+    """
+    Saves an uploaded file under the SHA-256 of its contents, hashing it
+    while it is written (one pass, chunk_size bytes at a time).
+
+    Identical contents are stored once: a second upload of the same file
+    discards its copy and reuses the first, so it also reuses everything
+    cached for that digest (parsed columns, percentile tables).
+
+    Returns:
+        (digest, path): Content digest and the stored file's path.
+    """
+    ext = upload_extension(filename)
+    os.makedirs(folder, exist_ok=True)
+    h = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(prefix='.upload-', dir=folder)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: stream.read(chunk_size), b''):
+                h.update(chunk)
+                f.write(chunk)
+        digest = h.hexdigest()
+        path = os.path.join(folder, digest + ext)
+        if os.path.exists(path):
+            touch_upload(path, force=True)
+        else:
+            os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return digest, path
+
+
+def touch_upload(path, force=False, now=None):
+    """
+    Records a use of a stored upload (for the TTL) in its access time. The
+    modification time is kept, so the columnar cache still sees the file as
+    unchanged. Returns False if the upload no longer exists.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    now = time.time() if now is None else now
+    if force or now - st.st_atime > TOUCH_INTERVAL:
+        os.utime(path, ns=(int(now * 1e9), st.st_mtime_ns))
+    return True
+
+
+def _tree_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _entries(folder, cache_root):
+    """
+    Groups stored uploads and their cache directories by digest:
+    {key: {'paths': [...], 'bytes': n, 'used': last use}}.
+    """
+    entries = {}
+
+    def add(key, path, size, used):
+        entry = entries.setdefault(key, {'paths': [], 'bytes': 0, 'used': 0.0})
+        entry['paths'].append(path)
+        entry['bytes'] += size
+        entry['used'] = max(entry['used'], used)
+
+    for item in os.scandir(folder):
+        if item.name.startswith('.') or not item.is_file():
+            continue
+        st = item.stat()
+        match = _STORED_NAME.match(item.name)
+        # Files saved under their own names by older versions age out too
+        add(match.group(1) if match else item.name, item.path, st.st_size, max(st.st_atime, st.st_mtime))
+
+    if os.path.isdir(cache_root):
+        for item in os.scandir(cache_root):
+            if item.name.startswith('.') or not item.is_dir():
+                continue
+            add(item.name, item.path, _tree_size(item.path), item.stat().st_mtime)
+    return entries
+
+
+def _stale_builds(cache_root, before):
+    """
+    Temporary .build-* directories (cache entries and stored results) last
+    written before the given time: left behind by a process that died
+    mid-build, since a finished build renames its directory.
+    """
+    if not os.path.isdir(cache_root):
+        return []
+    parents = [cache_root]
+    for item in os.scandir(cache_root):
+        if not item.name.startswith('.') and item.is_dir():
+            parents.append(os.path.join(item.path, 'results'))
+    stale = []
+    for parent in parents:
+        if not os.path.isdir(parent):
+            continue
+        for item in os.scandir(parent):
+            if item.name.startswith('.build-') and item.is_dir() and item.stat().st_mtime < before:
+                stale.append(item.path)
+    return stale
+
+
+def sweep_uploads(folder, cache_root, ttl_seconds, max_bytes, min_age=600, now=None):
+    """
+    Deletes stored uploads together with their cached columns and results:
+    first those not used for ttl_seconds, then the least recently used
+    until uploads and cache together fit in max_bytes. Anything used in the
+    last min_age seconds is kept, so a scout's session is not swept away
+    mid-analysis. Half-built cache directories older than min_age are
+    deleted as well.
+
+    Returns:
+        dict: removed (uploads/entries deleted), freed and remaining bytes.
+    """
+    now = time.time() if now is None else now
+    freed = 0
+    for path in _stale_builds(cache_root, now - min_age):
+        freed += _tree_size(path)
+        shutil.rmtree(path, ignore_errors=True)
+
+    entries = sorted(_entries(folder, cache_root).values(), key=lambda entry: entry['used'])
+    total = sum(entry['bytes'] for entry in entries)
+
+    removed = 0
+    for entry in entries:
+        age = now - entry['used']
+        if age <= min_age or (age <= ttl_seconds and total <= max_bytes):
+            continue
+        for path in entry['paths']:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        removed += 1
+        freed += entry['bytes']
+        total -= entry['bytes']
+    return {'removed': removed, 'freed': freed, 'bytes': total}